@@ -4,6 +4,7 @@ from .tactics import Tactic
 from .threats import Threat
 from .mates import CheckmateType
 from .structures import PawnStructure
+from .pawns import locked_pawns
 
 import chess
 
@@ -114,6 +115,12 @@ class AugBoard:
     ) -> chess.SquareSet:
         return self._board.pieces(piece_type, color)
 
+    def pawns_mask(self) -> chess.Bitboard:
+        return self._board.pawns
+
+    def locked_pawns(self) -> chess.Bitboard:
+        return locked_pawns(self._board)
+
     def attacks(self, square: int) -> chess.SquareSet:
         return self._board.attacks(square)
 
@@ -206,6 +213,54 @@ class AugBoard:
     def gives_check(self, move: chess.Move) -> bool:
         return self._board.gives_check(move)
 
+    def check_squares(self) -> Optional[List[chess.Bitboard]]:
+        """
+        Squares from which a piece of the side to move would attack the other king, indexed by piece type.
+        Returns None if there is no other king or it is already attacked, i.e. when the masks cannot be trusted.
+        """
+        king = self.other_color_king()
+        if king is None or self.is_attacked_by(self.current_color, king):
+            return None
+
+        occupied = self._board.occupied
+        diagonals = chess.BB_DIAG_ATTACKS[king][chess.BB_DIAG_MASKS[king] & occupied]
+        lines = (
+            chess.BB_RANK_ATTACKS[king][chess.BB_RANK_MASKS[king] & occupied]
+            | chess.BB_FILE_ATTACKS[king][chess.BB_FILE_MASKS[king] & occupied]
+        )
+        return [
+            chess.BB_EMPTY,
+            chess.BB_PAWN_ATTACKS[self.other_color][king],
+            chess.BB_KNIGHT_ATTACKS[king],
+            diagonals,
+            lines,
+            diagonals | lines,
+            chess.BB_EMPTY,
+        ]
+
+    def discovered_check_blockers(self) -> chess.Bitboard:
+        """
+        Pieces of the side to move that are the only piece between one of its sliders and the other king.
+        Moving such a piece off the line gives a discovered check.
+        """
+        king = self.other_color_king()
+        if king is None:
+            return chess.BB_EMPTY
+
+        board = self._board
+        ours = board.occupied_co[self.current_color]
+        snipers = ours & (
+            (chess.BB_RANK_ATTACKS[king][0] | chess.BB_FILE_ATTACKS[king][0])
+            & (board.rooks | board.queens)
+            | chess.BB_DIAG_ATTACKS[king][0] & (board.bishops | board.queens)
+        )
+        blockers = chess.BB_EMPTY
+        for sniper in chess.scan_reversed(snipers):
+            between = chess.between(king, sniper) & board.occupied
+            if between and chess.BB_SQUARES[chess.msb(between)] == between:
+                blockers |= between
+        return blockers & ours
+
     def move_capturers(self, move: chess.Move) -> chess.SquareSet:
         self._board.push(move)
         try:
@@ -293,36 +348,23 @@ class AugBoard:
     def occupied_co(self, color: chess.Color) -> chess.Bitboard:
         return self._board.occupied_co[color]
 
-    def _pv_contains(self, pv: List[chess.Move], detectors: Dict, none_value) -> List:
-        detected = set()
-        aug = AugBoard(self.fen())
-        for i in range(0, len(pv), 2):
-            our_move = pv[i]
-            detected.update(
-                value
-                for value, detector in detectors.items()
-                if detector(aug.fen(), our_move)
-            )
-            aug.push(our_move)
-            if i + 1 < len(pv):
-                their_move = pv[i + 1]
-                aug.push(their_move)
-        return sorted(detected) if detected else [none_value]
+    def walk_pv(self, pv: List[chess.Move]) -> "PVWalk":
+        return PVWalk(self.fen(), pv)
 
     def pv_tactics(self, pv: List[chess.Move]) -> List[Tactic]:
-        return self._pv_contains(pv, Tactic.detectors(), Tactic.NONE)
+        return self.walk_pv(pv).tactics()
 
     def move_tactics(self, move: chess.Move) -> List[Tactic]:
         return self.pv_tactics(pv=[move])
 
     def pv_threats(self, pv: List[chess.Move]) -> List[Threat]:
-        return self._pv_contains(pv, Threat.detectors(), Threat.NONE)
+        return self.walk_pv(pv).threats()
 
     def move_threats(self, move: chess.Move) -> List[Threat]:
         return self.pv_threats(pv=[move])
 
     def pv_checkmate_types(self, pv: List[chess.Move]) -> List[CheckmateType]:
-        return self._pv_contains(pv, CheckmateType.detectors(), CheckmateType.NONE)
+        return self.walk_pv(pv).checkmate_types()
 
     def move_checkmate_types(self, move: chess.Move) -> List[CheckmateType]:
         return self.pv_checkmate_types(pv=[move])
@@ -341,7 +383,73 @@ class AugBoard:
         The assumption is that when more than one structure is recognized, then the one with
         the highest integer value amongst them is the most specialized one.
         """
-        return max(self._pawn_structures())
+        return PawnStructure.classify(
+            self._board.pawns & self._board.occupied_co[chess.WHITE],
+            self._board.pawns & self._board.occupied_co[chess.BLACK],
+        )
+
+
+class PVWalk:
+    """
+    Replays a PV once and records everything the PV features need per ply: the fen before each move and the
+    number of captures, checks, pieces moved and moved piece types per color.
+    """
+
+    def __init__(self, fen: str, pv: List[chess.Move]):
+        board = chess.Board(fen)
+        self.pv = pv
+        self.fens = []
+        self.number_of_captures = {chess.WHITE: 0, chess.BLACK: 0}
+        self.number_of_checks = {chess.WHITE: 0, chess.BLACK: 0}
+        self.number_of_pieces_moved = {chess.WHITE: 0, chess.BLACK: 0}
+        self.moved_piece_types = {chess.WHITE: set(), chess.BLACK: set()}
+
+        # squares of pieces that already moved, tracked per color as the pieces moved count of a color only
+        # forgets the squares its own pieces leave
+        moved_squares = {chess.WHITE: set(), chess.BLACK: set()}
+        for move in pv:
+            self.fens.append(board.fen())
+            color = board.turn
+            self.number_of_captures[color] += board.is_capture(move)
+            if move.from_square in moved_squares[color]:
+                moved_squares[color].remove(move.from_square)
+            else:
+                self.number_of_pieces_moved[color] += 1
+
+            board.push(move)
+
+            # checks are attributed to the side in check, i.e. the side to move after the move
+            self.number_of_checks[board.turn] += board.is_check()
+            self.moved_piece_types[color].add(board.piece_type_at(move.to_square))
+            for squares in moved_squares.values():
+                squares.add(move.to_square)
+
+    @property
+    def plies(self) -> List[Tuple[str, chess.Move]]:
+        return list(zip(self.fens, self.pv))
+
+    def contains(self, detectors: Dict, none_value, plies=None) -> List:
+        """
+        Runs the detectors on our moves of the PV, or on the given plies.
+        """
+        if plies is None:
+            plies = self.plies[::2]
+        detected = set(
+            value
+            for fen, move in plies
+            for value, detector in detectors.items()
+            if detector(fen, move)
+        )
+        return sorted(detected) if detected else [none_value]
+
+    def tactics(self) -> List[Tactic]:
+        return self.contains(Tactic.detectors(), Tactic.NONE)
+
+    def threats(self) -> List[Threat]:
+        return self.contains(Threat.detectors(), Threat.NONE)
+
+    def checkmate_types(self) -> List[CheckmateType]:
+        return self.contains(CheckmateType.detectors(), CheckmateType.NONE)
 
 
 if __name__ == "__main__":
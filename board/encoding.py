@@ -0,0 +1,90 @@
+"""
+Fixed size binary encoding of positions.
+
+A position is stored as a record of POSITION_DTYPE: the 12 piece bitboards indexed by [int(color)][piece type - 1]
+plus the side to move, castling rights, en passant square and move counters. Records are 110 bytes, can be
+stored in a NumPy array column-wise for vectorized bitboard features and are cheap to send to worker processes.
+"""
+
+from typing import Iterable
+
+import chess
+import numpy as np
+
+
+POSITION_DTYPE = np.dtype(
+    [
+        ("pieces", np.uint64, (2, 6)),
+        ("castling_rights", np.uint64),
+        ("turn", np.bool_),
+        ("ep_square", np.int8),
+        ("halfmove_clock", np.uint16),
+        ("fullmove_number", np.uint16),
+    ]
+)
+
+
+def _fields(board: chess.Board) -> tuple:
+    return (
+        [
+            [board.pieces_mask(piece_type, color) for piece_type in chess.PIECE_TYPES]
+            for color in chess.COLORS[::-1]
+        ],
+        board.castling_rights,
+        board.turn,
+        -1 if board.ep_square is None else board.ep_square,
+        board.halfmove_clock,
+        board.fullmove_number,
+    )
+
+
+def encode(board: chess.Board) -> bytes:
+    return np.array(_fields(board), dtype=POSITION_DTYPE).tobytes()
+
+
+def encode_fen(fen: str) -> bytes:
+    return encode(chess.Board(fen))
+
+
+def encode_many(boards: Iterable[chess.Board]) -> np.ndarray:
+    return np.array([_fields(board) for board in boards], dtype=POSITION_DTYPE)
+
+
+def from_bytes(column: Iterable[bytes]) -> np.ndarray:
+    """
+    Turns a column of encoded positions, e.g. the position column of utils.pgn_to_df, into a structured array.
+    """
+    return np.frombuffer(b"".join(column), dtype=POSITION_DTYPE)
+
+
+def to_board(record: np.void) -> chess.Board:
+    board = chess.Board(None)
+    pieces = record["pieces"]
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            mask = int(pieces[int(color)][piece_type - 1])
+            board.occupied_co[color] |= mask
+            if piece_type == chess.PAWN:
+                board.pawns |= mask
+            elif piece_type == chess.KNIGHT:
+                board.knights |= mask
+            elif piece_type == chess.BISHOP:
+                board.bishops |= mask
+            elif piece_type == chess.ROOK:
+                board.rooks |= mask
+            elif piece_type == chess.QUEEN:
+                board.queens |= mask
+            else:
+                board.kings |= mask
+    board.occupied = board.occupied_co[chess.WHITE] | board.occupied_co[chess.BLACK]
+    board.castling_rights = int(record["castling_rights"])
+    board.turn = bool(record["turn"])
+    ep_square = int(record["ep_square"])
+    board.ep_square = None if ep_square < 0 else ep_square
+    board.halfmove_clock = int(record["halfmove_clock"])
+    board.fullmove_number = int(record["fullmove_number"])
+    return board
+
+
+def decode(data: bytes) -> chess.Board:
+    return to_board(np.frombuffer(data, dtype=POSITION_DTYPE)[0])
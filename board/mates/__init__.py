@@ -4,6 +4,8 @@ from collections import Counter
 
 import chess
 
+from ..profiling import instrument
+
 from .smothered import is_smothered_mate
 from .backrank import is_back_rank_mate
 from .arabian import is_arabian_mate_extended as is_arabian_mate
@@ -28,26 +30,28 @@ class CheckmateType(IntEnum):
 
     @classmethod
     def detectors(cls) -> Dict["CheckmateType", Callable[[str, chess.Move], bool]]:
-        return {
-            cls.BACK_RANK: is_back_rank_mate,
-            cls.SMOTHERED: is_smothered_mate,
-            cls.ARABIAN: is_arabian_mate,
-            cls.QUEEN_ROOK: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.QUEEN, chess.ROOK))
-            ),
-            cls.ROOK_ROOK: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.ROOK, chess.ROOK))
-            ),
-            cls.KING_QUEEN: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.KING, chess.QUEEN))
-            ),
-            cls.KING_ROOK: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.KING, chess.ROOK))
-            ),
-            cls.KING_BISHOP_BISHOP: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.KING, chess.BISHOP, chess.BISHOP))
-            ),
-            cls.KING_BISHOP_KNIGHT: lambda fen, move: is_mate_with_pieces(
-                fen, move, Counter((chess.KING, chess.BISHOP, chess.KNIGHT))
-            ),
-        }
+        return instrument(
+            {
+                cls.BACK_RANK: is_back_rank_mate,
+                cls.SMOTHERED: is_smothered_mate,
+                cls.ARABIAN: is_arabian_mate,
+                cls.QUEEN_ROOK: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.QUEEN, chess.ROOK))
+                ),
+                cls.ROOK_ROOK: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.ROOK, chess.ROOK))
+                ),
+                cls.KING_QUEEN: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.KING, chess.QUEEN))
+                ),
+                cls.KING_ROOK: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.KING, chess.ROOK))
+                ),
+                cls.KING_BISHOP_BISHOP: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.KING, chess.BISHOP, chess.BISHOP))
+                ),
+                cls.KING_BISHOP_KNIGHT: lambda fen, move: is_mate_with_pieces(
+                    fen, move, Counter((chess.KING, chess.BISHOP, chess.KNIGHT))
+                ),
+            }
+        )
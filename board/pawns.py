@@ -0,0 +1,91 @@
+"""
+Pawn bitboard helpers.
+
+The functions only use shifts and masks so they work both on python-chess bitboards (ints) and on NumPy
+uint64 arrays of bitboards.
+"""
+
+import chess
+
+BB_NOT_FILE_A = chess.BB_ALL & ~chess.BB_FILE_A
+BB_NOT_FILE_H = chess.BB_ALL & ~chess.BB_FILE_H
+BB_CENTER_FILES = chess.BB_FILE_C | chess.BB_FILE_D | chess.BB_FILE_E | chess.BB_FILE_F
+
+
+def blocked_pawns_mask(white_pawns, black_pawns):
+    """
+    Pawns that cannot move forward because an opponent's pawn is on the square in front of them.
+    """
+    return (white_pawns & (black_pawns >> 8)) | (
+        black_pawns & ((white_pawns << 8) & chess.BB_ALL)
+    )
+
+
+def capturing_pawns_mask(white_pawns, black_pawns, white_targets, black_targets):
+    """
+    Pawns that have a diagonal capture target. White pawns capture on black targets and vice versa.
+    """
+    white_capturers = ((black_targets & BB_NOT_FILE_A) >> 9) | (
+        (black_targets & BB_NOT_FILE_H) >> 7
+    )
+    black_capturers = (((white_targets & BB_NOT_FILE_H) << 9) & chess.BB_ALL) | (
+        ((white_targets & BB_NOT_FILE_A) << 7) & chess.BB_ALL
+    )
+    return (white_pawns & white_capturers) | (black_pawns & black_capturers)
+
+
+def locked_pawns_mask(white_pawns, black_pawns, white_targets, black_targets):
+    """
+    A pawn is locked iff. it cannot move forward because opponent's pawn occupy the square in front and has no
+    diagonal capture target, regardless of whose turn is it.
+    """
+    return blocked_pawns_mask(white_pawns, black_pawns) & ~capturing_pawns_mask(
+        white_pawns, black_pawns, white_targets, black_targets
+    )
+
+
+def capture_targets(board: chess.Board, color: chess.Color) -> chess.Bitboard:
+    """
+    Squares the opponent's pawns may capture on: pieces of the given color plus the en passant square if the
+    opponent is to move.
+    """
+    targets = board.occupied_co[color]
+    if board.ep_square is not None and board.turn != color:
+        targets |= chess.BB_SQUARES[board.ep_square]
+    return targets
+
+
+def locked_pawns(board: chess.Board) -> chess.Bitboard:
+    return locked_pawns_mask(
+        board.pawns & board.occupied_co[chess.WHITE],
+        board.pawns & board.occupied_co[chess.BLACK],
+        capture_targets(board, chess.WHITE),
+        capture_targets(board, chess.BLACK),
+    )
+
+
+class LockedPawnsTracker:
+    """
+    Tracks locked pawns along a game. The blocked pawns only change on pawn moves and captures so they are
+    recomputed only then, other moves just recheck the capture targets of the blocked pawns.
+    """
+
+    def __init__(self):
+        self._pawns = None
+        self._blocked = chess.BB_EMPTY
+
+    def locked_pawns(self, board: chess.Board) -> chess.Bitboard:
+        white_pawns = board.pawns & board.occupied_co[chess.WHITE]
+        black_pawns = board.pawns & board.occupied_co[chess.BLACK]
+        if self._pawns != (white_pawns, black_pawns):
+            self._pawns = white_pawns, black_pawns
+            self._blocked = blocked_pawns_mask(white_pawns, black_pawns)
+
+        if not self._blocked:
+            return chess.BB_EMPTY
+        return self._blocked & ~capturing_pawns_mask(
+            self._blocked & white_pawns,
+            self._blocked & black_pawns,
+            capture_targets(board, chess.WHITE),
+            capture_targets(board, chess.BLACK),
+        )
@@ -0,0 +1,118 @@
+"""
+Opt-in profiling of the tactic, threat, checkmate and pawn structure detectors.
+
+The detectors() of the enums are passed through instrument and functions that detect without going through
+detectors(), e.g. PawnStructure.classify, are decorated with profiled. While the profiler is disabled, which is
+the default, the detectors are returned as they are. Once enabled every detector call records its latency and
+whether the detector fired, see DetectorProfiler.report.
+"""
+
+import time
+from array import array
+from functools import wraps
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+
+class DetectorStats:
+    def __init__(self):
+        self.hits = 0
+        self.latencies = array("d")
+
+    @property
+    def calls(self) -> int:
+        return len(self.latencies)
+
+
+class DetectorProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.stats = {}
+
+    def _wrap(self, name: str, detector: Callable) -> Callable:
+        stats = self.stats.setdefault(name, DetectorStats())
+
+        @wraps(detector)
+        def profiled_detector(*args, **kwargs):
+            start = time.perf_counter()
+            res = detector(*args, **kwargs)
+            stats.latencies.append(time.perf_counter() - start)
+            stats.hits += bool(res)
+            return res
+
+        return profiled_detector
+
+    def instrument(self, detectors: Dict) -> Dict:
+        if not self.enabled:
+            return detectors
+        return {
+            value: self._wrap(f"{type(value).__name__}.{value.name}", detector)
+            for value, detector in detectors.items()
+        }
+
+    def report(self) -> pd.DataFrame:
+        """
+        Call counts, hit rates and latencies (in microseconds) per detector, the most expensive detectors first.
+        """
+        rows = []
+        for name, stats in self.stats.items():
+            if not stats.calls:
+                continue
+            latencies = np.frombuffer(stats.latencies, dtype=np.float64) * 1e6
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            rows.append(
+                {
+                    "detector": name,
+                    "calls": stats.calls,
+                    "hits": stats.hits,
+                    "hit_rate": stats.hits / stats.calls,
+                    "total_s": latencies.sum() / 1e6,
+                    "mean_us": latencies.mean(),
+                    "p50_us": p50,
+                    "p90_us": p90,
+                    "p99_us": p99,
+                    "max_us": latencies.max(),
+                }
+            )
+        if not rows:
+            return pd.DataFrame()
+        return (
+            pd.DataFrame(rows)
+            .set_index("detector")
+            .sort_values("total_s", ascending=False)
+        )
+
+
+profiler = DetectorProfiler()
+
+
+def instrument(detectors: Dict) -> Dict:
+    return profiler.instrument(detectors)
+
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorates a detector function to be profiled as name whenever the profiler is enabled.
+    """
+
+    def decorate(detector: Callable) -> Callable:
+        @wraps(detector)
+        def profiled_detector(*args, **kwargs):
+            if not profiler.enabled:
+                return detector(*args, **kwargs)
+            return profiler._wrap(name, detector)(*args, **kwargs)
+
+        return profiled_detector
+
+    return decorate
@@ -1,26 +1,57 @@
 from enum import IntEnum
-from typing import Dict, Callable
+from functools import lru_cache
+from typing import Dict, Callable, Tuple
 
 import chess
+import numpy as np
 
-import board
+from ..profiling import instrument, profiled
+
+Masks = Tuple[chess.Bitboard, chess.Bitboard, chess.Bitboard, chess.Bitboard]
+
+
+def pawn_structure_masks(
+    files: Dict[str, list],
+) -> Tuple[chess.Bitboard, chess.Bitboard]:
+    """
+    Compiles a {file name: ranks} description of one color's pawns into a (required, forbidden) pair of masks:
+    the pawns of that color must occupy every required square and none of the forbidden ones.
+    """
+    required = chess.BB_EMPTY
+    forbidden = chess.BB_EMPTY
+    for file_name, ranks in files.items():
+        file_idx = ord(file_name) - ord("a")
+        expected = chess.BB_EMPTY
+        for rank in ranks:
+            expected |= chess.BB_SQUARES[8 * (rank - 1) + file_idx]
+        required |= expected
+        forbidden |= chess.BB_FILES[file_idx] & ~expected
+    return required, forbidden
+
+
+def pawn_bitboards(fen: str) -> Tuple[chess.Bitboard, chess.Bitboard]:
+    board = chess.BaseBoard(fen.split()[0])
+    return (
+        board.pawns & board.occupied_co[chess.WHITE],
+        board.pawns & board.occupied_co[chess.BLACK],
+    )
+
+
+def matches_masks(
+    masks: Masks, white_pawns: chess.Bitboard, black_pawns: chess.Bitboard
+) -> bool:
+    white_required, white_forbidden, black_required, black_forbidden = masks
+    return (
+        white_pawns & white_required == white_required
+        and not white_pawns & white_forbidden
+        and black_pawns & black_required == black_required
+        and not black_pawns & black_forbidden
+    )
 
 
 def has_pawn_structure(fen, white_files, black_files) -> bool:
-    aug = board.AugBoard(fen)
-    white_pawns = aug.pieces(chess.PAWN, chess.WHITE)
-    black_pawns = aug.pieces(chess.PAWN, chess.BLACK)
-
-    for color_files, color_pawns in zip(
-        [white_files, black_files], [white_pawns, black_pawns]
-    ):
-        for file_name, ranks in color_files.items():
-            file_idx = ord(file_name) - ord("a")
-            present = color_pawns & chess.SquareSet(chess.BB_FILES[file_idx])
-            expected = chess.SquareSet([8 * (rank - 1) + file_idx for rank in ranks])
-            if present != expected:
-                return False
-    return True
+    masks = pawn_structure_masks(white_files) + pawn_structure_masks(black_files)
+    return matches_masks(masks, *pawn_bitboards(fen))
 
 
 class PawnStructure(IntEnum):
@@ -56,98 +87,132 @@ class PawnStructure(IntEnum):
     BOTVINNIK_SYSTEM = 20
 
     @classmethod
-    def detectors(cls) -> Dict["PawnStructure", Callable[[str], bool]]:
+    def files(cls) -> Dict["PawnStructure", Tuple[Dict, Dict]]:
+        """
+        (white files, black files) per structure where files map a file name to the ranks of the pawns
+        on that file, e.g. {"c": []} means no pawn on the c-file.
+        """
         return {
-            cls.CARO: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"d": [4], "e": []},
-                black_files={"c": [6], "d": [], "e": [6]},
-            ),
-            cls.SLAV: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [], "d": [4], "e": [3]},
-                black_files={"c": [6], "d": [], "e": [6]},
-            ),
-            cls.SICILIAN_SCHEVENINGEN: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"d": [], "e": [4]},
-                black_files={"c": [], "d": [6], "e": [6]},
-            ),
-            cls.SICILIAN_DRAGON: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"d": [], "e": [4]},
-                black_files={"c": [], "d": [6], "g": [6]},
-            ),
-            cls.SICILIAN_BOLESLAVSKY_HOLE: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"d": [], "e": [4]},
-                black_files={"c": [], "d": [6], "e": [5]},
-            ),
-            cls.MAROCZY_BIND: lambda fen: has_pawn_structure(
-                fen, white_files={"c": [4], "d": [], "e": [4]}, black_files={"c": []},
-            ),
-            cls.HEDGEHOG: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [4], "d": [], "e": [4]},
-                black_files={"a": [6], "b": [6], "c": [], "d": [6], "e": [6]},
-            ),
-            cls.RAUZER_FORMATION: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [4], "d": [], "e": [4]},
-                black_files={"c": [6], "d": [], "e": [5]},
-            ),
-            cls.BOLESLAVSKY_WALL: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [4], "d": [], "e": [4]},
-                black_files={"c": [6], "d": [6], "e": []},
-            ),
-            cls.D5_CHAIN: lambda fen: has_pawn_structure(
-                fen, white_files={"d": [5], "e": [4]}, black_files={"d": [6], "e": [5]},
-            ),
-            cls.E5_CHAIN: lambda fen: has_pawn_structure(
-                fen, white_files={"d": [4], "e": [5]}, black_files={"d": [5], "e": [6]},
-            ),
-            cls.MODERN_BENONI: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [], "d": [5], "e": [4]},
-                black_files={"c": [5], "d": [6], "e": []},
-            ),
-            cls.GIUOCO_PIANO_ISOLANI: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [], "d": [4], "e": []},
-                black_files={"d": [], "e": []},
-            ),
-            cls.QUEENS_GAMBIT_ISOLANI: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [], "d": [4], "e": []},
-                black_files={"c": [], "d": [], "e": [6]},
-            ),
-            cls.HANGING_PAWNS: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"b": [], "c": [4], "d": [4], "e": []},
-                black_files={"c": [], "d": [], "e": [6]},
-            ),
-            cls.CARLSBAD: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [], "d": [4], "e": [3]},
-                black_files={"c": [6], "d": [5], "e": []},
-            ),
-            cls.PANOV: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [5], "d": [4], "e": []},
-                black_files={"c": [], "d": [5], "e": [6]},
-            ),
-            cls.STONEWALL: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"d": [4], "e": [3], "f": [4]},
-                black_files={"d": [5], "e": [6], "f": [5]},
-            ),
-            cls.BOTVINNIK_SYSTEM: lambda fen: has_pawn_structure(
-                fen,
-                white_files={"c": [4], "d": [3], "e": [4]},
-                black_files={"c": [5], "d": [6], "e": [5]},
-            ),
-            cls.CLOSED_SICILIAN: lambda fen: has_pawn_structure(
-                fen, white_files={"d": [3], "e": [4]}, black_files={"c": [5], "d": [6]},
-            ),
+            cls.CARO: ({"d": [4], "e": []}, {"c": [6], "d": [], "e": [6]}),
+            cls.SLAV: ({"c": [], "d": [4], "e": [3]}, {"c": [6], "d": [], "e": [6]}),
+            cls.SICILIAN_SCHEVENINGEN: (
+                {"d": [], "e": [4]},
+                {"c": [], "d": [6], "e": [6]},
+            ),
+            cls.SICILIAN_DRAGON: ({"d": [], "e": [4]}, {"c": [], "d": [6], "g": [6]}),
+            cls.SICILIAN_BOLESLAVSKY_HOLE: (
+                {"d": [], "e": [4]},
+                {"c": [], "d": [6], "e": [5]},
+            ),
+            cls.MAROCZY_BIND: ({"c": [4], "d": [], "e": [4]}, {"c": []}),
+            cls.HEDGEHOG: (
+                {"c": [4], "d": [], "e": [4]},
+                {"a": [6], "b": [6], "c": [], "d": [6], "e": [6]},
+            ),
+            cls.RAUZER_FORMATION: (
+                {"c": [4], "d": [], "e": [4]},
+                {"c": [6], "d": [], "e": [5]},
+            ),
+            cls.BOLESLAVSKY_WALL: (
+                {"c": [4], "d": [], "e": [4]},
+                {"c": [6], "d": [6], "e": []},
+            ),
+            cls.D5_CHAIN: ({"d": [5], "e": [4]}, {"d": [6], "e": [5]}),
+            cls.E5_CHAIN: ({"d": [4], "e": [5]}, {"d": [5], "e": [6]}),
+            cls.MODERN_BENONI: (
+                {"c": [], "d": [5], "e": [4]},
+                {"c": [5], "d": [6], "e": []},
+            ),
+            cls.GIUOCO_PIANO_ISOLANI: (
+                {"c": [], "d": [4], "e": []},
+                {"d": [], "e": []},
+            ),
+            cls.QUEENS_GAMBIT_ISOLANI: (
+                {"c": [], "d": [4], "e": []},
+                {"c": [], "d": [], "e": [6]},
+            ),
+            cls.HANGING_PAWNS: (
+                {"b": [], "c": [4], "d": [4], "e": []},
+                {"c": [], "d": [], "e": [6]},
+            ),
+            cls.CARLSBAD: (
+                {"c": [], "d": [4], "e": [3]},
+                {"c": [6], "d": [5], "e": []},
+            ),
+            cls.PANOV: ({"c": [5], "d": [4], "e": []}, {"c": [], "d": [5], "e": [6]}),
+            cls.STONEWALL: (
+                {"d": [4], "e": [3], "f": [4]},
+                {"d": [5], "e": [6], "f": [5]},
+            ),
+            cls.BOTVINNIK_SYSTEM: (
+                {"c": [4], "d": [3], "e": [4]},
+                {"c": [5], "d": [6], "e": [5]},
+            ),
+            cls.CLOSED_SICILIAN: ({"d": [3], "e": [4]}, {"c": [5], "d": [6]}),
         }
+
+    @classmethod
+    def masks(cls) -> Dict["PawnStructure", Masks]:
+        """
+        (white required, white forbidden, black required, black forbidden) masks per structure in ascending order,
+        compiled once from files().
+        """
+        return _compile_masks()
+
+    @classmethod
+    def detectors(cls) -> Dict["PawnStructure", Callable[[str], bool]]:
+        return instrument(
+            {
+                structure: lambda fen, masks=masks: matches_masks(
+                    masks, *pawn_bitboards(fen)
+                )
+                for structure, masks in cls.masks().items()
+            }
+        )
+
+    @classmethod
+    @profiled("PawnStructure.classify")
+    def classify(
+        cls, white_pawns: chess.Bitboard, black_pawns: chess.Bitboard
+    ) -> "PawnStructure":
+        """
+        Returns the most specialized (highest valued) structure matching the pawn bitboards.
+        """
+        for structure, masks in reversed(cls.masks().items()):
+            if matches_masks(masks, white_pawns, black_pawns):
+                return structure
+        return cls.NONE
+
+    @classmethod
+    def classify_array(
+        cls, white_pawns: np.ndarray, black_pawns: np.ndarray
+    ) -> np.ndarray:
+        """
+        Vectorized classify over columns of uint64 pawn bitboards.
+        """
+        white_pawns = np.asarray(white_pawns, dtype=np.uint64)
+        black_pawns = np.asarray(black_pawns, dtype=np.uint64)
+        res = np.full(white_pawns.shape, cls.NONE, dtype=np.int8)
+        for structure, masks in cls.masks().items():
+            white_required, white_forbidden, black_required, black_forbidden = (
+                np.uint64(mask) for mask in masks
+            )
+            matched = (
+                ((white_pawns & white_required) == white_required)
+                & ((white_pawns & white_forbidden) == 0)
+                & ((black_pawns & black_required) == black_required)
+                & ((black_pawns & black_forbidden) == 0)
+            )
+            # masks are in ascending order so later matches are the more specialized ones
+            res[matched] = structure
+        return res
+
+
+@lru_cache(maxsize=None)
+def _compile_masks() -> Dict[PawnStructure, Masks]:
+    return {
+        structure: pawn_structure_masks(white_files) + pawn_structure_masks(black_files)
+        for structure, (white_files, black_files) in sorted(
+            PawnStructure.files().items()
+        )
+    }
@@ -3,6 +3,8 @@ from typing import Dict, Callable
 
 import chess
 
+from ..profiling import instrument
+
 from .discovered_attack import is_discovered_attack_see as is_discovered_attack
 from .fork import is_fork_see as is_fork
 from .pin import is_pin_see as is_pin
@@ -22,13 +24,15 @@ class Tactic(IntEnum):
 
     @classmethod
     def detectors(cls) -> Dict["Tactic", Callable[[str, chess.Move], bool]]:
-        return {
-            cls.FORK: is_fork,
-            cls.DISCOVERED_ATTACK: is_discovered_attack,
-            cls.PIN: is_pin,
-            cls.SKEWER: is_skewer,
-            cls.SACRIFICE: is_sacrifice,
-        }
+        return instrument(
+            {
+                cls.FORK: is_fork,
+                cls.DISCOVERED_ATTACK: is_discovered_attack,
+                cls.PIN: is_pin,
+                cls.SKEWER: is_skewer,
+                cls.SACRIFICE: is_sacrifice,
+            }
+        )
 
     @classmethod
     def detector(cls, tactic: "Tactic") -> Callable[[str, chess.Move], bool]:
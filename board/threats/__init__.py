@@ -4,6 +4,7 @@ from typing import Dict, Callable
 import chess
 
 import board
+from ..profiling import instrument
 from .capture import creates_hanging_piece_threat_capture, creates_material_gain_capture
 from .mate import creates_mate_threat
 
@@ -43,16 +44,18 @@ class Threat(IntEnum):
 
     @classmethod
     def detectors(cls) -> Dict["Threat", Callable[[str, chess.Move], bool]]:
-        return {
-            cls.MATE: creates_mate_threat,
-            cls.HANGING_PIECE_CAPTURE: creates_hanging_piece_threat_capture,
-            cls.MATERIAL_GAIN_CAPTURE: creates_material_gain_capture,
-            # cls.FORK: make_tactic_threat_detector(board.Tactic.FORK),
-            # cls.DISCOVERED_ATTACK: make_tactic_threat_detector(
-            #     board.Tactic.DISCOVERED_ATTACK
-            # ),
-            # cls.SKEWER: make_tactic_threat_detector(board.Tactic.SKEWER),
-        }
+        return instrument(
+            {
+                cls.MATE: creates_mate_threat,
+                cls.HANGING_PIECE_CAPTURE: creates_hanging_piece_threat_capture,
+                cls.MATERIAL_GAIN_CAPTURE: creates_material_gain_capture,
+                # cls.FORK: make_tactic_threat_detector(board.Tactic.FORK),
+                # cls.DISCOVERED_ATTACK: make_tactic_threat_detector(
+                #     board.Tactic.DISCOVERED_ATTACK
+                # ),
+                # cls.SKEWER: make_tactic_threat_detector(board.Tactic.SKEWER),
+            }
+        )
 
     @classmethod
     def detector(cls, threat: "Threat") -> Callable[[str, chess.Move], bool]:
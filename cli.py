@@ -1,8 +1,14 @@
 import os
+import json
+import time
 import utils
 import click
+import distributed
 import features
 import pandas as pd
+from board.profiling import profiler
+from features import abstract
+from features.engine import dead_letters, engine_cache
 
 PGN_PATH = "pgns/{}.pgn"
 os.makedirs("csvs", exist_ok=True)
@@ -13,18 +19,152 @@ os.makedirs("csvs", exist_ok=True)
 @click.argument("feature-names", nargs=-1)
 @click.option("--limit", type=int, default=1e9)
 @click.option("--cache", is_flag=True)
-def csv(pgn_path, feature_names, limit, cache):
+@click.option(
+    "--position-cache",
+    type=click.Path(dir_okay=False),
+    help="Pickle file to load position features from and save them to.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    default=abstract.CACHE_SIZE,
+    show_default=True,
+    help="Entries of the position and engine caches, 0 disables them.",
+)
+@click.option(
+    "--profile-detectors",
+    is_flag=True,
+    help="Print call counts, hit rates and latencies of the detectors.",
+)
+@click.option(
+    "--dead-letters",
+    "dead_letter_path",
+    type=click.Path(dir_okay=False),
+    help="JSON lines file to append the rows engines failed on to.",
+)
+@click.option(
+    "--queue",
+    "queue_path",
+    type=click.Path(file_okay=False),
+    help="Shared directory to distribute the games to workers through, see csv-worker.",
+)
+@click.option(
+    "--games-per-unit",
+    type=int,
+    default=50,
+    help="Number of games in a work unit of the queue.",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=0,
+    help="Number of local worker processes to start for the queue.",
+)
+@click.option(
+    "--timings",
+    type=click.File("w"),
+    help="File to write the time spent in each stage to as JSON, - for stdout.",
+)
+def csv(
+    pgn_path,
+    feature_names,
+    limit,
+    cache,
+    position_cache,
+    cache_size,
+    profile_detectors,
+    dead_letter_path,
+    queue_path,
+    games_per_unit,
+    workers,
+    timings,
+):
+    start = time.perf_counter()
+    stages = {}
+
     csv_path = pgn_path.replace("pgn", "csv")
     if limit:
         csv_path = csv_path.replace(".csv", "_{}.csv".format(limit))
 
+    stage_start = time.perf_counter()
     if cache:
         df = pd.read_csv(csv_path)
+        stages["read_csv"] = time.perf_counter() - stage_start
     else:
         pgn = open(pgn_path)
         df = utils.pgn_to_df(pgn, limit)
+        stages["parse_pgn"] = time.perf_counter() - stage_start
+
+    if position_cache:
+        abstract.position_cache = abstract.PositionCache.load(
+            position_cache, cache_size
+        )
+    else:
+        abstract.position_cache.resize(cache_size)
+    engine_cache.resize(cache_size)
+
+    if dead_letter_path:
+        dead_letters.path = dead_letter_path
+
+    if profile_detectors:
+        profiler.reset()
+        profiler.enable()
 
     feature_classes = [getattr(features, name) for name in feature_names]
-    df = utils.add_features(df, feature_classes)
+    feature_timings = []
+    if queue_path:
+        stage_start = time.perf_counter()
+        df = distributed.coordinate(
+            df, feature_names, queue_path, games_per_unit, workers
+        )
+        stages["queue"] = time.perf_counter() - stage_start
+    else:
+        df = utils.add_features(df, feature_classes, feature_timings)
 
+    if position_cache:
+        abstract.position_cache.save(position_cache)
+    click.echo(
+        "Position cache: {} hits, {} misses".format(
+            abstract.position_cache.hits, abstract.position_cache.misses
+        ),
+        err=True,
+    )
+    click.echo(
+        "Engine cache: {} hits, {} misses".format(
+            engine_cache.hits, engine_cache.misses
+        ),
+        err=True,
+    )
+    if dead_letters.records:
+        click.echo("Dead letters: {} rows".format(len(dead_letters.records)), err=True)
+
+    if profile_detectors:
+        profiler.disable()
+        click.echo(profiler.report().to_string(), err=True)
+
+    stage_start = time.perf_counter()
     df.to_csv(csv_path, index=False)
+    stages["write_csv"] = time.perf_counter() - stage_start
+
+    if timings:
+        seconds = time.perf_counter() - start
+        report = {
+            "rows": len(df),
+            "seconds": seconds,
+            "rows_per_second": len(df) / seconds,
+            "peak_rss_mb": utils.peak_rss_mb(),
+            "stages": stages,
+            "features": feature_timings,
+        }
+        json.dump(report, timings, indent=2)
+        timings.write("\n")
+
+
+@click.command()
+@click.argument("queue-path", type=click.Path(file_okay=False))
+def worker(queue_path):
+    """
+    Adds features to the work units a csv --queue coordinator puts into QUEUE_PATH until all of them are done.
+    """
+    num_units = distributed.work(queue_path)
+    click.echo("Worked on {} units".format(num_units))
@@ -0,0 +1,272 @@
+"""
+Annotation of a data frame by several worker processes, on one host or on hosts sharing a directory.
+
+The coordinator splits the rows into work units of whole games and writes them to the todo directory of the queue.
+Workers claim a unit by renaming it into claimed, which only one of them can do, add the features to its rows and
+write the result as a shard to done. While a worker runs a unit it touches its claim, the coordinator puts claims
+that were not touched for lease seconds back to todo, so units of dead workers are picked up by other workers.
+Once every unit has a shard the coordinator concatenates them in the order of the units.
+
+A queue is only resumed by a coordinator with the same feature names, games per unit and input rows, which are
+recorded in its metadata.
+
+    queue/
+        metadata   JSON of the feature names, games per unit and a hash of the input rows
+        units      number of units, written once all units are in todo
+        todo/      00000.pkl, ...
+        claimed/
+        done/
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import click
+import pandas as pd
+
+import features
+import utils
+
+# seconds after which the claim of a worker that stopped touching it is put back to todo
+LEASE_SECONDS = 600
+POLL_SECONDS = 1
+
+
+def _text_writer(text):
+    def write(path):
+        with open(path, "w") as fp:
+            fp.write(text)
+
+    return write
+
+
+def _metadata(df, feature_names, games_per_unit):
+    rows = pd.util.hash_pandas_object(df).to_numpy()
+    return {
+        "features": list(feature_names),
+        "games_per_unit": games_per_unit,
+        "rows": len(df),
+        "input": hashlib.sha256(rows.tobytes()).hexdigest(),
+    }
+
+
+class WorkQueue:
+    """
+    Work units in a directory, moved between the states todo, claimed and done by atomic renames.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for name in ["todo", "claimed", "done"]:
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    def _path(self, state, unit=""):
+        return os.path.join(self.path, state, unit)
+
+    def _write(self, path, write):
+        # write to a hidden file first so that readers never see a partial file
+        head, tail = os.path.split(path)
+        tmp_path = os.path.join(head, ".{}.{}".format(tail, os.getpid()))
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def units(self, state):
+        return sorted(
+            unit for unit in os.listdir(self._path(state)) if not unit.startswith(".")
+        )
+
+    @property
+    def num_units(self):
+        """
+        Number of units or None while the coordinator is still writing them.
+        """
+        try:
+            with open(os.path.join(self.path, "units")) as fp:
+                return int(fp.read())
+        except FileNotFoundError:
+            return None
+
+    @property
+    def metadata(self):
+        """
+        What the queue was filled with, see _metadata, or None before put.
+        """
+        try:
+            with open(os.path.join(self.path, "metadata")) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def put(self, df, feature_names, games_per_unit):
+        """
+        Splits df into units of games_per_unit consecutive games and queues them with the feature names to add.
+        """
+        metadata = _metadata(df, feature_names, games_per_unit)
+        self._write(
+            os.path.join(self.path, "metadata"), _text_writer(json.dumps(metadata))
+        )
+        game_ids = df.game_id.ne(df.game_id.shift()).cumsum() - 1
+        unit_ids = game_ids // games_per_unit
+        units = [unit_df for _, unit_df in df.groupby(unit_ids, sort=True)]
+        for i, unit_df in enumerate(units):
+            unit = "{:05d}.pkl".format(i)
+            self._write(
+                self._path("todo", unit),
+                lambda path: pd.to_pickle((list(feature_names), unit_df), path),
+            )
+        self._write(os.path.join(self.path, "units"), _text_writer(str(len(units))))
+        return len(units)
+
+    def claim(self):
+        """
+        Moves the first unit of todo to claimed and returns it, None if todo is empty.
+        """
+        for unit in self.units("todo"):
+            try:
+                os.rename(self._path("todo", unit), self._path("claimed", unit))
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+            return unit
+        return None
+
+    def load(self, unit):
+        return pd.read_pickle(self._path("claimed", unit))
+
+    def touch(self, unit):
+        try:
+            os.utime(self._path("claimed", unit))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, unit, df):
+        self._write(self._path("done", unit), df.to_pickle)
+        try:
+            os.remove(self._path("claimed", unit))
+        except FileNotFoundError:
+            # requeued in the meantime, the shard of whichever worker finishes last wins
+            pass
+
+    def requeue_stale(self, lease):
+        """
+        Puts claims that were not touched for lease seconds back to todo and returns them.
+        """
+        requeued = []
+        now = time.time()
+        for unit in self.units("claimed"):
+            try:
+                if now - os.path.getmtime(self._path("claimed", unit)) < lease:
+                    continue
+                os.rename(self._path("claimed", unit), self._path("todo", unit))
+            except FileNotFoundError:
+                continue
+            requeued.append(unit)
+        return requeued
+
+    def is_done(self):
+        num_units = self.num_units
+        return num_units is not None and len(self.units("done")) >= num_units
+
+    def merge(self):
+        return pd.concat(
+            [pd.read_pickle(self._path("done", unit)) for unit in self.units("done")],
+            ignore_index=True,
+        )
+
+
+def work(queue_path, lease=LEASE_SECONDS, poll=POLL_SECONDS):
+    """
+    Adds features to units of the queue until all units are done. Returns the number of units this worker did.
+    """
+    queue = WorkQueue(queue_path)
+    done = 0
+    while not queue.is_done():
+        unit = queue.claim()
+        if unit is None:
+            time.sleep(poll)
+            continue
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(lease / 4):
+                queue.touch(unit)
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            feature_names, df = queue.load(unit)
+            feature_classes = [getattr(features, name) for name in feature_names]
+            df = utils.add_features(df.reset_index(drop=True), feature_classes)
+        finally:
+            stop.set()
+            thread.join()
+        queue.complete(unit, df)
+        done += 1
+    return done
+
+
+def coordinate(
+    df,
+    feature_names,
+    queue_path,
+    games_per_unit,
+    workers=0,
+    lease=LEASE_SECONDS,
+    poll=POLL_SECONDS,
+):
+    """
+    Queues the games of df in units of games_per_unit games, waits for workers to add the features to all of them
+    and returns the merged result. Starts workers local worker processes, others can join with `csv-worker`.
+
+    A queue that already holds units, e.g. of a coordinator that was stopped, is resumed instead of refilled. It
+    fails if the queue was filled with other features, games per unit or input rows.
+    """
+    queue = WorkQueue(queue_path)
+    num_units = queue.num_units
+    if num_units is None:
+        num_units = queue.put(df, feature_names, games_per_unit)
+    else:
+        metadata = queue.metadata or {}
+        expected = _metadata(df, feature_names, games_per_unit)
+        mismatches = [
+            "{} {} instead of {}".format(key, metadata.get(key), value)
+            for key, value in expected.items()
+            if metadata.get(key) != value
+        ]
+        if mismatches:
+            raise click.ClickException(
+                "Queue {} was filled by a different run ({}), remove it or use "
+                "another queue".format(queue_path, ", ".join(mismatches))
+            )
+
+    processes = [
+        multiprocessing.Process(target=work, args=(queue_path, lease, poll))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        with click.progressbar(
+            length=num_units, label="Work units", file=sys.stderr
+        ) as bar:
+            num_done = 0
+            while not queue.is_done():
+                queue.requeue_stale(lease)
+                time.sleep(poll)
+                bar.update(len(queue.units("done")) - num_done)
+                num_done = len(queue.units("done"))
+                if processes and all(
+                    process.exitcode not in (None, 0) for process in processes
+                ):
+                    raise click.ClickException("All workers failed")
+    finally:
+        for process in processes:
+            process.join()
+    return queue.merge()
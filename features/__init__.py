@@ -5,7 +5,14 @@ from features.best_pv import BestPV
 from features.board import Board
 from features.checkmate import Checkmate
 from features.checkmate_type import CheckmateType
-from features.stockfish import Stockfish10, StockfishDepth, StockfishEval
+from features.stockfish import (
+    Stockfish10,
+    StockfishAdaptive,
+    StockfishDepth,
+    StockfishEval,
+    StockfishMultiPV,
+    StockfishUserMove,
+)
 from features.clock import Clock
 from features.opening import Opening
 from features.abstract import FeatureList
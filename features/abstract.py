@@ -1,8 +1,21 @@
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
 import click
 import pandas as pd
 
 
-not_feature_attributes = ["features", "feature_names", "from_row", "from_df", "csvs"]
+not_feature_attributes = [
+    "features",
+    "feature_names",
+    "from_row",
+    "from_df",
+    "csvs",
+    "position_key",
+]
 
 
 def _is_feature(attr):
@@ -13,6 +26,78 @@ def _is_feature(attr):
     )
 
 
+# entries of the position and engine caches, a Board feature dict takes about 2.6 KB
+CACHE_SIZE = 10000
+
+
+class PositionCache:
+    """
+    Bounded LRU memo of feature dicts for position-only feature classes.
+
+    Keys are (feature class name, position key) pairs where the position key is usually derived from
+    chess.polyglot.zobrist_hash, see Features.position_key. Safe to share between threads. A maxsize of 0 disables
+    the cache.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @classmethod
+    def load(cls, path, maxsize=CACHE_SIZE):
+        cache = cls(maxsize)
+        if os.path.exists(path):
+            with open(path, "rb") as fp:
+                for key, value in pickle.load(fp):
+                    cache.put(key, value)
+        return cache
+
+    def save(self, path):
+        with open(path, "wb") as fp:
+            pickle.dump(list(self._entries.items()), fp)
+
+
+position_cache = PositionCache()
+
+
 class Features:
 
     csvs = ["lichess"]
@@ -41,13 +126,32 @@ class Features:
     def from_row(cls, row):
         return cls(row.fen)
 
+    @classmethod
+    def position_key(cls, row):
+        """
+        Key identifying everything the features of this row depend on or None if the features are not a function
+        of the position alone. Rows with equal keys share one entry in the position cache.
+        """
+        return None
+
     @classmethod
     def from_df(cls, df):
         feature_rows = []
-        with click.progressbar(tuple(df.itertuples()), label=cls.__name__) as rows:
+        with click.progressbar(
+            tuple(df.itertuples()), label=cls.__name__, file=sys.stderr
+        ) as rows:
             for row in rows:
-                feature_instance = cls.from_row(row)
-                feature_rows.append(feature_instance.features())
+                key = cls.position_key(row)
+                if key is None:
+                    feature_rows.append(cls.from_row(row).features())
+                    continue
+
+                key = (cls.__name__, key)
+                features = position_cache.get(key)
+                if features is None:
+                    features = cls.from_row(row).features()
+                    position_cache.put(key, features)
+                feature_rows.append(features)
         return pd.DataFrame(feature_rows)
 
 
@@ -20,41 +20,12 @@ class BestPV(Features):
     def from_row(cls, row):
         return cls(row.fen, literal_eval(row.best_pv))
 
-    @staticmethod
-    def _number_of_captures(board, pv, color):
-        count = 0
-        board = board.copy()  # TODO: do we need to copy here?
-        for move in pv:
-            count += board.current_color == color and board.is_capture(move)
-            board.push(move)
-        return count
-
-    @staticmethod
-    def _number_of_checks(board, pv, color):
-        count = 0
-        board = board.copy()
-        for move in pv:
-            board.push(move)
-            count += board.current_color == color and board.is_check()
-        return count
-
-    @staticmethod
-    def _number_of_pieces_moved(board, pv, color):
-        board = board.copy()
-        squares = set()
-        count = 0
-        for move in pv:
-            if board.current_color == color:
-                if move.from_square in squares:
-                    squares.remove(move.from_square)
-                else:
-                    count += 1
-            board.push(move)
-            squares.add(move.to_square)
-        return count
+    @cached_property
+    def _walk(self):
+        return self.aug.walk_pv(self.pv)
 
     def _best_pv_tactics(self):
-        return self.aug.pv_tactics(self.pv)
+        return self._walk.tactics()
 
     # TODO: consider changing return type so it can handle multiple tactics
     @cached_property
@@ -62,7 +33,7 @@ class BestPV(Features):
         return self._best_pv_tactics()[0]
 
     def _best_pv_threats(self):
-        return self.aug.pv_threats(self.pv)
+        return self._walk.threats()
 
     # TODO: consider changing return type so it can handle multiple tactics
     @cached_property
@@ -71,27 +42,27 @@ class BestPV(Features):
 
     @cached_property
     def best_pv_our_number_of_captures(self):
-        return self._number_of_captures(self.aug, self.pv, self.aug.current_color)
+        return self._walk.number_of_captures[self.aug.current_color]
 
     @cached_property
     def best_pv_their_number_of_captures(self):
-        return self._number_of_captures(self.aug, self.pv, self.aug.other_color)
+        return self._walk.number_of_captures[self.aug.other_color]
 
     @cached_property
     def best_pv_our_number_of_checks(self):
-        return self._number_of_checks(self.aug, self.pv, self.aug.current_color)
+        return self._walk.number_of_checks[self.aug.current_color]
 
     @cached_property
     def best_pv_their_number_of_checks(self):
-        return self._number_of_checks(self.aug, self.pv, self.aug.other_color)
+        return self._walk.number_of_checks[self.aug.other_color]
 
     @cached_property
     def best_pv_our_number_of_pieces_moved(self):
-        return self._number_of_pieces_moved(self.aug, self.pv, self.aug.current_color)
+        return self._walk.number_of_pieces_moved[self.aug.current_color]
 
     @cached_property
     def best_pv_their_number_of_pieces_moved(self):
-        return self._number_of_pieces_moved(self.aug, self.pv, self.aug.other_color)
+        return self._walk.number_of_pieces_moved[self.aug.other_color]
 
     # TODO: maybe think about generators
     @cached_property
@@ -118,23 +89,13 @@ class BestPV(Features):
     #             features[f"best_pv_{side_name}{method_name}_normalized"] = num / len(self.pv)
     #     return features
 
-    @staticmethod
-    def _moved_piece_types(board, pv, color):
-        moved_piece_types = set()
-        for move in pv:
-            board.push(move)
-            piece = board.piece_at(move.to_square)
-            if piece.color == color:
-                moved_piece_types.add(piece.piece_type)
-        return sorted(moved_piece_types)
-
     @cached_property
     def best_pv_our_moved_piece_types(self):
-        return self._moved_piece_types(self.aug.copy(), self.pv, self.aug.current_color)
+        return sorted(self._walk.moved_piece_types[self.aug.current_color])
 
     @cached_property
     def best_pv_their_moved_piece_types(self):
-        return self._moved_piece_types(self.aug.copy(), self.pv, self.aug.other_color)
+        return sorted(self._walk.moved_piece_types[self.aug.other_color])
 
     @cached_property
     def best_pv_move_distance(self):
@@ -0,0 +1,162 @@
+"""
+Vectorized versions of the popcount based Board features.
+
+The kernels work on arrays of positions encoded with board.encoding and compute a feature for millions of
+positions at once. Column names and values match the Board feature class.
+"""
+
+import chess
+import numpy as np
+import pandas as pd
+
+from board.pawns import BB_CENTER_FILES, locked_pawns_mask
+from features.board import PositionOpenness
+from features.helpers import PIECE_TYPE_VALUE
+
+# color indices of POSITION_DTYPE["pieces"], python-chess colors are bools which NumPy would treat as masks
+WHITE = int(chess.WHITE)
+BLACK = int(chess.BLACK)
+
+# material value per piece type in the order of the last axis of POSITION_DTYPE["pieces"]
+MATERIAL_VALUES = np.array(
+    [PIECE_TYPE_VALUE[piece_type] for piece_type in chess.PIECE_TYPES], dtype=np.int64
+)
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def popcount(bitboards: np.ndarray) -> np.ndarray:
+    bitboards = np.asarray(bitboards, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitboards).astype(np.int64)
+
+    # SWAR popcount for NumPy < 2.0
+    x = bitboards - ((bitboards >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).astype(np.int64)
+
+
+def piece_counts(positions: np.ndarray) -> np.ndarray:
+    """
+    Number of pieces per (position, color, piece type - 1).
+    """
+    return popcount(positions["pieces"])
+
+
+def count_material(counts: np.ndarray) -> np.ndarray:
+    """
+    Material per position and color given piece_counts, the vectorized helpers.count_material.
+    """
+    return counts @ MATERIAL_VALUES
+
+
+def board_features(positions: np.ndarray) -> pd.DataFrame:
+    """
+    Popcount features of the Board feature class for an array of encoded positions.
+    """
+    turn = positions["turn"].astype(bool)
+    counts = piece_counts(positions)
+    material = count_material(counts)
+
+    rows = np.arange(len(positions))
+    us = turn.astype(np.intp)
+    them = 1 - us
+
+    df = pd.DataFrame(
+        {
+            "turn": turn,
+            "fullmove_number": positions["fullmove_number"].astype(np.int64),
+            "piece_count": counts.sum(axis=(1, 2)),
+            "our_material_count": material[rows, us],
+            "their_material_count": material[rows, them],
+        }
+    )
+    df["material_count"] = df.our_material_count + df.their_material_count
+    df["material_advantage"] = df.our_material_count - df.their_material_count
+
+    for prefix, side in [("our", us), ("their", them)]:
+        side_counts = counts[rows, side]
+        df[f"{prefix}_piece_count"] = side_counts.sum(axis=1)
+        for piece_type in chess.PIECE_TYPES[:-1]:
+            name = chess.piece_name(piece_type)
+            df[f"{prefix}_{name}s"] = side_counts[:, piece_type - 1]
+        df[f"{prefix}_non_pawn_pieces"] = (
+            df[f"{prefix}_piece_count"] - df[f"{prefix}_pawns"]
+        )
+        df[f"{prefix}_majors"] = df[f"{prefix}_queens"] + df[f"{prefix}_rooks"]
+        df[f"{prefix}_minors"] = df[f"{prefix}_bishops"] + df[f"{prefix}_knights"]
+
+    df["our_bishop_pair"] = (df.our_bishops >= 2) & (df.their_bishops <= 1)
+    df["their_bishop_pair"] = (df.their_bishops >= 2) & (df.our_bishops <= 1)
+    df["endgame_type"] = endgame_type(df)
+    df["position_openness"] = position_openness(positions)
+    return df
+
+
+def locked_pawns(positions: np.ndarray) -> np.ndarray:
+    """
+    Locked pawns bitboard per position, see board.pawns.locked_pawns.
+    """
+    pieces = positions["pieces"]
+    white_pawns = pieces[:, WHITE, chess.PAWN - 1]
+    black_pawns = pieces[:, BLACK, chess.PAWN - 1]
+    white_targets = np.bitwise_or.reduce(pieces[:, WHITE], axis=1)
+    black_targets = np.bitwise_or.reduce(pieces[:, BLACK], axis=1)
+
+    # the en passant square is a capture target for the side to move
+    ep_square = positions["ep_square"].astype(np.int64)
+    ep_mask = np.where(
+        ep_square >= 0, np.uint64(1) << np.maximum(ep_square, 0).astype(np.uint64), 0
+    ).astype(np.uint64)
+    turn = positions["turn"].astype(bool)
+    white_targets = white_targets | np.where(turn, np.uint64(0), ep_mask)
+    black_targets = black_targets | np.where(turn, ep_mask, np.uint64(0))
+
+    return locked_pawns_mask(white_pawns, black_pawns, white_targets, black_targets)
+
+
+def position_openness(positions: np.ndarray) -> np.ndarray:
+    """
+    Board.position_openness per position.
+    """
+    pieces = positions["pieces"]
+    num_locked_center_pawns = popcount(
+        locked_pawns(positions) & np.uint64(BB_CENTER_FILES)
+    )
+    num_traded_pawns = 16 - popcount(
+        pieces[:, WHITE, chess.PAWN - 1] | pieces[:, BLACK, chess.PAWN - 1]
+    )
+    return np.select(
+        [
+            (num_locked_center_pawns == 0) & (num_traded_pawns >= 5),
+            (num_locked_center_pawns <= 2) & (num_traded_pawns >= 2),
+        ],
+        [PositionOpenness.OPEN, PositionOpenness.SEMI_OPEN],
+        default=PositionOpenness.CLOSED,
+    )
+
+
+def endgame_type(df: pd.DataFrame) -> np.ndarray:
+    """
+    Board.endgame_type over columns of piece counts, NaN where Board.endgame_type is None.
+    """
+
+    def none(*names):
+        return np.logical_and.reduce(
+            [df[f"{side}_{name}"] == 0 for side in ["our", "their"] for name in names]
+        )
+
+    conditions = [
+        none("non_pawn_pieces"),  # pawn endgame
+        none("majors"),  # minors and pawns
+        none("minors"),  # majors and pawns
+        none("rooks", "minors"),  # queens and pawns
+        none("queens", "minors"),  # rooks and pawns
+        none("majors", "knights"),  # bishops and pawns
+        none("majors", "bishops"),  # knights and pawns
+    ]
+    return np.select(conditions, np.arange(len(conditions)), default=np.nan)
@@ -2,10 +2,17 @@ from enum import IntEnum
 from functools import cached_property
 
 import chess
+import chess.polyglot
 
 import board
+from board import pawns
+from board.pawns import BB_CENTER_FILES
 from features.abstract import Features
 
+# indices into Board._move_counts next to the piece types
+CAPTURES = 0
+CHECKS = 7
+
 
 class GamePhase(IntEnum):
     OPENING = 0
@@ -19,6 +26,111 @@ class PositionOpenness(IntEnum):
     CLOSED = 2
 
 
+ORIGIN_SQUARES = {
+    chess.WHITE: {
+        chess.A1: chess.ROOK,
+        chess.B1: chess.KNIGHT,
+        chess.C1: chess.BISHOP,
+        chess.D1: chess.QUEEN,
+        chess.E1: chess.KING,
+        chess.F1: chess.BISHOP,
+        chess.G1: chess.KNIGHT,
+        chess.H1: chess.KNIGHT,
+    }
+}
+ORIGIN_SQUARES[chess.BLACK] = {
+    chess.square_mirror(square): piece_type
+    for square, piece_type in ORIGIN_SQUARES[chess.WHITE].items()
+}
+
+
+def game_phase(num_non_pawn_pieces, num_queens, num_pieces_on_origin_squares):
+    """
+    Classifies a position from the number of non pawn pieces (king included), queens and non pawn pieces on their
+    origin squares of both colors, see Board.phase.
+    """
+
+    def is_endgame_phase(num_non_pawn_pieces, num_queens, num_pieces_on_origin_squares):
+        return num_non_pawn_pieces <= 4 or (
+            num_non_pawn_pieces == 5
+            and num_queens == 0
+            and num_pieces_on_origin_squares <= 2
+        )
+
+    if all(
+        map(
+            is_endgame_phase,
+            num_non_pawn_pieces,
+            num_queens,
+            num_pieces_on_origin_squares,
+        )
+    ):
+        return GamePhase.ENDGAME
+
+    if min(num_pieces_on_origin_squares) <= 2:
+        return GamePhase.MIDDLEGAME
+    return GamePhase.OPENING
+
+
+class GamePhaseTracker:
+    """
+    Tracks the counts GamePhase depends on along a game. Each move only touches a few squares so instead of
+    recounting the whole board the counts of those squares are subtracted before and added after the move.
+    """
+
+    def __init__(self, board: chess.Board):
+        self.num_non_pawn_pieces = [0, 0]
+        self.num_queens = [0, 0]
+        self.num_pieces_on_origin_squares = [0, 0]
+        self._update(board, chess.SQUARES, 1)
+
+    def _update(self, board, squares, sign):
+        for square in squares:
+            piece = board.piece_at(square)
+            if piece is None or piece.piece_type == chess.PAWN:
+                continue
+            self.num_non_pawn_pieces[piece.color] += sign
+            self.num_queens[piece.color] += sign * (piece.piece_type == chess.QUEEN)
+            # like Board._non_pawn_pieces_on_origin_squares only the piece type is compared, not the color
+            for color in chess.COLORS:
+                self.num_pieces_on_origin_squares[color] += sign * (
+                    ORIGIN_SQUARES[color].get(square) == piece.piece_type
+                )
+
+    def push(self, board: chess.Board, move: chess.Move) -> None:
+        """
+        Pushes the move onto the board and updates the counts.
+        """
+        if board.is_castling(move):
+            squares = chess.SquareSet(
+                chess.BB_RANKS[chess.square_rank(move.from_square)]
+            )
+        else:
+            squares = (move.from_square, move.to_square)
+        self._update(board, squares, -1)
+        board.push(move)
+        self._update(board, squares, 1)
+
+    @property
+    def phase(self) -> GamePhase:
+        return game_phase(
+            self.num_non_pawn_pieces, self.num_queens, self.num_pieces_on_origin_squares
+        )
+
+
+def position_openness(locked_pawns, pawns):
+    """
+    Classifies a position from its locked pawns and pawns bitboards, see Board.position_openness.
+    """
+    num_locked_center_pawns = chess.popcount(locked_pawns & BB_CENTER_FILES)
+    num_traded_pawns = 16 - chess.popcount(pawns)
+    if num_locked_center_pawns == 0 and num_traded_pawns >= 5:
+        return PositionOpenness.OPEN
+    if num_locked_center_pawns <= 2 and num_traded_pawns >= 2:
+        return PositionOpenness.SEMI_OPEN
+    return PositionOpenness.CLOSED
+
+
 class Board(Features):
     def __init__(self, fen):
         self.board = board.AugBoard(fen)
@@ -27,6 +139,12 @@ class Board(Features):
         self.their_board.push(chess.Move.null())
         self.their_moves = tuple(self.their_board.legal_moves)
 
+    @classmethod
+    def position_key(cls, row):
+        # fullmove_number is the only feature not covered by the zobrist hash
+        fullmove_number = row.fen.rsplit(" ", 1)[-1]
+        return chess.polyglot.zobrist_hash(chess.Board(row.fen)), fullmove_number
+
     @cached_property
     def turn(self):
         return self.board.current_color
@@ -39,60 +157,78 @@ class Board(Features):
     def fullmove_number(self):
         return self.board.fullmove_number
 
+    @staticmethod
+    def _move_counts(board, moves):
+        """
+        Counts the given legal moves in a single pass. Indices 1-6 hold the number of moves per moving piece type,
+        CAPTURES and CHECKS the number of captures and checks. Checks are found with check square and discovered
+        check masks, only castling, en passant and promotions fall back to pushing the move.
+        """
+        counts = [0] * 8
+        check_squares = board.check_squares()
+        if check_squares is not None:
+            king = board.other_color_king()
+            blockers = board.discovered_check_blockers()
+
+        for move in moves:
+            piece_type = board.piece_type_at(move.from_square)
+            counts[piece_type] += 1
+            counts[CAPTURES] += board.is_capture(move)
+
+            if (
+                check_squares is None
+                or move.promotion
+                or board.is_castling(move)
+                or board.is_en_passant(move)
+            ):
+                counts[CHECKS] += board.gives_check(move)
+            elif check_squares[piece_type] & chess.BB_SQUARES[move.to_square]:
+                counts[CHECKS] += 1
+            elif chess.BB_SQUARES[move.from_square] & blockers:
+                counts[CHECKS] += not (
+                    chess.ray(king, move.from_square) & chess.BB_SQUARES[move.to_square]
+                )
+        return counts
+
+    @cached_property
+    def _our_move_counts(self):
+        return self._move_counts(self.board, self.moves)
+
+    @cached_property
+    def _their_move_counts(self):
+        return self._move_counts(self.their_board, self.their_moves)
+
     @cached_property
     def our_number_of_moves(self):
         return len(self.moves)
 
     @cached_property
     def our_number_of_checks(self):
-        count = 0
-        for move in self.moves:
-            self.board.push(move)
-            count += self.board.is_check()
-            self.board.pop()
-        return count
+        return self._our_move_counts[CHECKS]
 
     @cached_property
     def our_number_of_captures(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.is_capture(move)
-        return count
+        return self._our_move_counts[CAPTURES]
 
     @cached_property
     def our_number_of_queen_moves(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.piece_type_at(move.from_square) == chess.QUEEN
-        return count
+        return self._our_move_counts[chess.QUEEN]
 
     @cached_property
     def our_number_of_rook_moves(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.piece_type_at(move.from_square) == chess.ROOK
-        return count
+        return self._our_move_counts[chess.ROOK]
 
     @cached_property
     def our_number_of_bishop_moves(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.piece_type_at(move.from_square) == chess.BISHOP
-        return count
+        return self._our_move_counts[chess.BISHOP]
 
     @cached_property
     def our_number_of_knight_moves(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.piece_type_at(move.from_square) == chess.KNIGHT
-        return count
+        return self._our_move_counts[chess.KNIGHT]
 
     @cached_property
     def our_number_of_pawn_moves(self):
-        count = 0
-        for move in self.moves:
-            count += self.board.piece_type_at(move.from_square) == chess.PAWN
-        return count
+        return self._our_move_counts[chess.PAWN]
 
     @cached_property
     def their_number_of_moves(self):
@@ -100,54 +236,31 @@ class Board(Features):
 
     @cached_property
     def their_number_of_checks(self):
-        count = 0
-        for move in self.their_moves:
-            self.their_board.push(move)
-            count += self.their_board.is_check()
-            self.their_board.pop()
-        return count
+        return self._their_move_counts[CHECKS]
 
     @cached_property
     def their_number_of_captures(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.is_capture(move)
-        return count
+        return self._their_move_counts[CAPTURES]
 
     @cached_property
     def their_number_of_queen_moves(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.piece_type_at(move.from_square) == chess.QUEEN
-        return count
+        return self._their_move_counts[chess.QUEEN]
 
     @cached_property
     def their_number_of_rook_moves(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.piece_type_at(move.from_square) == chess.ROOK
-        return count
+        return self._their_move_counts[chess.ROOK]
 
     @cached_property
     def their_number_of_bishop_moves(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.piece_type_at(move.from_square) == chess.BISHOP
-        return count
+        return self._their_move_counts[chess.BISHOP]
 
     @cached_property
     def their_number_of_knight_moves(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.piece_type_at(move.from_square) == chess.KNIGHT
-        return count
+        return self._their_move_counts[chess.KNIGHT]
 
     @cached_property
     def their_number_of_pawn_moves(self):
-        count = 0
-        for move in self.their_moves:
-            count += self.their_board.piece_type_at(move.from_square) == chess.PAWN
-        return count
+        return self._their_move_counts[chess.PAWN]
 
     @cached_property
     def our_piece_count(self):
@@ -253,30 +366,9 @@ class Board(Features):
     def _locked_pawns(fen):
         """
         A pawn is locked iff. it cannot move forward because opponent's pawn occupy the square in front and cannot move
-        diagonally, i.e. make a capture, because no such capture is available, regardless of whose turn is it.
+        diagonally, i.e. make a capture, because no capture target is available, regardless of whose turn is it.
         """
-
-        board = chess.Board(fen)
-        board_opposite_turn = board.copy()
-        board_opposite_turn.turn = not board.turn
-
-        locked_pawns = set()
-        for square in chess.scan_forward(board.pawns):
-            color = board.piece_at(square).color
-            square_in_front = square + 8 if color == chess.WHITE else square - 8
-            if not (0 <= square_in_front < 64):
-                continue
-            piece_in_front = board.piece_at(square_in_front)
-            from_mask = chess.BB_SQUARES[square]
-            if (
-                piece_in_front is not None
-                and piece_in_front.piece_type == chess.PAWN
-                and piece_in_front.color != color
-                and not list(board.generate_legal_captures(from_mask))
-                and not list(board_opposite_turn.generate_legal_captures(from_mask))
-            ):
-                locked_pawns.add(square)
-        return locked_pawns
+        return set(chess.SquareSet(pawns.locked_pawns(chess.Board(fen))))
 
     @cached_property
     def position_openness(self):
@@ -295,37 +387,11 @@ class Board(Features):
         been traded.
         source: https://www.ichess.net/blog/three-types-positions-closed/
         """
-
-        locked_pawns = self._locked_pawns(self.board.fen())
-        center_files = "cdef"
-        locked_center_pawns = {
-            square
-            for square in locked_pawns
-            if chess.FILE_NAMES[chess.square_file(square)] in center_files
-        }
-        num_locked_center_pawns = len(locked_center_pawns)
-        num_traded_pawns = 16 - (self.our_pawns + self.their_pawns)
-        if num_locked_center_pawns == 0 and num_traded_pawns >= 5:
-            return PositionOpenness.OPEN
-        if num_locked_center_pawns <= 2 and num_traded_pawns >= 2:
-            return PositionOpenness.SEMI_OPEN
-        return PositionOpenness.CLOSED
+        return position_openness(self.board.locked_pawns(), self.board.pawns_mask())
 
     def _non_pawn_pieces_on_origin_squares(self, color: chess.Color):
-        origins = {
-            chess.A1: chess.ROOK,
-            chess.B1: chess.KNIGHT,
-            chess.C1: chess.BISHOP,
-            chess.D1: chess.QUEEN,
-            chess.E1: chess.KING,
-            chess.F1: chess.BISHOP,
-            chess.G1: chess.KNIGHT,
-            chess.H1: chess.KNIGHT,
-        }
         piece_types = []
-        for square, expected in origins.items():
-            if color == chess.BLACK:
-                square = chess.square_mirror(square)
+        for square, expected in ORIGIN_SQUARES[color].items():
             piece_type = self.board.piece_type_at(square)
             if piece_type == expected:
                 piece_types.append(piece_type)
@@ -333,39 +399,14 @@ class Board(Features):
 
     @cached_property
     def phase(self):
-        our_pieces_on_origin_squares = self._non_pawn_pieces_on_origin_squares(
-            self.turn
-        )
-        their_pieces_on_origin_squares = self._non_pawn_pieces_on_origin_squares(
-            not self.turn
-        )
-
-        def is_endgame_phase(num_non_pawn_pieces, num_queens, pieces_on_origin_squares):
-            return num_non_pawn_pieces <= 4 or (
-                num_non_pawn_pieces == 5
-                and num_queens == 0
-                and len(pieces_on_origin_squares) <= 2
-            )
-
-        our_endgame_phase = is_endgame_phase(
-            self.our_non_pawn_pieces,
-            self.our_queens,
-            self._non_pawn_pieces_on_origin_squares(self.turn),
-        )
-        their_endgame_phase = is_endgame_phase(
-            self.their_non_pawn_pieces,
-            self.their_queens,
-            self._non_pawn_pieces_on_origin_squares(not self.turn),
+        return game_phase(
+            (self.our_non_pawn_pieces, self.their_non_pawn_pieces),
+            (self.our_queens, self.their_queens),
+            (
+                len(self._non_pawn_pieces_on_origin_squares(self.turn)),
+                len(self._non_pawn_pieces_on_origin_squares(not self.turn)),
+            ),
         )
-        if our_endgame_phase and their_endgame_phase:
-            return GamePhase.ENDGAME
-
-        if (
-            min(len(our_pieces_on_origin_squares), len(their_pieces_on_origin_squares))
-            <= 2
-        ):
-            return GamePhase.MIDDLEGAME
-        return GamePhase.OPENING
 
     @cached_property
     def endgame_type(self):
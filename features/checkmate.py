@@ -1,7 +1,10 @@
+import sys
 from ast import literal_eval
 from functools import cached_property
 
 import chess
+import click
+import pandas as pd
 
 from features.abstract import Features
 
@@ -27,23 +30,49 @@ class Checkmate(Features):
     def from_row(cls, row):
         return cls(row.fen, literal_eval(row.best_pv))
 
+    @classmethod
+    def from_df(cls, df):
+        """
+        Only rows whose best PV ends in mate are replayed, the features of the other rows are NaN.
+        """
+        if "best_mate" in df:
+            df_mates = df[df.best_mate.notnull()]
+        else:
+            df_mates = df
+
+        feature_rows = []
+        with click.progressbar(
+            tuple(df_mates.itertuples()), label=cls.__name__, file=sys.stderr
+        ) as rows:
+            for row in rows:
+                feature_rows.append(cls.from_row(row).features())
+        return pd.DataFrame(
+            feature_rows, index=df_mates.index, columns=cls.feature_names()
+        ).reindex(df.index)
+
     @cached_property
     def _their_king_ring_mask(self):
-        their_king = self.board.king(self.their_color)
-        return self.board.attacks_mask(their_king)
+        return chess.BB_KING_ATTACKS[self.board.king(self.their_color)]
 
     @cached_property
     def _their_king_ring_and_king_mask(self):
         their_king_mask = self.board.occupied_co[self.their_color] & self.board.kings
         return their_king_mask | self._their_king_ring_mask
 
+    @cached_property
+    def _num_our_pieces_attacking_their_king_and_ring(self):
+        """
+        Number of our pieces attacking their king or king ring indexed by piece type.
+        """
+        counts = [0] * (chess.KING + 1)
+        for square in chess.scan_reversed(self.board.occupied_co[self.our_color]):
+            if self._their_king_ring_and_king_mask & self.board.attacks_mask(square):
+                counts[self.board.piece_type_at(square)] += 1
+        return counts
+
     @cached_property
     def num_our_pieces_attacking_their_king_ring(self):
-        count = 0
-        for piece in chess.scan_reversed(self.board.occupied_co[self.our_color]):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return sum(self._num_our_pieces_attacking_their_king_and_ring)
 
     @cached_property
     def our_king_is_attacking_their_king_and_ring(self):
@@ -53,43 +82,23 @@ class Checkmate(Features):
 
     @cached_property
     def num_our_queens_attacking_their_king_and_ring(self):
-        count = 0
-        for piece in self.board.pieces(chess.QUEEN, self.our_color):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return self._num_our_pieces_attacking_their_king_and_ring[chess.QUEEN]
 
     @cached_property
     def num_our_rooks_attacking_their_king_and_ring(self):
-        count = 0
-        for piece in self.board.pieces(chess.ROOK, self.our_color):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return self._num_our_pieces_attacking_their_king_and_ring[chess.ROOK]
 
     @cached_property
     def num_our_bishops_attacking_their_king_and_ring(self):
-        count = 0
-        for piece in self.board.pieces(chess.BISHOP, self.our_color):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return self._num_our_pieces_attacking_their_king_and_ring[chess.BISHOP]
 
     @cached_property
     def num_our_knights_attacking_their_king_and_ring(self):
-        count = 0
-        for piece in self.board.pieces(chess.KNIGHT, self.our_color):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return self._num_our_pieces_attacking_their_king_and_ring[chess.KNIGHT]
 
     @cached_property
     def num_our_pawns_attacking_their_king_and_ring(self):
-        count = 0
-        for piece in self.board.pieces(chess.PAWN, self.our_color):
-            piece_attacks_mask = self.board.attacks_mask(piece)
-            count += bool(self._their_king_ring_and_king_mask & piece_attacks_mask)
-        return count
+        return self._num_our_pieces_attacking_their_king_and_ring[chess.PAWN]
 
     @cached_property
     def checkmate_piece_type(self):
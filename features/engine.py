@@ -0,0 +1,396 @@
+"""
+Helpers shared by the engine backed feature classes.
+
+Time spent waiting for engines is accumulated on ENGINE_STOPWATCH so that it can be told apart from the time
+spent in Python, see utils.add_features. Analyses are memoized on engine_cache, keyed by (engine identity, fen,
+move, limit, multipv, stable depths), so that feature classes searching the same positions share them.
+analyse_games runs the rows of different games on a pool of supervised engines, which are restarted when they
+crash or hang. Rows that fail on every attempt, or with any other error, are recorded on dead_letters instead of
+failing the whole run.
+"""
+
+import codecs
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+import chess.engine
+import click
+
+from features.abstract import PositionCache
+
+# seconds a single row may take before its engine is killed and restarted
+ENGINE_TIMEOUT = float(os.environ.get("ENGINE_TIMEOUT", 120))
+# attempts of a row after the first one, each on a restarted engine
+ENGINE_RETRIES = int(os.environ.get("ENGINE_RETRIES", 2))
+# errors after which the engine is restarted and the row retried
+ENGINE_ERRORS = (chess.engine.EngineError, OSError, ValueError)
+# JSON lines file to append the rows that failed on every attempt to
+DEAD_LETTER_PATH = os.environ.get("DEAD_LETTER_PATH")
+# bytes to read from an engine pipe at once
+READ_SIZE = 65536
+
+_NEWLINE = re.compile("\n")
+
+
+class Stopwatch:
+    """
+    Accumulates the wall-clock time during which at least one `with stopwatch:` block runs. Blocks may run
+    concurrently in several threads, time they overlap is counted once, so the total never exceeds the elapsed
+    time.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._active = 0
+        self._start = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            if not self._active:
+                self._start = time.perf_counter()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self._active -= 1
+            if not self._active:
+                self.seconds += time.perf_counter() - self._start
+
+    def reset(self):
+        with self._lock:
+            self.seconds = 0.0
+
+
+ENGINE_STOPWATCH = Stopwatch()
+
+engine_cache = PositionCache()
+
+
+def engine_identity(engine):
+    """
+    Id (name and author) and option values of a python-chess engine. Part of the engine cache keys, so that engines
+    of different builds or settings do not share analyses.
+    """
+    return (
+        tuple(sorted(engine.id.items())),
+        tuple(sorted(engine.protocol.config.items())),
+    )
+
+
+class _TimedReader:
+    """
+    Reads the output of an engine from its file descriptor in chunks of whatever the engine wrote so far, so that
+    a block of many lines, e.g. an eval table, costs a few reads instead of one per line.
+    """
+
+    def __init__(self, stream, stopwatch):
+        self._fd = stream.fileno()
+        self._stopwatch = stopwatch
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+
+    def _fill(self):
+        with self._stopwatch:
+            chunk = os.read(self._fd, READ_SIZE)
+        if not chunk:
+            raise chess.engine.EngineTerminatedError("engine process died")
+        self._buffer += self._decoder.decode(chunk)
+
+    def read_until(self, pattern):
+        """
+        Reads up to and including the first match of the compiled regex pattern.
+        """
+        match = pattern.search(self._buffer)
+        while match is None:
+            self._fill()
+            match = pattern.search(self._buffer)
+        block = self._buffer[: match.end()]
+        self._buffer = self._buffer[match.end() :]
+        return block
+
+    def readline(self):
+        return self.read_until(_NEWLINE)
+
+
+class EnginePipe:
+    """
+    Text pipe to an engine process for the commands python-chess does not support, e.g. eval. Exposes stdin and
+    stdout like subprocess.Popen, reads from stdout are timed on the stopwatch and raise EngineTerminatedError
+    once the process died.
+    """
+
+    def __init__(self, path, stopwatch=ENGINE_STOPWATCH):
+        self.process = subprocess.Popen(
+            path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        self.stdin = self.process.stdin
+        self.stdout = _TimedReader(self.process.stdout, stopwatch)
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+    # named like the python-chess methods so that EngineSupervisor can close pipes too
+    def quit(self):
+        self.kill()
+
+    def close(self):
+        self.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.kill()
+
+
+class GameEngine:
+    """
+    Passes game to each analyse of a python-chess engine, which then only sends ucinewgame (clearing the hash
+    table) when the game changes. Other attributes, e.g. stdin and stdout of an EnginePipe, are the engine's.
+    """
+
+    def __init__(self, engine, game):
+        self.engine = engine
+        self.game = game
+
+    def analyse(self, board, *args, **kwargs):
+        return self.engine.analyse(board, *args, game=self.game, **kwargs)
+
+    def analysis(self, board, *args, **kwargs):
+        return self.engine.analysis(board, *args, game=self.game, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+
+def games(df, num_chunks=1):
+    """
+    Pairs of game id and the positions of its rows in df, in order of appearance. Without a game_id column df is
+    split into num_chunks runs of consecutive rows.
+    """
+    if "game_id" in df.columns:
+        res = {}
+        for i, game_id in enumerate(df.game_id):
+            res.setdefault(game_id, []).append(i)
+        return list(res.items())
+
+    size = max(-(-len(df) // num_chunks), 1)
+    return [
+        (None, list(range(start, min(start + size, len(df)))))
+        for start in range(0, len(df), size)
+    ]
+
+
+class EngineTimeout(chess.engine.EngineError):
+    """
+    Raised when the watchdog of an EngineSupervisor killed an engine that did not finish a row in time.
+    """
+
+
+class EngineSupervisor:
+    """
+    Owns an engine opened with open_engine, a python-chess engine or an EnginePipe, and restarts it when it fails.
+
+    run(analyse) calls analyse(engine) under a watchdog that closes the engine after timeout seconds, which makes
+    the blocked call fail. When the call fails with one of ENGINE_ERRORS the engine is restarted and the call is
+    retried up to retries times. Other errors restart the engine too but are raised right away. timeout and
+    retries default to ENGINE_TIMEOUT and ENGINE_RETRIES.
+    """
+
+    def __init__(self, open_engine, timeout=None, retries=None):
+        self._open_engine = open_engine
+        self.timeout = ENGINE_TIMEOUT if timeout is None else timeout
+        self.retries = ENGINE_RETRIES if retries is None else retries
+        self.restarts = 0
+        self.engine = open_engine()
+
+    def run(self, analyse):
+        for attempt in range(self.retries + 1):
+            timed_out = threading.Event()
+
+            def expire(engine=self.engine):
+                timed_out.set()
+                engine.close()
+
+            watchdog = threading.Timer(self.timeout, expire)
+            watchdog.start()
+            try:
+                res = analyse(self.engine)
+            except ENGINE_ERRORS as error:
+                self.restart()
+                if attempt == self.retries:
+                    if timed_out.is_set():
+                        raise EngineTimeout(
+                            "no result after {} seconds".format(self.timeout)
+                        ) from error
+                    raise
+            except Exception:
+                # analyse may have stopped half way through a reply, so the next call gets a fresh engine
+                self.restart()
+                raise
+            else:
+                if timed_out.is_set():
+                    # the result came in while the watchdog closed the engine
+                    self.restart()
+                return res
+            finally:
+                watchdog.cancel()
+
+    def restart(self):
+        self.engine.close()
+        self.engine = self._open_engine()
+        self.restarts += 1
+
+    def quit(self):
+        try:
+            self.engine.quit()
+        except ENGINE_ERRORS:
+            self.engine.close()
+
+
+class DeadLetters:
+    """
+    Rows that failed on every attempt of a supervised engine or with any other error. Each is kept as a dict with
+    the feature class, game, index, fen, error and traceback, and appended as a JSON line to path if set.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, label, game_id, row, error):
+        record = {
+            "feature": label,
+            "game_id": game_id,
+            "index": row.Index,
+            "fen": getattr(row, "fen", None),
+            "error": "{}: {}".format(type(error).__name__, error),
+            "traceback": "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            ),
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, "a") as fp:
+                    fp.write(json.dumps(record, default=str) + "\n")
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+dead_letters = DeadLetters(DEAD_LETTER_PATH)
+
+
+def analyse_games(df, analyse_row, open_engine, workers=1, label=None):
+    """
+    Returns analyse_row(row, engine) for each row of df, in order.
+
+    Each game is pinned to one of workers engines opened with open_engine, which analyses its plies in order
+    without clearing the hash table in between. Different games run in parallel. The engines are supervised, the
+    result of a row that fails on every attempt, or with an error other than ENGINE_ERRORS, is None and the row
+    is recorded on dead_letters.
+    """
+    rows = tuple(df.itertuples())
+    results = [None] * len(rows)
+
+    opened = [EngineSupervisor(open_engine) for _ in range(workers)]
+    supervisors = queue.Queue()
+    for supervisor in opened:
+        supervisors.put(supervisor)
+
+    def analyse_game(game):
+        game_id, positions = game
+        supervisor = supervisors.get()
+        try:
+            for i in positions:
+                try:
+                    results[i] = supervisor.run(
+                        lambda engine: analyse_row(rows[i], GameEngine(engine, game_id))
+                    )
+                except Exception as error:
+                    dead_letters.record(label, game_id, rows[i], error)
+        finally:
+            supervisors.put(supervisor)
+        return len(positions)
+
+    try:
+        with ThreadPool(workers) as pool, click.progressbar(
+            length=len(rows), label=label, file=sys.stderr
+        ) as bar:
+            for num_rows in pool.imap_unordered(analyse_game, games(df, workers)):
+                bar.update(num_rows)
+    finally:
+        for supervisor in opened:
+            supervisor.quit()
+    return results
+
+
+# info fields followed by a single integer
+INFO_INT_FIELDS = {
+    "depth",
+    "seldepth",
+    "multipv",
+    "nodes",
+    "nps",
+    "time",
+    "hashfull",
+    "tbhits",
+    "currmovenumber",
+}
+
+
+def parse_info(line, fields):
+    """
+    Decodes the fields of a UCI info line without building boards or moves, unlike chess.engine._parse_uci_info.
+
+    Depth and multipv are always decoded, score is split into score (centipawns) and mate, the pv into its first
+    move and the pv as a string of uci moves. Returns None for info lines without a score, e.g. currmove lines.
+    """
+    tokens = line.split()
+    if not tokens or tokens[0] != "info" or "score" not in tokens:
+        return None
+
+    info = {"multipv": 1}
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token in INFO_INT_FIELDS:
+            if token in fields or token in ("depth", "multipv"):
+                info[token] = int(tokens[i + 1])
+            i += 2
+        elif token == "score":
+            kind, value = tokens[i + 1], int(tokens[i + 2])
+            info["score"] = value if kind == "cp" else None
+            info["mate"] = value if kind == "mate" else None
+            i += 3
+        elif token == "pv":
+            if "move" in fields:
+                info["move"] = tokens[i + 1] if i + 1 < len(tokens) else None
+            if "pv" in fields:
+                info["pv"] = " ".join(tokens[i + 1 :])
+            break
+        elif token == "string":
+            break
+        else:
+            # lowerbound, upperbound, wdl values, currmove, ...
+            i += 1
+    return info if "depth" in info else None
@@ -1,14 +1,63 @@
+import json
 import os
-import click
+
+import numpy as np
 import pandas as pd
-import subprocess
-from functools import cached_property
 
 from features.abstract import Features
-
+from features.engine import EnginePipe, analyse_games
 
 # TODO: add link to forked version that prints features.
 ETHEREAL_PATH = os.environ.get("ETHEREAL_PATH", "../Ethereal/src/Ethereal")
+# number of Ethereal processes evaluating different games in parallel
+ETHEREAL_WORKERS = int(os.environ.get("ETHEREAL_WORKERS", 1))
+
+# features the fork prints for each color, e.g. w_isolated_pawns, parse_features rejects replies with other keys
+ETHEREAL_FEATURES = [
+    "isolated_pawns",
+    "bishop_rammed_pawns",
+    "bishops_behind_pawn",
+    "bishop_long_diagonal",
+    "rooks_on_seventh",
+    "queen_relative_pin",
+]
+ETHEREAL_COLUMNS = [
+    "{}_{}".format(side, name)
+    for name in ETHEREAL_FEATURES
+    for side in ["our", "their"]
+]
+# (key, side to move) to column index, built once instead of splitting keys per row
+_COLUMN_INDEX = {
+    ("{}_{}".format(color, name), turn): ETHEREAL_COLUMNS.index(
+        "{}_{}".format("our" if color == turn else "their", name)
+    )
+    for color in "wb"
+    for turn in "wb"
+    for name in ETHEREAL_FEATURES
+}
+_KEYS = {key for key, _ in _COLUMN_INDEX}
+
+
+def parse_features(line, turn):
+    """
+    Parses the JSON object of features the fork prints into a float32 vector ordered like ETHEREAL_COLUMNS, from
+    the point of view of turn ("w" or "b"). Raises ValueError unless the keys are exactly those of
+    ETHEREAL_FEATURES for both colors, so that features of a different fork are not silently dropped.
+    """
+    values = json.loads(line)
+    if not isinstance(values, dict):
+        raise ValueError("expected Ethereal features, got {!r}".format(line))
+    keys = set(values)
+    if keys != _KEYS:
+        raise ValueError(
+            "unexpected Ethereal features, unknown: {}, missing: {}".format(
+                sorted(keys - _KEYS), sorted(_KEYS - keys)
+            )
+        )
+    vector = np.empty(len(ETHEREAL_COLUMNS), dtype=np.float32)
+    for key, value in values.items():
+        vector[_COLUMN_INDEX[key, turn]] = value
+    return vector
 
 
 class EtherealEval(Features):
@@ -17,18 +66,12 @@ class EtherealEval(Features):
         p.stdin.write("go depth 1\n")
 
         p.stdout.readline()  # eval
-        features = eval(p.stdout.readline())
+        self.vector = parse_features(p.stdout.readline(), fen.split()[1])
         p.stdout.readline()  # bestmove
 
-        _features = {}
-        turn = fen.split()[1]
-        for feature, value in features.items():
-            color, name = feature.split("_", 1)
-            if color == turn:
-                _features["our_{}".format(name)] = value
-            else:
-                _features["their_{}".format(name)] = value
-        self._features = _features
+    @classmethod
+    def feature_names(cls):
+        return list(ETHEREAL_COLUMNS)
 
     @classmethod
     def from_row(cls, row, p):
@@ -36,23 +79,23 @@ class EtherealEval(Features):
 
     @classmethod
     def from_df(cls, df):
-        p = subprocess.Popen(
-            ETHEREAL_PATH,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1,
-        )
+        # rows the engine failed on stay NaN
+        vectors = np.full((len(df), len(ETHEREAL_COLUMNS)), np.nan, dtype=np.float32)
 
-        feature_rows = []
-        with click.progressbar(tuple(df.itertuples()), label=cls.__name__) as rows:
-            for row in rows:
-                feature_instance = cls.from_row(row, p)
-                feature_rows.append(feature_instance.features())
+        def evaluate(row, p):
+            vectors[row.Index] = cls.from_row(row, p).vector
 
-        p.kill()
-        return pd.DataFrame(feature_rows)
+        analyse_games(
+            df.reset_index(drop=True),
+            evaluate,
+            lambda: EnginePipe(ETHEREAL_PATH),
+            ETHEREAL_WORKERS,
+            label=cls.__name__,
+        )
+        return pd.DataFrame(vectors, columns=ETHEREAL_COLUMNS)
 
     def features(self):
-        return self._features
+        return {
+            name: None if np.isnan(value) else int(value)
+            for name, value in zip(ETHEREAL_COLUMNS, self.vector)
+        }
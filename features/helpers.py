@@ -39,6 +39,7 @@ def is_lower_equal_value(a, b):
 
 def count_material(board: chess.Board, color: bool) -> int:
     return sum(
-        PIECE_TYPE_VALUE[piece_type] * len(board.pieces(piece_type, color))
+        PIECE_TYPE_VALUE[piece_type]
+        * chess.popcount(board.pieces_mask(piece_type, color))
         for piece_type in chess.PIECE_TYPES
     )
@@ -1,6 +1,7 @@
 from functools import cached_property
 
 import chess
+import chess.polyglot
 
 from board import AugBoard
 from features.abstract import Features
@@ -10,11 +11,28 @@ from features.helpers import is_greater_value
 class Move(Features):
 
     csvs = ["lichess", "stockfish10"]
+    # columns of the position and the move
+    _columns = ("fen", "move")
 
     def __init__(self, fen, move):
         self.aug = AugBoard(fen)
         self.move = chess.Move.from_uci(move)
 
+    @classmethod
+    def from_row(cls, row):
+        fen_column, move_column = cls._columns
+        return cls(getattr(row, fen_column), getattr(row, move_column))
+
+    @classmethod
+    def position_key(cls, row):
+        fen_column, move_column = cls._columns
+        fen, move = getattr(row, fen_column), getattr(row, move_column)
+        if not isinstance(fen, str) or not isinstance(move, str):
+            return None
+        board = chess.Board(fen)
+        # the halfmove clock decides fifty-move draws, which the zobrist hash does not cover
+        return chess.polyglot.zobrist_hash(board), board.halfmove_clock, move
+
     @cached_property
     def piece_type(self):
         return self.aug.piece_type_at(self.move.from_square)
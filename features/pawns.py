@@ -1,6 +1,7 @@
 from functools import cached_property
 
 import chess
+import chess.polyglot
 
 from features.abstract import Features
 
@@ -10,16 +11,25 @@ class Pawns(Features):
     def __init__(self, fen):
         self.board = chess.Board(fen)
 
+    @classmethod
+    def position_key(cls, row):
+        return chess.polyglot.zobrist_hash(chess.Board(row.fen))
+
     @cached_property
     def our_doubled(self):
-        files = [chess.square_file(s) for s in self.board.pieces(self.board.turn, chess.PAWN)]
+        files = [
+            chess.square_file(s) for s in self.board.pieces(chess.PAWN, self.board.turn)
+        ]
         return len(files) - len(set(files))
 
     @cached_property
     def their_doubled(self):
-        files = [chess.square_file(s) for s in self.board.pieces(not self.board.turn, chess.PAWN)]
+        files = [
+            chess.square_file(s)
+            for s in self.board.pieces(chess.PAWN, not self.board.turn)
+        ]
         return len(files) - len(set(files))
 
 
-if __name__ == '__main__':
-    Pawns(chess.Board().fen()).features()
\ No newline at end of file
+if __name__ == "__main__":
+    Pawns(chess.Board().fen()).features()
@@ -1,4 +1,7 @@
-import json
+import time
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
 
 import chess
 
@@ -22,6 +25,7 @@ from board.threats import (
 )
 
 from board import Tactic
+from features.performance_eval.puzzles import read_puzzles
 
 TACTICS = [
     Tactic.FORK,
@@ -45,21 +49,21 @@ def tag_to_tactic(tag):
     }.get(tag)
 
 
-def load_puzzles(json_path, limit=None):
-    with open(json_path) as fp:
-        data = json.load(fp)
-    if limit is not None:
-        data = data[:limit]
-    for puzzle in data:
+def load_puzzles(path, limit=None):
+    for puzzle in read_puzzles(path, limit=limit):
         puzzle["tactics"] = {
             tactic
             for tactic in set(tag_to_tactic(tag) for tag in puzzle["tags"])
             if tactic is not None
         }
-    return data
+        yield puzzle
 
 
-def predict_tactics(puzzle, detectors, pv_limit=None):
+def predict_tactics(puzzle, detectors, pv_limit=None, seconds=None):
+    """
+    Runs the detectors on our moves of the puzzle's PV. If seconds is given, time spent in each detector is added
+    to seconds[tactic][j].
+    """
     fen = puzzle["fen"]
     pv = [chess.Move.from_uci(move_uci) for move_uci in puzzle["analysis"]["pv"]]
     board = chess.Board(fen)
@@ -75,7 +79,12 @@ def predict_tactics(puzzle, detectors, pv_limit=None):
         fen = board.fen()
         for tactic, tactic_detectors in detectors.items():
             for j, f in enumerate(tactic_detectors):
+                if seconds is None:
+                    res[tactic][j] |= f(fen, our_move)
+                    continue
+                start = time.perf_counter()
                 res[tactic][j] |= f(fen, our_move)
+                seconds[tactic][j] += time.perf_counter() - start
         board.push(our_move)
         if i + 1 < len(pv):
             their_move = pv[i + 1]
@@ -83,6 +92,116 @@ def predict_tactics(puzzle, detectors, pv_limit=None):
     return res
 
 
+def _safe_div(a, b):
+    return a / b if b else 0.0
+
+
+class Evaluation:
+    """
+    Confusion counts, time spent and a few example puzzles per detector. Evaluations of disjoint sets of
+    puzzles are combined with merge.
+    """
+
+    KINDS = ["tp", "fp", "fn", "tn"]
+
+    def __init__(self, detectors, num_examples=None):
+        self.num_examples = num_examples
+        self.num_puzzles = 0
+        self.num_positives = {tactic: 0 for tactic in detectors}
+        self.counts = {
+            tactic: [dict.fromkeys(self.KINDS, 0) for _ in tactic_detectors]
+            for tactic, tactic_detectors in detectors.items()
+        }
+        self.seconds = {
+            tactic: [0.0 for _ in tactic_detectors]
+            for tactic, tactic_detectors in detectors.items()
+        }
+        self.examples = {
+            tactic: [{kind: [] for kind in self.KINDS[:3]} for _ in tactic_detectors]
+            for tactic, tactic_detectors in detectors.items()
+        }
+
+    def add(self, puzzle, predictions):
+        self.num_puzzles += 1
+        for tactic, detector_preds in predictions.items():
+            t = tactic in puzzle["tactics"]
+            self.num_positives[tactic] += t
+            for j, pred in enumerate(detector_preds):
+                kind = ("tp" if t else "fp") if pred else ("fn" if t else "tn")
+                self.counts[tactic][j][kind] += 1
+                examples = self.examples[tactic][j].get(kind)
+                if examples is not None and len(examples) < (self.num_examples or 0):
+                    examples.append(puzzle)
+
+    def merge(self, other):
+        self.num_puzzles += other.num_puzzles
+        for tactic, detector_counts in other.counts.items():
+            self.num_positives[tactic] += other.num_positives[tactic]
+            for j, counts in enumerate(detector_counts):
+                for kind, count in counts.items():
+                    self.counts[tactic][j][kind] += count
+                self.seconds[tactic][j] += other.seconds[tactic][j]
+                for kind, examples in other.examples[tactic][j].items():
+                    missing = (self.num_examples or 0) - len(
+                        self.examples[tactic][j][kind]
+                    )
+                    self.examples[tactic][j][kind].extend(examples[:missing])
+        return self
+
+    def precision(self, tactic, j):
+        counts = self.counts[tactic][j]
+        return _safe_div(counts["tp"], counts["tp"] + counts["fp"])
+
+    def recall(self, tactic, j):
+        counts = self.counts[tactic][j]
+        return _safe_div(counts["tp"], counts["tp"] + counts["fn"])
+
+    def f1_score(self, tactic, j):
+        precision = self.precision(tactic, j)
+        recall = self.recall(tactic, j)
+        return _safe_div(2 * precision * recall, precision + recall)
+
+
+def evaluate_puzzles(puzzles, pv_limit=None, num_examples=None):
+    detectors = get_detectors()
+    evaluation = Evaluation(detectors, num_examples)
+    for puzzle in puzzles:
+        predictions = predict_tactics(
+            puzzle, detectors, pv_limit=pv_limit, seconds=evaluation.seconds
+        )
+        evaluation.add(puzzle, predictions)
+    return evaluation
+
+
+def _shards(puzzles, shard_size):
+    puzzles = iter(puzzles)
+    while True:
+        shard = list(islice(puzzles, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def evaluate(puzzles, pv_limit=None, num_examples=None, workers=1, shard_size=100):
+    """
+    Evaluates the detectors of get_detectors on shards of puzzles in a pool of worker processes and merges the
+    evaluations of the shards. Yields the merged evaluation after every shard.
+    """
+    evaluation = Evaluation(get_detectors(), num_examples)
+    evaluate_shard = partial(
+        evaluate_puzzles, pv_limit=pv_limit, num_examples=num_examples
+    )
+    shards = _shards(puzzles, shard_size)
+    if workers == 1:
+        for shard in shards:
+            yield evaluation.merge(evaluate_shard(shard))
+        return
+
+    with Pool(workers) as pool:
+        for shard_evaluation in pool.imap(evaluate_shard, shards):
+            yield evaluation.merge(shard_evaluation)
+
+
 def get_lichess_analysis_url(fen):
     return "http://lichess.org/analysis/{}".format("_".join(fen.split(" ")))
 
@@ -90,34 +209,48 @@ def get_lichess_analysis_url(fen):
 # feel free to comment out detectors that you don't want to run (it speeds up execution)
 def get_detectors():
     return {
-        Tactic.FORK: [is_fork_simplest, is_fork_simple, is_fork_see,],
+        Tactic.FORK: [
+            is_fork_simplest,
+            is_fork_simple,
+            is_fork_see,
+        ],
         Tactic.DISCOVERED_ATTACK: [
             is_discovered_attack_simple,
             is_discovered_attack_see,
         ],
-        "BackrankMate": [is_back_rank_mate,],
-        "SmotheredMate": [is_smothered_mate,],
+        "BackrankMate": [
+            is_back_rank_mate,
+        ],
+        "SmotheredMate": [
+            is_smothered_mate,
+        ],
         "ArabianMate": [
             is_arabian_mate_classic,
             is_arabian_mate_extended,
             is_arabian_mate_extra_extended,
         ],
-        Tactic.SKEWER: [is_skewer_see,],
-        Tactic.PIN: [is_pin_see,],
+        Tactic.SKEWER: [
+            is_skewer_see,
+        ],
+        Tactic.PIN: [
+            is_pin_see,
+        ],
     }
 
 
 if __name__ == "__main__":
 
     import argparse
+    import os
 
     from tqdm import tqdm
-    from sklearn import metrics
 
     parser = argparse.ArgumentParser(
         description="Evaluates performance of our features on puzzles."
     )
-    parser.add_argument("puzzle_path", help="Path to json file with augmented puzzles")
+    parser.add_argument(
+        "puzzle_path", help="Path to JSON lines file with augmented puzzles"
+    )
     parser.add_argument(
         "-l", "--limit", type=int, default=None, help="Limit of examples to process"
     )
@@ -131,72 +264,73 @@ if __name__ == "__main__":
         default=None,
         help="Number of wrong examples to be printed",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "-s",
+        "--shard_size",
+        type=int,
+        default=100,
+        help="Number of puzzles sent to a worker at once",
+    )
 
     args = parser.parse_args()
 
     puzzles = load_puzzles(args.puzzle_path, limit=args.limit)
 
-    detectors = get_detectors()
-    y_true = {
-        tactic: [tactic in puzzle["tactics"] for puzzle in puzzles]
-        for tactic in detectors.keys()
-    }
-    y_pred = {
-        tactic: [[] for _ in tactic_detectors]
-        for tactic, tactic_detectors in detectors.items()
-    }
+    start = time.perf_counter()
+    evaluation = None
+    with tqdm(total=args.limit) as progress_bar:
+        for evaluation in evaluate(
+            puzzles,
+            pv_limit=args.pv_limit,
+            num_examples=args.num_examples,
+            workers=args.workers,
+            shard_size=args.shard_size,
+        ):
+            progress_bar.update(evaluation.num_puzzles - progress_bar.n)
+    wall_time = time.perf_counter() - start
 
-    for puzzle in tqdm(puzzles):
+    if evaluation is None:
+        parser.exit(message="No puzzles to evaluate\n")
 
-        predictions = predict_tactics(puzzle, detectors, pv_limit=args.pv_limit)
-        for tactic, detector_preds in predictions.items():
-            for i, pred in enumerate(detector_preds):
-                y_pred[tactic][i].append(pred)
-
-    for tactic, detector_preds in y_pred.items():
-        num_examples = sum(y_true[tactic])
-        print(tactic, f"(num_examples={num_examples})")
-        yt = y_true[tactic]
-        for i, f in enumerate(detectors[tactic]):
+    print(
+        f"{evaluation.num_puzzles} puzzles in {wall_time:.1f}s "
+        f"({evaluation.num_puzzles / wall_time:.1f} puzzles/s, workers={args.workers})"
+    )
+    detectors = get_detectors()
+    for tactic, tactic_detectors in detectors.items():
+        print(tactic, f"(num_examples={evaluation.num_positives[tactic]})")
+        for i, f in enumerate(tactic_detectors):
             print("\t", f.__name__)
-            yp = y_pred[tactic][i]
-            print("\t\tPrecision", metrics.precision_score(yt, yp))
-            print("\t\tRecall", metrics.recall_score(yt, yp))
-            print("\t\tF1 Score", metrics.f1_score(yt, yp))
+            print("\t\tPrecision", evaluation.precision(tactic, i))
+            print("\t\tRecall", evaluation.recall(tactic, i))
+            print("\t\tF1 Score", evaluation.f1_score(tactic, i))
+            seconds = evaluation.seconds[tactic][i]
+            print(
+                "\t\tTime",
+                f"{seconds:.2f}s",
+                f"({evaluation.num_puzzles / seconds if seconds else 0:.1f} puzzles/s)",
+            )
 
             if args.num_examples is not None:
-                tps = [puzzles[j] for j, (t, p) in enumerate(zip(yt, yp)) if t and p]
-                fps = [
-                    puzzles[j] for j, (t, p) in enumerate(zip(yt, yp)) if not t and p
-                ]
-                tns = [
-                    puzzles[j] for j, (t, p) in enumerate(zip(yt, yp)) if t and not p
-                ]
-
-                print(f"\t\tTrue Positives ({len(tps)}):")
-                for j, puzzle in enumerate(tps[: args.num_examples]):
-                    print(
-                        "\t\t\t",
-                        j + 1,
-                        get_lichess_analysis_url(puzzle["fen"]),
-                        puzzle["analysis"]["pv"],
-                        puzzle["tags"],
-                    )
-                print(f"\t\tFalse Positives ({len(fps)}):")
-                for j, puzzle in enumerate(fps[: args.num_examples]):
-                    print(
-                        "\t\t\t",
-                        j + 1,
-                        get_lichess_analysis_url(puzzle["fen"]),
-                        puzzle["analysis"]["pv"],
-                        puzzle["tags"],
-                    )
-                print(f"\t\tTrue negatives ({len(tns)}):")
-                for j, puzzle in enumerate(tns[: args.num_examples]):
-                    print(
-                        "\t\t\t",
-                        j + 1,
-                        get_lichess_analysis_url(puzzle["fen"]),
-                        puzzle["analysis"]["pv"],
-                        puzzle["tags"],
-                    )
+                for kind, title in [
+                    ("tp", "True Positives"),
+                    ("fp", "False Positives"),
+                    ("fn", "True negatives"),
+                ]:
+                    count = evaluation.counts[tactic][i][kind]
+                    print(f"\t\t{title} ({count}):")
+                    for j, puzzle in enumerate(evaluation.examples[tactic][i][kind]):
+                        print(
+                            "\t\t\t",
+                            j + 1,
+                            get_lichess_analysis_url(puzzle["fen"]),
+                            puzzle["analysis"]["pv"],
+                            puzzle["tags"],
+                        )
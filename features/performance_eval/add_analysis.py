@@ -1,35 +1,135 @@
-import json
+import asyncio
+import itertools
+import os
+from collections import deque
 
 import chess
 import chess.engine
 
+from features.performance_eval.puzzles import read_puzzles, write_puzzles
 
-def load_puzzles(json_path):
-    with open(json_path) as fp:
-        data = json.load(fp)
-    return data
+ENGINE_PATH = "/usr/local/bin/stockfish"
+
+
+def parse_engine_options(options):
+    """
+    Turns ["Hash=64", "Threads=1"] into {"Hash": "64", "Threads": "1"}, values are parsed by the engine options.
+    """
+    return dict(option.split("=", 1) for option in options or [])
+
+
+def analysis_to_dict(res):
+    return {
+        "depth": res["depth"],
+        "score": res["score"].relative.score(),
+        "mate_score": res["score"].relative.mate(),
+        "pv": [move.uci() for move in res["pv"]],
+    }
 
 
 class PuzzleProcessor:
-    def __init__(self, engine_depth):
+    def __init__(self, engine_depth, engine_path=ENGINE_PATH, engine_options=None):
         self.engine_depth = engine_depth
+        self.engine_path = engine_path
+        self.engine_options = engine_options or {}
 
     def _process_puzzle(self, puzzle, engine):
         board = chess.Board(puzzle["fen"])
         res = engine.analyse(board, chess.engine.Limit(depth=self.engine_depth))
-        return {
-            "depth": res["depth"],
-            "score": res["score"].relative.score(),
-            "mate_score": res["score"].relative.mate(),
-            "pv": [move.uci() for move in res["pv"]],
-        }
+        return analysis_to_dict(res)
 
     def process_puzzles(self, puzzles):
-        engine = chess.engine.SimpleEngine.popen_uci("/usr/local/bin/stockfish")
+        engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        engine.configure(self.engine_options)
         for puzzle in puzzles:
             yield self._process_puzzle(puzzle, engine)
         engine.quit()
 
+    def augment_puzzles(self, puzzles):
+        """
+        Yields the puzzles with their analysis, puzzles are only kept in memory while they are analysed.
+        """
+        puzzles, to_analyse = itertools.tee(puzzles)
+        for puzzle, analysis in zip(puzzles, self.process_puzzles(to_analyse)):
+            puzzle["analysis"] = analysis
+            yield puzzle
+
+
+class AsyncPuzzleProcessor(PuzzleProcessor):
+    """
+    Analyses puzzles on a pool of engines running concurrently. Results are yielded in the order of the puzzles
+    as soon as they and all the puzzles before them are analysed, at most max_pending puzzles are in flight.
+    """
+
+    def __init__(
+        self,
+        engine_depth,
+        engine_paths=(ENGINE_PATH,),
+        engine_options=None,
+        num_engines=None,
+        max_pending=None,
+    ):
+        super().__init__(engine_depth, engine_paths[0], engine_options)
+        self.engine_paths = list(engine_paths)
+        self.num_engines = num_engines or len(self.engine_paths)
+        self.max_pending = max_pending or 4 * self.num_engines
+
+    async def _open_engine(self, path):
+        _, engine = await chess.engine.popen_uci(path)
+        await engine.configure(self.engine_options)
+        return engine
+
+    async def _process_puzzle_async(self, puzzle, engines):
+        engine = await engines.get()
+        try:
+            board = chess.Board(puzzle["fen"])
+            res = await engine.analyse(
+                board, chess.engine.Limit(depth=self.engine_depth)
+            )
+        finally:
+            engines.put_nowait(engine)
+        return analysis_to_dict(res)
+
+    async def analyse_puzzles(self, puzzles):
+        opened = await asyncio.gather(
+            *(
+                self._open_engine(self.engine_paths[i % len(self.engine_paths)])
+                for i in range(self.num_engines)
+            )
+        )
+        engines = asyncio.Queue()
+        for engine in opened:
+            engines.put_nowait(engine)
+
+        pending = deque()
+        try:
+            for puzzle in puzzles:
+                pending.append(
+                    asyncio.ensure_future(self._process_puzzle_async(puzzle, engines))
+                )
+                if len(pending) >= self.max_pending:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await asyncio.gather(*(engine.quit() for engine in opened))
+
+    def process_puzzles(self, puzzles):
+        loop = asyncio.new_event_loop()
+        results = self.analyse_puzzles(puzzles)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
+
 
 if __name__ == "__main__":
     import argparse
@@ -39,7 +139,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Augments puzzles with engine analysis."
     )
-    parser.add_argument("puzzle_path", help="Path to json file with puzzles")
+    parser.add_argument("puzzle_path", help="Path to JSON lines file with puzzles")
     parser.add_argument(
         "-d", "--engine_depth", type=int, default=10, help="Depth of the analysis"
     )
@@ -49,20 +149,33 @@ if __name__ == "__main__":
         action="store_true",
         help="Extends the existing pv rather than overriding it",
     )
+    parser.add_argument(
+        "-p",
+        "--engine_path",
+        action="append",
+        help="Path to an UCI engine, repeat to spread the engines over several binaries",
+    )
+    parser.add_argument(
+        "-n",
+        "--num_engines",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of engines running concurrently",
+    )
+    parser.add_argument(
+        "--engine_option",
+        action="append",
+        help="UCI option as name=value, e.g. Hash=64",
+    )
     parser.add_argument("-o", "--output_path", help="Path for the output")
 
     args = parser.parse_args()
 
-    puzzles = load_puzzles(args.puzzle_path)
-    p = PuzzleProcessor(engine_depth=args.engine_depth)
-
-    with tqdm(total=len(puzzles)) as progress_bar:
-        for analysis, puzzle in zip(p.process_puzzles(puzzles), puzzles):
-            puzzle["analysis"] = analysis
-            progress_bar.update(1)
-
-    if args.output_path is not None:
-        with open(args.output_path, "w") as fp:
-            json.dump(puzzles, fp)
-    else:
-        print(json.dumps(puzzles))
+    p = AsyncPuzzleProcessor(
+        engine_depth=args.engine_depth,
+        engine_paths=args.engine_path or [ENGINE_PATH],
+        engine_options=parse_engine_options(args.engine_option),
+        num_engines=args.num_engines,
+    )
+    puzzles = read_puzzles(args.puzzle_path)
+    write_puzzles(tqdm(p.augment_puzzles(puzzles)), args.output_path)
@@ -0,0 +1,55 @@
+"""
+Streaming reader and writer of puzzle files.
+
+Puzzles are stored as JSON lines, one puzzle per line, so they can be processed one at a time and a partially
+written file is still readable. Files holding a single JSON list of puzzles are read as well.
+"""
+
+import json
+import sys
+from itertools import islice
+
+
+def _iter_json_lines(fp):
+    for line in fp:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # the last line of a file that is still being written may be incomplete
+            if line.endswith("\n"):
+                raise
+            return
+
+
+def read_puzzles(path, limit=None):
+    with open(path) as fp:
+        first = fp.read(1)
+        while first.isspace():
+            first = fp.read(1)
+        fp.seek(0)
+
+        if first == "[":
+            puzzles = iter(json.load(fp))
+        else:
+            puzzles = _iter_json_lines(fp)
+        yield from islice(puzzles, limit)
+
+
+def write_puzzles(puzzles, path=None):
+    """
+    Writes puzzles as JSON lines to path or stdout and returns the number of puzzles written. Every line is
+    flushed as soon as it is written.
+    """
+    fp = open(path, "w") if path is not None else sys.stdout
+    count = 0
+    try:
+        for puzzle in puzzles:
+            fp.write(json.dumps(puzzle) + "\n")
+            fp.flush()
+            count += 1
+    finally:
+        if path is not None:
+            fp.close()
+    return count
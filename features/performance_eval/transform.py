@@ -17,9 +17,8 @@ def san_variation_to_san_moves(variation: str) -> list:
 class Lucas:
     @staticmethod
     def as_dict(fns_path, tag):
-        puzzles = []
         with open(fns_path) as fp:
-            for line in fp.readlines():
+            for line in fp:
                 fen, desc, variation_str = line.strip().split("|")
                 san_moves = san_variation_to_san_moves(variation_str)
                 pv = []
@@ -32,11 +31,12 @@ class Lucas:
                     continue
                 puzzle = {
                     "fen": fen,
-                    "analysis": {"pv": pv,},
+                    "analysis": {
+                        "pv": pv,
+                    },
                     "tags": [tag],
                 }
-                puzzles.append(puzzle)
-        return puzzles
+                yield puzzle
 
 
 class ChessPuzzleNet:
@@ -74,7 +74,6 @@ class ChessPuzzleNet:
 
     @staticmethod
     def as_dict(csv_path, select_tag=None):
-        puzzles = []
         # encoding specified to remove BOM
         # https://stackoverflow.com/a/49150749/948918
         with open(csv_path, newline="", encoding="utf-8-sig") as csvfile:
@@ -100,8 +99,7 @@ class ChessPuzzleNet:
                     "tags": sorted(tags),
                     "analysis": {"pv": [row["Move1"]]},
                 }
-                puzzles.append(puzzle)
-        return puzzles
+                yield puzzle
 
 
 def as_dict(file_path, source, tag=None, select_tag=None):
@@ -114,10 +112,11 @@ def as_dict(file_path, source, tag=None, select_tag=None):
 
 if __name__ == "__main__":
     import argparse
-    import json
+
+    from features.performance_eval.puzzles import write_puzzles
 
     parser = argparse.ArgumentParser(
-        description="Transforms puzzle from custom format to JSON."
+        description="Transforms puzzle from custom format to JSON lines."
     )
     parser.add_argument(
         "file_path", help="Path to file with puzzle data in custom format"
@@ -146,11 +145,8 @@ if __name__ == "__main__":
     )
 
     if args.random_shuffle:
+        data = list(data)
         random.seed(47)
         random.shuffle(data)
 
-    if args.output_path is not None:
-        with open(args.output_path, "w") as fp:
-            json.dump(data, fp)
-    else:
-        print(json.dumps(data))
+    write_puzzles(data, args.output_path)
@@ -1,36 +1,131 @@
 import os
-import subprocess
+import re
 from functools import cached_property
 
 import chess
 import chess.engine
-import click
+import numpy as np
 import pandas as pd
-from chess.engine import _parse_uci_info
 
 from features.abstract import Features
+from features.engine import (
+    ENGINE_STOPWATCH,
+    EnginePipe,
+    analyse_games,
+    engine_cache,
+    engine_identity,
+    parse_info,
+)
 
 STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH", "../Stockfish/src/stockfish")
 EVAL_STOCKFISH_PATH = os.environ.get(
     "EVAL_STOCKFISH_PATH", "../Stockfish\ copy/src/stockfish"
 )
-
-
-def stockfish_info(fen, move, engine, depth, multipv=None):
-    board = chess.Board(fen)
-    move = [chess.Move.from_uci(move)] if move else None
-    return engine.analyse(
-        board, root_moves=move, multipv=multipv, limit=chess.engine.Limit(depth=depth)
+# number of engines analysing different games in parallel
+STOCKFISH_WORKERS = int(os.environ.get("STOCKFISH_WORKERS", 1))
+
+MATE_SCORE = 100000
+# moves losing at most this many centipawns against the best move are good
+GOOD_MOVE_MAX_LOSS = 50
+# the best move is the only move if the second best is worse by at least this many centipawns
+ONLY_MOVE_MIN_GAP = 200
+# scores within this many centipawns count as stable, see stockfish_info
+STABLE_SCORE_MARGIN = 20
+
+
+def open_stockfish_pipe(multipv=None):
+    """
+    EnginePipe to Stockfish for the commands python-chess does not support, ready for the first position.
+    """
+    p = EnginePipe(STOCKFISH_PATH)
+    p.stdout.readline()  # read info line on init.
+    if multipv:
+        p.stdin.write("setoption name MultiPV value {}\n".format(multipv))
+    return p
+
+
+def _analyse_until_stable(engine, board, limit, multipv, root_moves, stable_depths):
+    with engine.analysis(
+        board, limit, multipv=multipv, root_moves=root_moves
+    ) as analysis:
+        # best move and score of each depth
+        best = {}
+        for info in analysis:
+            if info.get("multipv", 1) != 1 or "pv" not in info or "score" not in info:
+                continue
+            if info.get("lowerbound") or info.get("upperbound"):
+                continue
+            best[info["depth"]] = (
+                info["pv"][0],
+                info["score"].relative.score(mate_score=MATE_SCORE),
+            )
+            last = [best[depth] for depth in sorted(best)[-stable_depths:]]
+            scores = [score for _, score in last]
+            if (
+                len(last) == stable_depths
+                and len({move for move, _ in last}) == 1
+                and max(scores) - min(scores) <= STABLE_SCORE_MARGIN
+            ):
+                analysis.stop()
+                break
+        analysis.wait()
+    return analysis.info if multipv is None else analysis.multipv
+
+
+def stockfish_info(fen, move, engine, limit, multipv=None, stable_depths=None):
+    """
+    Analysis of fen, restricted to move if given. Consecutive analyses on one engine keep its hash table as
+    python-chess only sends ucinewgame when the game changes.
+
+    limit is a depth or a chess.engine.Limit combining depth, nodes and time budgets. With stable_depths the search
+    stops early once the best move stayed the same and its score within STABLE_SCORE_MARGIN for that many depths.
+    """
+    if not isinstance(limit, chess.engine.Limit):
+        limit = chess.engine.Limit(depth=limit)
+
+    key = (
+        engine_identity(engine),
+        fen,
+        move,
+        (limit.depth, limit.nodes, limit.time),
+        multipv,
+        stable_depths,
     )
+    info = engine_cache.get(key)
+    if info is None:
+        board = chess.Board(fen)
+        root_moves = [chess.Move.from_uci(move)] if move else None
+        with ENGINE_STOPWATCH:
+            if stable_depths:
+                info = _analyse_until_stable(
+                    engine, board, limit, multipv, root_moves, stable_depths
+                )
+            else:
+                info = engine.analyse(
+                    board, root_moves=root_moves, multipv=multipv, limit=limit
+                )
+        engine_cache.put(key, info)
+    return info
 
 
 class Stockfish(Features):
+    """
+    Best move of a search limited by _limit, see stockfish_info. The search feature reports the depth, nodes and
+    seconds the search actually took.
+    """
+
+    _limit = chess.engine.Limit(depth=10)
+    _stable_depths = None
 
     # TODO: create a stockfish class that uses popen and catches all depth evals and best moves.
-    # TODO: add a version that takes users move and analyzes it.
-    def __init__(self, fen, engine, depth, multipv):
+    def __init__(self, fen, engine, limit=None, multipv=None):
         self.info = stockfish_info(
-            fen=fen, move=None, engine=engine, depth=depth, multipv=multipv,
+            fen=fen,
+            move=None,
+            engine=engine,
+            limit=limit or self._limit,
+            multipv=multipv,
+            stable_depths=self._stable_depths,
         )
 
     @classmethod
@@ -39,16 +134,15 @@ class Stockfish(Features):
 
     @classmethod
     def from_df(cls, df):
-        engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
-
-        feature_rows = []
-        with click.progressbar(tuple(df.itertuples()), label=cls.__name__) as rows:
-            for row in rows:
-                feature_instance = cls.from_row(row, engine)
-                feature_rows.append(feature_instance.features())
-
-        engine.quit()
-        return pd.DataFrame(feature_rows)
+        feature_rows = analyse_games(
+            df,
+            lambda row, engine: cls.from_row(row, engine).features(),
+            lambda: chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH),
+            STOCKFISH_WORKERS,
+            label=cls.__name__,
+        )
+        # rows the engine failed on are left empty
+        return pd.DataFrame([features or {} for features in feature_rows])
 
     @cached_property
     def best_score(self):
@@ -66,247 +160,316 @@ class Stockfish(Features):
     def best_pv(self):
         return str([move.uci() for move in self.info["pv"]])
 
+    @cached_property
+    def search(self):
+        return {
+            "search_depth": self.info.get("depth"),
+            "search_nodes": self.info.get("nodes"),
+            "search_seconds": self.info.get("time"),
+        }
+
 
 class Stockfish10(Stockfish):
     def __init__(self, fen, engine):
         super().__init__(fen, engine, 10, None)
 
 
-class StockfishDepth(Features):
-    def __init__(self, fen, p):
-        p.stdin.write("position fen {}\n".format(fen))
-        p.stdin.write("go depth 10\n")
+class StockfishAdaptive(Stockfish):
+    """
+    Searches at most depth 20, a million nodes or half a second, and stops early once the score is stable, so
+    that a few hard positions do not dominate the time of a batch.
+    """
 
-        board = chess.Board(fen)
+    _limit = chess.engine.Limit(depth=20, nodes=1000000, time=0.5)
+    _stable_depths = 4
 
-        self.scores = []
-        self.mates = []
-        self.moves = []
-        self.pvs = []
-        for line in iter(p.stdout.readline, ""):
-            if "bestmove" in line:
-                break
 
-            info = _parse_uci_info(line.strip(), board)
+class StockfishUserMove(Stockfish):
+    """
+    Evaluation of the played move next to the best move. The played move is searched right after the best move
+    on the same engine, so the search starts from a warm hash table, and not at all if it is the best move.
+    """
 
-            self.scores.append(info["score"].relative.score())
-            self.mates.append(info["score"].relative.mate())
-            self.moves.append(info["pv"][0].uci())
-            self.pvs.append(str([move.uci() for move in info["pv"]]))
+    def __init__(self, fen, move, engine):
+        super().__init__(fen, engine)
+        if move == self.best_move:
+            self._user_info = self.info
+        else:
+            self._user_info = stockfish_info(
+                fen=fen,
+                move=move,
+                engine=engine,
+                limit=self._limit,
+                stable_depths=self._stable_depths,
+            )
 
     @classmethod
-    def from_row(cls, row, p):
-        return cls(row.fen, p)
+    def from_row(cls, row, engine):
+        return cls(row.fen, row.move, engine)
 
-    @classmethod
-    def from_df(cls, df):
-        p = subprocess.Popen(
-            STOCKFISH_PATH,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1,
-        )
-        p.stdout.readline()  # read info line on init.
+    @cached_property
+    def user_move_score(self):
+        return self._user_info["score"].relative.score()
 
-        feature_rows = []
-        with click.progressbar(tuple(df.itertuples()), label=cls.__name__) as rows:
-            for row in rows:
-                feature_instance = cls.from_row(row, p)
-                feature_rows.append(feature_instance.features())
+    @cached_property
+    def user_move_mate(self):
+        return self._user_info["score"].relative.mate()
 
-        p.kill()
-        return pd.DataFrame(feature_rows)
+    @cached_property
+    def user_move_is_best(self):
+        return self._user_info is self.info
 
     @cached_property
-    def scores(self):
-        return self.scores
+    def user_move_score_loss(self):
+        best = self.info["score"].relative.score(mate_score=MATE_SCORE)
+        user = self._user_info["score"].relative.score(mate_score=MATE_SCORE)
+        return max(best - user, 0)
+
+
+class StockfishMultiPV(Stockfish):
+    """
+    The top moves of a single MultiPV search and how much better the best move is than the alternatives. Mates
+    are scored as MATE_SCORE minus the number of moves to mate, good moves are only counted among the top moves.
+    """
+
+    _multipv = 5
+
+    def __init__(self, fen, engine):
+        super().__init__(fen, engine, multipv=self._multipv)
+        self._infos = self.info
+        self.info = self._infos[0]
 
     @cached_property
-    def mates(self):
-        return self.mates
+    def _scores(self):
+        return [
+            info["score"].relative.score(mate_score=MATE_SCORE) for info in self._infos
+        ]
 
     @cached_property
-    def moves(self):
-        return self.moves
+    def multipv(self):
+        res = {}
+        for i in range(self._multipv):
+            info = self._infos[i] if i < len(self._infos) else None
+            prefix = "multipv_{}".format(i + 1)
+            res[prefix + "_move"] = info["pv"][0].uci() if info else None
+            res[prefix + "_score"] = info["score"].relative.score() if info else None
+            res[prefix + "_mate"] = info["score"].relative.mate() if info else None
+            res[prefix + "_pv"] = (
+                str([move.uci() for move in info["pv"]]) if info else None
+            )
+        return res
 
     @cached_property
-    def pvs(self):
-        return self.pvs
+    def best_second_gap(self):
+        if len(self._scores) < 2:
+            return None
+        return self._scores[0] - self._scores[1]
 
+    @cached_property
+    def number_of_good_moves(self):
+        return sum(
+            self._scores[0] - score <= GOOD_MOVE_MAX_LOSS for score in self._scores
+        )
 
-class StockfishEval(Features):
-    def __init__(self, fen, p):
+    @cached_property
+    def is_only_move(self):
+        return len(self._scores) == 1 or self.best_second_gap >= ONLY_MOVE_MIN_GAP
 
-        print(fen)
 
-        board = chess.Board(fen)
-        p.stdin.write("position fen {}\n".format(fen))
-        p.stdin.write("eval\n")
+class StockfishDepth(Features):
+    """
+    Score, mate, best move, pv, nodes and time at each of depths, captured from the info lines of a single search.
+    With multipv > 1 the columns of the k-th line are prefixed with depth_{d}_multipv_{k} instead of depth_{d}.
+    Subclasses pick the depths, multipv and fields through the underscored class attributes, see configure.
+    """
 
-        def _parse_score(score):
-            if score == "----":
-                return None
-            else:
-                return float(score)
+    _depths = tuple(range(1, 11))
+    _multipv = 1
+    _fields = ("score", "mate", "move", "pv", "nodes", "time")
 
-        for i, line in enumerate(iter(p.stdout.readline, "")):
+    def __init__(self, fen, p):
+        depths, multipv, fields = self._depths, self._multipv, self._fields
 
-            print(line)
+        p.stdin.write("position fen {}\n".format(fen))
+        p.stdin.write("go depth {}\n".format(max(depths)))
 
-            if "Total evaluation: none (in check)" in line:
-                # p.stdout.readline()
+        infos = {}
+        for line in iter(p.stdout.readline, ""):
+            if line.startswith("bestmove"):
                 break
 
-            if "Total evaluation" in line:
-                p.stdout.readline()
-                break
+            info = parse_info(line, fields)
+            # the last line of a depth wins over earlier lowerbound and upperbound lines
+            if info is not None and info["multipv"] <= multipv:
+                infos[info["depth"], info["multipv"]] = info
+
+        self._features = {
+            name: infos.get(key, {}).get(field)
+            for name, key, field in self._columns(depths, multipv, fields)
+        }
 
-            if i >= 3 and i <= 15:
-                term, white, black, total = line.split("|")
-                term = term.strip().lower()
-                white_mg, white_eg = white.split()
-                black_mg, black_eg = black.split()
-                total_mg, total_eg = total.split()
-
-                white_mg = _parse_score(white_mg)
-                white_eg = _parse_score(white_eg)
-                black_mg = _parse_score(black_mg)
-                black_eg = _parse_score(black_eg)
-                total_mg = _parse_score(total_mg)
-                total_eg = _parse_score(total_eg)
-
-                # TODO: how to make these properties
-                if board.turn == chess.WHITE:
-                    setattr(self, "our_{}_mg".format(term), white_mg)
-                    setattr(self, "our_{}_eg".format(term), white_eg)
-                    setattr(self, "their_{}_mg".format(term), black_mg)
-                    setattr(self, "their_{}_eg".format(term), black_eg)
-                    setattr(self, "total_{}_mg".format(term), total_mg)
-                    setattr(self, "total_{}_eg".format(term), total_eg)
+    @classmethod
+    def configure(cls, depths=None, multipv=None, fields=None):
+        """
+        Subclass capturing the given depths, multipv and fields instead, so that feature_names and from_df agree
+        with the features of its instances.
+        """
+        return type(
+            cls.__name__,
+            (cls,),
+            {
+                "_depths": tuple(depths or cls._depths),
+                "_multipv": multipv or cls._multipv,
+                "_fields": tuple(fields or cls._fields),
+            },
+        )
+
+    @staticmethod
+    def _columns(depths, multipv, fields):
+        for depth in depths:
+            for k in range(1, multipv + 1):
+                if k == 1:
+                    prefix = "depth_{}".format(depth)
                 else:
-                    setattr(self, "our_{}_mg".format(term), black_mg)
-                    setattr(self, "our_{}_eg".format(term), black_eg)
-                    setattr(self, "their_{}_mg".format(term), white_mg)
-                    setattr(self, "their_{}_eg".format(term), white_eg)
-                    setattr(self, "total_{}_mg".format(term), -total_mg)
-                    setattr(self, "total_{}_eg".format(term), -total_eg)
-
-    # TODO: create stockfish pipe class so we can share this with StockfishDepth
+                    prefix = "depth_{}_multipv_{}".format(depth, k)
+                for field in fields:
+                    yield "{}_{}".format(prefix, field), (depth, k), field
+
+    @classmethod
+    def feature_names(cls):
+        return [
+            name for name, _, _ in cls._columns(cls._depths, cls._multipv, cls._fields)
+        ]
+
+    @classmethod
+    def from_row(cls, row, p):
+        return cls(row.fen, p)
+
+    @classmethod
+    def from_df(cls, df):
+        feature_rows = analyse_games(
+            df,
+            lambda row, p: cls.from_row(row, p).features(),
+            lambda: open_stockfish_pipe(cls._multipv),
+            STOCKFISH_WORKERS,
+            label=cls.__name__,
+        )
+        dtypes = {
+            name: "string" if field in ("move", "pv") else "Int64"
+            for name, _, field in cls._columns(cls._depths, cls._multipv, cls._fields)
+        }
+        return pd.DataFrame(
+            [features or {} for features in feature_rows], columns=cls.feature_names()
+        ).astype(dtypes)
+
+    def features(self):
+        return self._features
+
+
+# terms of the Stockfish 11 eval table, in the order of the StockfishEval columns
+EVAL_TERMS = [
+    "material",
+    "imbalance",
+    "initiative",
+    "pawns",
+    "knights",
+    "bishops",
+    "rooks",
+    "queens",
+    "mobility",
+    "king safety",
+    "threats",
+    "passed",
+    "space",
+]
+EVAL_SIDES = ["our", "their", "total"]
+EVAL_PHASES = ["mg", "eg"]
+EVAL_COLUMNS = [
+    "{}_{}_{}".format(side, term, phase)
+    for side in EVAL_SIDES
+    for term in EVAL_TERMS
+    for phase in EVAL_PHASES
+]
+_EVAL_TERM_INDEX = {term: i for i, term in enumerate(EVAL_TERMS)}
+# in check the total is the last line, otherwise the line after it is
+_EVAL_END = re.compile(
+    r"^Total evaluation: (none \(in check\)\n|.*\n.*\n)", re.MULTILINE
+)
+
+
+def read_eval(p):
+    """
+    Reads the lines Stockfish prints for eval up to and including the line after the total evaluation, in one
+    buffered read of the whole block where the engine already wrote it.
+    """
+    return p.stdout.read_until(_EVAL_END).splitlines(keepends=True)
+
+
+def parse_eval(lines, turn):
+    """
+    Maps the terms of an eval table by name to a float32 vector ordered like EVAL_COLUMNS, from the point of view
+    of turn. Terms printed as ---- and terms missing from the table, e.g. all of them in check, are NaN.
+    """
+    # terms x (white mg, white eg, black mg, black eg, total mg, total eg)
+    table = np.full((len(EVAL_TERMS), 6), np.nan, dtype=np.float32)
+    for line in lines:
+        cells = line.split("|")
+        if len(cells) != 4:
+            continue
+        i = _EVAL_TERM_INDEX.get(cells[0].strip().lower())
+        if i is None:
+            continue
+        values = " ".join(cells[1:]).split()
+        table[i] = [np.nan if value == "----" else float(value) for value in values]
+
+    white, black, total = table[:, 0:2], table[:, 2:4], table[:, 4:6]
+    if turn == chess.WHITE:
+        sides = [white, black, total]
+    else:
+        sides = [black, white, -total]
+    return np.stack(sides).reshape(-1)
+
+
+class StockfishEval(Features):
+    """
+    Stockfish 11 eval terms of our side, their side and the total in the middle and end game, see EVAL_COLUMNS.
+    """
+
+    def __init__(self, fen, p):
+        p.stdin.write("position fen {}\n".format(fen))
+        p.stdin.write("eval\n")
+        self.vector = parse_eval(read_eval(p), chess.Board(fen).turn)
+
+    @classmethod
+    def feature_names(cls):
+        return list(EVAL_COLUMNS)
+
+    def features(self):
+        return {
+            name: None if np.isnan(value) else round(float(value), 2)
+            for name, value in zip(EVAL_COLUMNS, self.vector)
+        }
+
     @classmethod
     def from_row(cls, row, p):
         return cls(row.fen, p)
 
     @classmethod
     def from_df(cls, df):
-        p = subprocess.Popen(
-            STOCKFISH_PATH,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1,
+        # rows the engine failed on stay NaN
+        vectors = np.full((len(df), len(EVAL_COLUMNS)), np.nan, dtype=np.float32)
+
+        def evaluate(row, p):
+            vectors[row.Index] = cls.from_row(row, p).vector
+
+        analyse_games(
+            df.reset_index(drop=True),
+            evaluate,
+            open_stockfish_pipe,
+            STOCKFISH_WORKERS,
+            label=cls.__name__,
         )
-        p.stdout.readline()  # read info line on init.
-
-        feature_rows = []
-        with click.progressbar(tuple(df.itertuples())) as rows:
-            for row in rows:
-                feature_instance = cls.from_row(row, p)
-                feature_rows.append(feature_instance.features())
-
-        p.kill()
-        return pd.DataFrame(feature_rows)
-
-
-# TODO: disgusting hack because feature class expects dir(cls) to expose all features which only works if they are defined as methods but for StockfishEval, we set them all as attributes in __init__. Need to think about how to refactor this.
-for feature in [
-    "our_bishops_eg",
-    "our_bishops_mg",
-    "our_imbalance_eg",
-    "our_imbalance_mg",
-    "our_initiative_eg",
-    "our_initiative_mg",
-    "our_king safety_eg",
-    "our_king safety_mg",
-    "our_knights_eg",
-    "our_knights_mg",
-    "our_material_eg",
-    "our_material_mg",
-    "our_mobility_eg",
-    "our_mobility_mg",
-    "our_passed_eg",
-    "our_passed_mg",
-    "our_pawns_eg",
-    "our_pawns_mg",
-    "our_queens_eg",
-    "our_queens_mg",
-    "our_rooks_eg",
-    "our_rooks_mg",
-    "our_space_eg",
-    "our_space_mg",
-    "our_threats_eg",
-    "our_threats_mg",
-    "their_bishops_eg",
-    "their_bishops_mg",
-    "their_imbalance_eg",
-    "their_imbalance_mg",
-    "their_initiative_eg",
-    "their_initiative_mg",
-    "their_king safety_eg",
-    "their_king safety_mg",
-    "their_knights_eg",
-    "their_knights_mg",
-    "their_material_eg",
-    "their_material_mg",
-    "their_mobility_eg",
-    "their_mobility_mg",
-    "their_passed_eg",
-    "their_passed_mg",
-    "their_pawns_eg",
-    "their_pawns_mg",
-    "their_queens_eg",
-    "their_queens_mg",
-    "their_rooks_eg",
-    "their_rooks_mg",
-    "their_space_eg",
-    "their_space_mg",
-    "their_threats_eg",
-    "their_threats_mg",
-    "total_bishops_eg",
-    "total_bishops_mg",
-    "total_imbalance_eg",
-    "total_imbalance_mg",
-    "total_initiative_eg",
-    "total_initiative_mg",
-    "total_king safety_eg",
-    "total_king safety_mg",
-    "total_knights_eg",
-    "total_knights_mg",
-    "total_material_eg",
-    "total_material_mg",
-    "total_mobility_eg",
-    "total_mobility_mg",
-    "total_passed_eg",
-    "total_passed_mg",
-    "total_pawns_eg",
-    "total_pawns_mg",
-    "total_queens_eg",
-    "total_queens_mg",
-    "total_rooks_eg",
-    "total_rooks_mg",
-    "total_space_eg",
-    "total_space_mg",
-    "total_threats_eg",
-    "total_threats_mg",
-]:
-    setattr(StockfishEval, feature, None)
-
-# TODO: how to store scores and pvs?
-# class Stockfish5_500(Stockfish):
-#     def __init__(self, fen, engine):
-#         super().__init__(fen, engine, 5, 500)
+        return pd.DataFrame(vectors, columns=EVAL_COLUMNS)
 
 
 # def get_modified_stockfish_process():
@@ -5,5 +5,6 @@ setup(
     entry_points="""
         [console_scripts]
         csv=cli:csv
+        csv-worker=cli:worker
     """,
 )
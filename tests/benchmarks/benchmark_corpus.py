@@ -0,0 +1,79 @@
+"""
+Fixed position corpora for the benchmarks: the positions of pgns/test.pgn and the FENs (and moves) used in
+tests/test_features.py.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+import chess
+
+import utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PGN_PATH = os.path.join(ROOT, "pgns", "test.pgn")
+TEST_FEATURES_PATH = os.path.join(ROOT, "tests", "test_features.py")
+
+NUM_ROWS = 1000
+PV_LENGTH = 6
+
+_FEN_MOVE_RE = re.compile(
+    r'"([^"]+ [wb] [-KQkq]+ [-a-h1-8]+ \d+ \d+)",\s*"([a-h][1-8][a-h][1-8][qrbn]?)"'
+)
+_FEN_RE = re.compile(r'"([^"]+ [wb] [-KQkq]+ [-a-h1-8]+ \d+ \d+)"')
+
+
+@lru_cache(maxsize=None)
+def game_rows():
+    """
+    Rows of utils.pgn_to_df for pgns/test.pgn with the game continuation as best_move and best_pv and the
+    previous row of the game as prev_fen and prev_move.
+    """
+    with open(PGN_PATH) as pgn:
+        df = utils.pgn_to_df(pgn, NUM_ROWS)
+    df["prev_fen"] = df.groupby("game_id", sort=False).fen.shift()
+    df["prev_move"] = df.groupby("game_id", sort=False).move.shift()
+
+    best_pvs = []
+    for _, game in df.groupby("game_id", sort=False):
+        moves = list(game.move)
+        best_pvs.extend(str(moves[i : i + PV_LENGTH]) for i in range(len(moves)))
+    df["best_move"] = df.move
+    df["best_pv"] = best_pvs
+    return df[df.prev_fen.notnull()].reset_index(drop=True)
+
+
+@lru_cache(maxsize=None)
+def _test_features_source():
+    with open(TEST_FEATURES_PATH) as fp:
+        return fp.read()
+
+
+@lru_cache(maxsize=None)
+def fens():
+    candidates = list(game_rows().fen) + _FEN_RE.findall(_test_features_source())
+    res = []
+    for fen in dict.fromkeys(candidates):
+        try:
+            chess.Board(fen)
+        except ValueError:
+            continue
+        res.append(fen)
+    return tuple(res)
+
+
+@lru_cache(maxsize=None)
+def moves():
+    """
+    Legal (fen, move) pairs.
+    """
+    candidates = list(zip(game_rows().fen, game_rows().move))
+    candidates += _FEN_MOVE_RE.findall(_test_features_source())
+    res = []
+    for fen, uci in dict.fromkeys(candidates):
+        board = chess.Board(fen)
+        move = chess.Move.from_uci(uci)
+        if board.is_legal(move):
+            res.append((fen, move))
+    return tuple(res)
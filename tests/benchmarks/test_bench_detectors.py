@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import chess
+
+from board import AugBoard, CheckmateType, PawnStructure, Tactic, Threat
+from board.structures import pawn_bitboards
+
+import benchmark_corpus
+
+ROUNDS = 5
+
+DETECTORS = [
+    pytest.param(detector, id=f"{type(value).__name__}.{value.name}")
+    for enum in [Tactic, Threat, CheckmateType]
+    for value, detector in enum.detectors().items()
+]
+
+
+@pytest.mark.parametrize("detector", DETECTORS)
+def test_bench_detector(benchmark, detector):
+    moves = benchmark_corpus.moves()
+    benchmark.pedantic(
+        lambda: [detector(fen, move) for fen, move in moves],
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+
+
+def test_bench_see(benchmark):
+    captures = []
+    for fen in benchmark_corpus.fens():
+        aug = AugBoard(fen)
+        captures.extend(
+            (aug, square)
+            for square in chess.SquareSet(aug.occupied_co(not aug.current_color))
+            if aug.square_capturers(square)
+        )
+    benchmark.pedantic(
+        lambda: [aug.see(square) for aug, square in captures],
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+
+
+def test_bench_pawn_structure_classify(benchmark):
+    bitboards = [pawn_bitboards(fen) for fen in benchmark_corpus.fens()]
+    benchmark(lambda: [PawnStructure.classify(w, b) for w, b in bitboards])
+
+
+def test_bench_pawn_structure_detectors(benchmark):
+    fens = benchmark_corpus.fens()
+    detectors = PawnStructure.detectors()
+    benchmark.pedantic(
+        lambda: [detector(fen) for fen in fens for detector in detectors.values()],
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
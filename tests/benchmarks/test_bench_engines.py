@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import features
+import features.ethereal
+import features.stockfish
+from features.engine import engine_cache
+
+import benchmark_corpus
+
+ROUNDS = 3
+NUM_ROWS = 100
+
+# the engine backed feature classes against tests/fake_engine.py, which measures the Python side of them: the
+# engine pipes, info parsing and the scheduling of games onto engines
+ENGINE_FEATURE_CLASSES = [
+    ("stockfish", features.Stockfish10),
+    ("stockfish", features.StockfishMultiPV),
+    ("stockfish", features.StockfishDepth),
+    ("stockfish", features.StockfishEval),
+    ("ethereal", features.EtherealEval),
+]
+
+
+@pytest.mark.parametrize(
+    "mode, feature_class",
+    ENGINE_FEATURE_CLASSES,
+    ids=[cls.__name__ for _, cls in ENGINE_FEATURE_CLASSES],
+)
+def test_bench_engine_features(
+    benchmark, fake_engine, monkeypatch, mode, feature_class
+):
+    path = fake_engine(mode=mode)
+    # keep the time spent searching in the fake engine small against the Python side
+    monkeypatch.setenv("FAKE_ENGINE_SEARCH_DEPTH", "1")
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", path)
+    monkeypatch.setattr(features.ethereal, "ETHEREAL_PATH", path)
+    df = benchmark_corpus.game_rows()[:NUM_ROWS]
+
+    benchmark.pedantic(
+        feature_class.from_df,
+        args=(df,),
+        # searches are memoized, every round starts from an empty cache
+        setup=engine_cache.clear,
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
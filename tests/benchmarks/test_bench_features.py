@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import chess.pgn
+import numpy as np
+
+import features
+import utils
+from board import encoding
+from features import bitboards
+from features.pawns import Pawns
+
+import benchmark_corpus
+
+ROUNDS = 5
+
+# the Stockfish and Ethereal feature classes are left out as they need engine binaries
+FEATURE_CLASSES = [
+    features.Board,
+    Pawns,
+    features.BestMove,
+    features.UserMove,
+    features.PrevMove,
+    features.BestPV,
+    features.Checkmate,
+    features.CheckmateType,
+    features.Clock,
+    features.Opening,
+]
+
+# Clock needs the clock annotations of the games
+REQUIRED_COLUMNS = {features.Clock: ["clock"]}
+
+
+@pytest.mark.parametrize(
+    "feature_class", FEATURE_CLASSES, ids=[cls.__name__ for cls in FEATURE_CLASSES]
+)
+def test_bench_features(benchmark, feature_class):
+    df = benchmark_corpus.game_rows().dropna(
+        subset=REQUIRED_COLUMNS.get(feature_class, [])
+    )
+    if df.empty:
+        pytest.skip("no rows with {}".format(REQUIRED_COLUMNS[feature_class]))
+
+    rows = tuple(df.itertuples())
+    benchmark.pedantic(
+        lambda: [feature_class.from_row(row).features() for row in rows],
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+
+
+def test_bench_board_features_vectorized(benchmark):
+    positions = encoding.encode_many(
+        chess.Board(fen) for fen in benchmark_corpus.fens()
+    )
+    positions = np.tile(positions, 100)
+    benchmark(bitboards.board_features, positions)
+
+
+def test_bench_pgn_to_df(benchmark):
+    def pgn_to_df():
+        with open(benchmark_corpus.PGN_PATH) as pgn:
+            return utils.pgn_to_df(pgn, benchmark_corpus.NUM_ROWS)
+
+    benchmark.pedantic(pgn_to_df, rounds=ROUNDS, warmup_rounds=1)
+
+
+def test_bench_game_to_rows(benchmark):
+    with open(benchmark_corpus.PGN_PATH) as pgn:
+        game = chess.pgn.read_game(pgn)
+    benchmark(utils.game_to_rows, game)
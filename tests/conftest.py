@@ -0,0 +1,47 @@
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+from features.engine import dead_letters, engine_cache
+
+FAKE_ENGINE_PATH = os.path.join(os.path.dirname(__file__), "fake_engine.py")
+PGN_PATH = os.path.join(os.path.dirname(__file__), "..", "pgns", "test.pgn")
+
+
+@pytest.fixture
+def fake_engine(monkeypatch, tmp_path):
+    """
+    Returns a function that configures tests/fake_engine.py and returns the command to start it with. Clears the
+    engine cache, which does not tell fake engines with different tables apart, and the dead letters.
+    """
+    engine_cache.clear()
+    dead_letters.clear()
+
+    def configure(mode="stockfish", table=None, latency=0):
+        monkeypatch.setenv("FAKE_ENGINE_MODE", mode)
+        monkeypatch.setenv("FAKE_ENGINE_LATENCY", str(latency))
+        if table is None:
+            monkeypatch.delenv("FAKE_ENGINE_TABLE", raising=False)
+        else:
+            table_path = tmp_path / "fake_engine_table.json"
+            table_path.write_text(json.dumps(table))
+            monkeypatch.setenv("FAKE_ENGINE_TABLE", str(table_path))
+        return [sys.executable, FAKE_ENGINE_PATH]
+
+    return configure
+
+
+@pytest.fixture
+def workdir(monkeypatch, tmp_path):
+    """
+    Runs the test in a copy of the pgns directory layout under tmp_path, so that csv writes its output there
+    instead of into csvs/ of the repository.
+    """
+    os.makedirs(tmp_path / "pgns")
+    os.makedirs(tmp_path / "csvs")
+    shutil.copy(PGN_PATH, tmp_path / "pgns")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Deterministic fake UCI engine for tests and benchmarks.
+
+Speaks enough UCI for python-chess (uci, isready, setoption, ucinewgame, position, go, stop, quit) plus the
+Stockfish 11 `eval` table and the feature dict the forked Ethereal prints on `go`. Positions found in the table
+are answered from it, other positions with a small material search. A table entry with "fault": "crash" makes
+the engine exit on go and eval of the position, "fault": "hang" makes it stop answering. With "faults": n only the
+first n of these commands fail, counted over all processes in a file next to the table.
+
+Configured through the environment, as the feature classes only know the engine path:
+
+    FAKE_ENGINE_MODE          stockfish (default) or ethereal
+    FAKE_ENGINE_TABLE         JSON file mapping fens to {"score" | "mate", "pv", "eval", "features", "fault",
+                              "faults"}
+    FAKE_ENGINE_LATENCY       seconds to sleep per go command, default 0
+    FAKE_ENGINE_DEPTH_LATENCY seconds to sleep per iteration of a search, default 0
+    FAKE_ENGINE_SEARCH_DEPTH  maximal depth of the material search, default 2
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import chess
+
+NAME = "FakeEngine"
+BANNER = "{} by chess-concepts".format(NAME)
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 300,
+    chess.BISHOP: 300,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+MATE_SCORE = 100000
+# depth of searches limited by nodes or movetime only
+MAX_DEPTH = 64
+NODES_PER_LINE = 1000
+
+EVAL_TERMS = [
+    "Material",
+    "Imbalance",
+    "Initiative",
+    "Pawns",
+    "Knights",
+    "Bishops",
+    "Rooks",
+    "Queens",
+    "Mobility",
+    "King safety",
+    "Threats",
+    "Passed",
+    "Space",
+]
+# Stockfish prints ---- for the terms it does not split by color
+UNSPLIT_EVAL_TERMS = {"Material", "Imbalance", "Initiative"}
+
+BB_LONG_DIAGONALS = (
+    chess.BB_RAYS[chess.A1][chess.H8] | chess.BB_RAYS[chess.A8][chess.H1]
+)
+BB_CENTER = chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5
+
+
+def table_key(fen):
+    return " ".join(fen.split()[:4])
+
+
+def load_table(path):
+    if not path:
+        return {}
+    with open(path) as fp:
+        return {table_key(fen): entry for fen, entry in json.load(fp).items()}
+
+
+def material(board, color):
+    return sum(
+        value * len(board.pieces(piece_type, color))
+        for piece_type, value in PIECE_VALUES.items()
+    )
+
+
+def evaluate(board):
+    return material(board, board.turn) - material(board, not board.turn)
+
+
+def ordered_moves(board, root_moves=None):
+    moves = root_moves if root_moves else list(board.legal_moves)
+    return sorted(moves, key=lambda move: move.uci())
+
+
+def negamax(board, depth, alpha, beta, ply):
+    if board.is_checkmate():
+        return -MATE_SCORE + ply, []
+    if board.is_stalemate() or board.is_insufficient_material():
+        return 0, []
+    if depth == 0:
+        return evaluate(board), []
+
+    best_pv = []
+    for move in ordered_moves(board):
+        board.push(move)
+        score, pv = negamax(board, depth - 1, -beta, -alpha, ply + 1)
+        board.pop()
+        score = -score
+        if score > alpha:
+            alpha = score
+            best_pv = [move] + pv
+        if alpha >= beta:
+            break
+    return alpha, best_pv
+
+
+def search(board, depth, root_moves=None):
+    """
+    Scores and principal variations of all root moves, best first.
+    """
+    lines = []
+    for move in ordered_moves(board, root_moves):
+        board.push(move)
+        score, pv = negamax(board, depth - 1, -MATE_SCORE - 1, MATE_SCORE + 1, 1)
+        board.pop()
+        lines.append((-score, [move] + pv))
+    # stable sort keeps the uci order between moves of equal score
+    return sorted(lines, key=lambda line: -line[0])
+
+
+def format_score(score):
+    if abs(score) > MATE_SCORE - 1000:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate {}".format(moves if score > 0 else -moves)
+    return "cp {}".format(score)
+
+
+def table_lines(board, entry):
+    pv = [chess.Move.from_uci(move) for move in entry.get("pv", [])]
+    if "mate" in entry:
+        mate = entry["mate"]
+        plies = 2 * mate - 1 if mate > 0 else -2 * mate
+        score = MATE_SCORE - plies if mate > 0 else -MATE_SCORE + plies
+    else:
+        score = entry.get("score", evaluate(board))
+    return [(score, pv)]
+
+
+class FakeEngine:
+    def __init__(
+        self,
+        mode="stockfish",
+        table=None,
+        latency=0.0,
+        depth_latency=0.0,
+        search_depth=2,
+        fault_counts=None,
+    ):
+        self.mode = mode
+        self.table = table or {}
+        self.fault_counts = fault_counts
+        self.latency = latency
+        self.depth_latency = depth_latency
+        self.search_depth = search_depth
+        self.board = chess.Board()
+        self.multipv = 1
+        self._searches = {}
+        self._input = queue.Queue()
+        # commands received during a search
+        self._pending = []
+
+    def write(self, line=""):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def _read(self, lines):
+        for line in lines:
+            self._input.put(line)
+        self._input.put(None)
+
+    def run(self, lines):
+        # read in the background so that stop can interrupt a search
+        threading.Thread(target=self._read, args=(lines,), daemon=True).start()
+        if self.mode == "stockfish":
+            self.write(BANNER)
+        while True:
+            line = self._pending.pop(0) if self._pending else self._input.get()
+            if line is None or not self.handle(line.split()):
+                break
+
+    def _stopped(self):
+        while True:
+            try:
+                line = self._input.get_nowait()
+            except queue.Empty:
+                return False
+            if line is not None and line.strip() == "stop":
+                return True
+            self._pending.append(line)
+
+    def handle(self, tokens):
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "quit":
+            return False
+        if command == "uci":
+            self.write("id name {}".format(NAME))
+            self.write("id author chess-concepts")
+            self.write("option name Hash type spin default 16 min 1 max 1024")
+            self.write("option name Threads type spin default 1 min 1 max 512")
+            self.write("option name MultiPV type spin default 1 min 1 max 500")
+            self.write("uciok")
+        elif command == "isready":
+            self.write("readyok")
+        elif command == "setoption":
+            self.setoption(args)
+        elif command == "ucinewgame":
+            self.board = chess.Board()
+        elif command == "position":
+            self.position(args)
+        elif command == "go":
+            self.fault()
+            self.go(args)
+        elif command == "eval":
+            self.fault()
+            self.eval()
+        return True
+
+    def setoption(self, args):
+        if "value" not in args:
+            return
+        i = args.index("value")
+        name = " ".join(args[1:i])
+        if name == "MultiPV":
+            self.multipv = int(args[i + 1])
+
+    def fault(self):
+        key = table_key(self.board.fen())
+        entry = self.table.get(key, {})
+        if "fault" not in entry:
+            return
+        if "faults" in entry:
+            counts = {}
+            if os.path.exists(self.fault_counts):
+                with open(self.fault_counts) as fp:
+                    counts = json.load(fp)
+            if counts.get(key, 0) >= entry["faults"]:
+                return
+            counts[key] = counts.get(key, 0) + 1
+            with open(self.fault_counts, "w") as fp:
+                json.dump(counts, fp)
+
+        if entry["fault"] == "crash":
+            os._exit(1)
+        while True:
+            time.sleep(1)
+
+    def position(self, args):
+        if args[0] == "startpos":
+            board = chess.Board()
+            rest = args[1:]
+        else:
+            end = args.index("moves") if "moves" in args else len(args)
+            board = chess.Board(" ".join(args[1:end]))
+            rest = args[end:]
+        for uci in rest[1:]:
+            board.push_uci(uci)
+        self.board = board
+
+    def _lines(self, depth, root_moves):
+        entry = self.table.get(table_key(self.board.fen()))
+        if entry is not None and "pv" in entry and not root_moves:
+            lines = table_lines(self.board, entry)
+        else:
+            lines = []
+        if len(lines) < self.multipv:
+            seen = {tuple(pv[:1]) for _, pv in lines}
+            lines += [
+                line
+                for line in self._search(min(depth, self.search_depth), root_moves)
+                if tuple(line[1][:1]) not in seen
+            ]
+        return lines[: self.multipv]
+
+    def _search(self, depth, root_moves):
+        # deeper iterations than the search depth repeat the last one
+        key = (self.board.fen(), depth, tuple(root_moves or ()))
+        if key not in self._searches:
+            self._searches = {key: search(self.board, depth, root_moves)}
+        return self._searches[key]
+
+    def go(self, args):
+        def arg(name):
+            return int(args[args.index(name) + 1]) if name in args else None
+
+        max_nodes, movetime = arg("nodes"), arg("movetime")
+        depth = arg("depth") or (MAX_DEPTH if max_nodes or movetime else 1)
+        root_moves = None
+        if "searchmoves" in args:
+            root_moves = []
+            for uci in args[args.index("searchmoves") + 1 :]:
+                try:
+                    root_moves.append(chess.Move.from_uci(uci))
+                except ValueError:
+                    break
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.board.is_game_over():
+            score = "mate 0" if self.board.is_checkmate() else "cp 0"
+            self.write("info depth 0 score {}".format(score))
+            self.write("bestmove (none)")
+            return
+
+        if self.mode == "ethereal":
+            depth = 1
+
+        start = time.perf_counter()
+        nodes = 0
+        lines = []
+        for d in range(1, depth + 1):
+            if self.depth_latency:
+                time.sleep(self.depth_latency)
+            lines = self._lines(d, root_moves)
+            for k, (score, pv) in enumerate(lines, 1):
+                nodes += NODES_PER_LINE
+                self.write(
+                    "info depth {d} seldepth {d} multipv {k} score {score} nodes {nodes} "
+                    "nps 1000000 time {time} pv {pv}".format(
+                        d=d,
+                        k=k,
+                        score=format_score(score),
+                        nodes=nodes,
+                        time=int((time.perf_counter() - start) * 1000),
+                        pv=" ".join(move.uci() for move in pv),
+                    )
+                )
+            elapsed = (time.perf_counter() - start) * 1000
+            if (
+                (max_nodes and nodes >= max_nodes)
+                or (movetime and elapsed >= movetime)
+                or self._stopped()
+            ):
+                break
+
+        if self.mode == "ethereal":
+            self.write(json.dumps(self.ethereal_features()))
+        self.write("bestmove {}".format(lines[0][1][0].uci()))
+
+    def eval(self):
+        if self.board.is_check():
+            self.write("Total evaluation: none (in check)")
+            return
+
+        entry = self.table.get(table_key(self.board.fen()), {})
+        terms = entry.get("eval", {})
+
+        def fmt(value):
+            return " ----" if value is None else "{:5.2f}".format(value)
+
+        self.write("      Term    |    White    |    Black    |    Total   ")
+        self.write("              |   MG    EG  |   MG    EG  |   MG    EG ")
+        self.write(" ------------+-------------+-------------+------------")
+        for term in EVAL_TERMS:
+            white, black, total = terms.get(
+                term,
+                (
+                    [[None, None], [None, None], [0.0, 0.0]]
+                    if term in UNSPLIT_EVAL_TERMS
+                    else [[0.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
+                ),
+            )
+            self.write(
+                "{:>12} | {} {} | {} {} | {} {} ".format(
+                    term, *(fmt(value) for value in white + black + total)
+                )
+            )
+        self.write(" ------------+-------------+-------------+------------")
+        total = evaluate(self.board) / 100 * (1 if self.board.turn else -1) + 0.0
+        self.write(
+            "       Total |   ---   --- |   ---   --- | {0} {0} ".format(fmt(total))
+        )
+        self.write("")
+        self.write("Total evaluation: {:.2f} (white side)".format(total))
+        self.write("")
+
+    def ethereal_features(self):
+        entry = self.table.get(table_key(self.board.fen()), {})
+        if "features" in entry:
+            return entry["features"]
+
+        board = self.board
+        res = {}
+        for color, prefix in [(chess.WHITE, "w"), (chess.BLACK, "b")]:
+            pawns = board.pieces_mask(chess.PAWN, color)
+            their_pawns = board.pieces_mask(chess.PAWN, not color)
+            bishops = board.pieces_mask(chess.BISHOP, color)
+            rooks = board.pieces_mask(chess.ROOK, color)
+            forward = 8 if color else -8
+
+            isolated = 0
+            for square in chess.scan_forward(pawns):
+                file = chess.square_file(square)
+                neighbours = chess.BB_EMPTY
+                if file > 0:
+                    neighbours |= chess.BB_FILES[file - 1]
+                if file < 7:
+                    neighbours |= chess.BB_FILES[file + 1]
+                isolated += not pawns & neighbours
+
+            rammed = chess.BB_EMPTY
+            for square in chess.scan_forward(pawns):
+                if (
+                    0 <= square + forward < 64
+                    and chess.BB_SQUARES[square + forward] & their_pawns
+                ):
+                    rammed |= chess.BB_SQUARES[square]
+
+            bishop_rammed = 0
+            behind_pawn = 0
+            long_diagonal = 0
+            for square in chess.scan_forward(bishops):
+                same_color = (
+                    chess.BB_LIGHT_SQUARES
+                    if chess.BB_SQUARES[square] & chess.BB_LIGHT_SQUARES
+                    else chess.BB_DARK_SQUARES
+                )
+                bishop_rammed += chess.popcount(rammed & same_color)
+                if 0 <= square + forward < 64:
+                    behind_pawn += bool(
+                        chess.BB_SQUARES[square + forward] & board.pawns
+                    )
+                if chess.BB_SQUARES[square] & BB_LONG_DIAGONALS & ~BB_CENTER:
+                    attacks = board.attacks_mask(square) & BB_CENTER
+                    long_diagonal += chess.popcount(attacks) > 1
+
+            seventh = chess.BB_RANK_7 if color else chess.BB_RANK_2
+            res["{}_isolated_pawns".format(prefix)] = isolated
+            res["{}_bishop_rammed_pawns".format(prefix)] = bishop_rammed
+            res["{}_bishops_behind_pawn".format(prefix)] = behind_pawn
+            res["{}_bishop_long_diagonal".format(prefix)] = long_diagonal
+            res["{}_rooks_on_seventh".format(prefix)] = chess.popcount(rooks & seventh)
+            # relative pins are not modelled
+            res["{}_queen_relative_pin".format(prefix)] = 0
+        return res
+
+
+def main():
+    table_path = os.environ.get("FAKE_ENGINE_TABLE")
+    engine = FakeEngine(
+        mode=os.environ.get("FAKE_ENGINE_MODE", "stockfish"),
+        table=load_table(table_path),
+        latency=float(os.environ.get("FAKE_ENGINE_LATENCY", 0)),
+        depth_latency=float(os.environ.get("FAKE_ENGINE_DEPTH_LATENCY", 0)),
+        search_depth=int(os.environ.get("FAKE_ENGINE_SEARCH_DEPTH", 2)),
+        fault_counts=table_path and table_path + ".faults",
+    )
+    engine.run(sys.stdin)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import math
+
+import chess
+import features
+from board import encoding
+from features import bitboards
+
+
+def test_board_features():
+    fens = [
+        chess.STARTING_FEN,
+        "8/5ppk/4p2p/4P3/8/1r6/p5P1/4R1K1 w - - 0 1",
+        "8/1p3pp1/p1krpn1p/P6P/2P2PP1/2B5/1PK5/4R3 w - - 0 1",
+        "2Q5/8/p3p3/P4p1k/8/8/8/3K4 b - - 0 13",
+    ]
+    df = bitboards.board_features(encoding.from_bytes(map(encoding.encode_fen, fens)))
+    for fen, (_, row) in zip(fens, df.iterrows()):
+        expected = features.Board(fen).features()
+        for name, value in row.items():
+            if expected[name] is None:
+                assert math.isnan(value)
+            else:
+                assert value == expected[name]
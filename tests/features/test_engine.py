@@ -0,0 +1,238 @@
+import json
+import threading
+import time
+
+import chess
+import chess.engine
+import pandas as pd
+import pytest
+
+import features.engine
+import features.stockfish
+from features.engine import (
+    EnginePipe,
+    EngineSupervisor,
+    EngineTimeout,
+    Stopwatch,
+    analyse_games,
+    dead_letters,
+    games,
+    parse_info,
+)
+
+
+def test_stopwatch_counts_overlapping_blocks_once():
+    stopwatch = Stopwatch()
+
+    def wait():
+        with stopwatch:
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=wait) for _ in range(4)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 0.2 <= stopwatch.seconds <= time.perf_counter() - start
+
+
+def test_parse_info():
+    line = (
+        "info depth 12 seldepth 17 multipv 2 score cp -35 upperbound nodes 123456 "
+        "nps 987654 hashfull 12 tbhits 0 time 125 pv e7e5 g1f3 b8c6\n"
+    )
+    assert parse_info(line, {"score", "mate", "move", "pv", "nodes", "time"}) == {
+        "depth": 12,
+        "multipv": 2,
+        "score": -35,
+        "mate": None,
+        "nodes": 123456,
+        "time": 125,
+        "move": "e7e5",
+        "pv": "e7e5 g1f3 b8c6",
+    }
+    assert parse_info(line, {"score"}) == {
+        "depth": 12,
+        "multipv": 2,
+        "score": -35,
+        "mate": None,
+    }
+    assert parse_info("info depth 3 score mate -2 pv h7h6", {"mate"})["mate"] == -2
+
+
+def test_parse_info_without_score():
+    assert parse_info("info depth 20 currmove e2e4 currmovenumber 1", {"score"}) is None
+    assert parse_info("info string NNUE evaluation enabled", {"score"}) is None
+    assert parse_info("bestmove e2e4 ponder e7e5", {"score"}) is None
+
+
+def test_games():
+    df = pd.DataFrame({"game_id": ["a", "a", "b", "a", "c", "b"]})
+    assert games(df) == [("a", [0, 1, 3]), ("b", [2, 5]), ("c", [4])]
+
+    df = pd.DataFrame({"fen": range(5)})
+    assert games(df, 2) == [(None, [0, 1, 2]), (None, [3, 4])]
+    assert games(df.iloc[:0], 2) == []
+
+
+class RecordingEngine:
+    def __init__(self, analysed):
+        self.analysed = analysed
+
+    def analyse(self, board, game=None):
+        self.analysed.append((self, game, board))
+        return board
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_analyse_games():
+    df = pd.DataFrame(
+        {"game_id": ["a", "b", "a", "c", "b", "a"], "fen": list("012345")}
+    )
+    analysed = []
+
+    res = analyse_games(
+        df,
+        lambda row, engine: engine.analyse(row.fen),
+        lambda: RecordingEngine(analysed),
+        workers=2,
+    )
+
+    assert res == list("012345")
+    for game_id in "abc":
+        calls = [call for call in analysed if call[1] == game_id]
+        # plies of a game run in order on one engine
+        assert [board for _, _, board in calls] == list(df.fen[df.game_id == game_id])
+        assert len({engine for engine, _, _ in calls}) == 1
+
+
+POISON_FEN = "4k3/8/8/8/8/8/8/R3K3 w - - 0 1"
+
+
+def test_supervisor_restarts_crashed_engine(fake_engine):
+    path = fake_engine(table={POISON_FEN: {"fault": "crash", "faults": 1}})
+    supervisor = EngineSupervisor(lambda: chess.engine.SimpleEngine.popen_uci(path))
+    try:
+        info = supervisor.run(
+            lambda engine: engine.analyse(
+                chess.Board(POISON_FEN), chess.engine.Limit(depth=1)
+            )
+        )
+    finally:
+        supervisor.quit()
+
+    assert info["depth"] == 1
+    assert supervisor.restarts == 1
+
+
+def test_supervisor_times_out_hanging_engine(fake_engine):
+    path = fake_engine(table={POISON_FEN: {"fault": "hang"}})
+
+    def open_engine():
+        p = EnginePipe(path)
+        p.stdout.readline()  # banner
+        return p
+
+    def evaluate(p):
+        p.stdin.write("position fen {}\n".format(POISON_FEN))
+        p.stdin.write("eval\n")
+        return p.stdout.readline()
+
+    def ready(p):
+        p.stdin.write("isready\n")
+        return p.stdout.readline()
+
+    supervisor = EngineSupervisor(open_engine, timeout=0.5, retries=1)
+    try:
+        with pytest.raises(EngineTimeout):
+            supervisor.run(evaluate)
+        # the next row runs on a fresh engine
+        assert supervisor.run(ready) == "readyok\n"
+    finally:
+        supervisor.quit()
+
+    assert supervisor.restarts == 2
+
+
+def test_analyse_games_records_dead_letters(fake_engine, monkeypatch, tmp_path):
+    path = fake_engine(table={POISON_FEN: {"fault": "crash"}})
+    monkeypatch.setattr(features.engine, "ENGINE_RETRIES", 1)
+    monkeypatch.setattr(dead_letters, "path", str(tmp_path / "dead_letters.jsonl"))
+    df = pd.DataFrame(
+        {
+            "game_id": ["a", "a", "b"],
+            "fen": [chess.STARTING_FEN, POISON_FEN, chess.STARTING_FEN],
+        }
+    )
+
+    res = analyse_games(
+        df,
+        lambda row, engine: engine.analyse(
+            chess.Board(row.fen), chess.engine.Limit(depth=1)
+        )["depth"],
+        lambda: chess.engine.SimpleEngine.popen_uci(path),
+        workers=2,
+        label="Test",
+    )
+
+    assert res == [1, None, 1]
+    assert len(dead_letters.records) == 1
+    record = dead_letters.records[0]
+    assert record["feature"] == "Test"
+    assert record["game_id"] == "a"
+    assert record["index"] == 1
+    assert record["fen"] == POISON_FEN
+    assert record["error"].startswith("EngineTerminatedError")
+    with open(dead_letters.path) as fp:
+        assert [json.loads(line) for line in fp] == [record]
+
+
+def test_analyse_games_records_other_errors():
+    dead_letters.clear()
+    df = pd.DataFrame({"game_id": ["a", "a", "b"], "fen": ["0", "1", "2"]})
+
+    def analyse_row(row, engine):
+        info = engine.analyse(row.fen)
+        return {"0": "e2e4", "2": "d2d4"}[info]
+
+    res = analyse_games(df, analyse_row, lambda: RecordingEngine([]), workers=2)
+
+    assert res == ["e2e4", None, "d2d4"]
+    assert len(dead_letters.records) == 1
+    record = dead_letters.records[0]
+    assert record["index"] == 1
+    assert record["error"] == "KeyError: '1'"
+    assert "in analyse_row" in record["traceback"]
+    # the watchdogs of all rows were cancelled
+    assert not [
+        thread
+        for thread in threading.enumerate()
+        if isinstance(thread, threading.Timer)
+    ]
+
+
+def test_stockfish_from_df_skips_poison_positions(fake_engine, monkeypatch):
+    monkeypatch.setattr(
+        features.stockfish,
+        "STOCKFISH_PATH",
+        fake_engine(table={POISON_FEN: {"fault": "crash"}}),
+    )
+    monkeypatch.setattr(features.engine, "ENGINE_RETRIES", 0)
+    df = pd.DataFrame({"fen": [chess.STARTING_FEN, POISON_FEN, chess.STARTING_FEN]})
+
+    depth_df = features.stockfish.StockfishDepth.from_df(df)
+    eval_df = features.stockfish.StockfishEval.from_df(df)
+
+    assert depth_df.depth_1_score.isna().tolist() == [False, True, False]
+    assert eval_df.total_material_mg.isna().tolist() == [False, True, False]
+    assert [record["feature"] for record in dead_letters.records] == [
+        "StockfishDepth",
+        "StockfishEval",
+    ]
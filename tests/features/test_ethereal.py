@@ -1,6 +1,33 @@
+import json
 import chess
 import subprocess
-from features.ethereal import ETHEREAL_PATH, EtherealEval
+import numpy as np
+import pandas as pd
+import pytest
+import features.ethereal
+from features.engine import EnginePipe
+from features.ethereal import (
+    ETHEREAL_COLUMNS,
+    ETHEREAL_FEATURES,
+    ETHEREAL_PATH,
+    EtherealEval,
+    parse_features,
+)
+
+STARTING_FEATURES = {
+    "our_isolated_pawns": 0,
+    "their_isolated_pawns": 0,
+    "our_bishop_rammed_pawns": 0,
+    "their_bishop_rammed_pawns": 0,
+    "our_bishops_behind_pawn": 2,
+    "their_bishops_behind_pawn": 2,
+    "our_bishop_long_diagonal": 0,
+    "their_bishop_long_diagonal": 0,
+    "our_rooks_on_seventh": 0,
+    "their_rooks_on_seventh": 0,
+    "our_queen_relative_pin": 0,
+    "their_queen_relative_pin": 0,
+}
 
 
 def test_stockfish_eval_features():
@@ -17,17 +44,68 @@ def test_stockfish_eval_features():
 
     p.kill()
 
-    assert f.features() == {
-        "our_isolated_pawns": 0,
-        "their_isolated_pawns": 0,
-        "our_bishop_rammed_pawns": 0,
-        "their_bishop_rammed_pawns": 0,
-        "our_bishops_behind_pawn": 2,
-        "their_bishops_behind_pawn": 2,
-        "our_bishop_long_diagonal": 0,
-        "their_bishop_long_diagonal": 0,
-        "our_rooks_on_seventh": 0,
-        "their_rooks_on_seventh": 0,
-        "our_queen_relative_pin": 0,
-        "their_queen_relative_pin": 0,
+    assert f.features() == STARTING_FEATURES
+
+
+def test_ethereal_eval_features_fake_engine(fake_engine):
+    with EnginePipe(fake_engine(mode="ethereal")) as p:
+        f = EtherealEval(chess.STARTING_FEN, p)
+        # the pipe is left at the next command
+        g = EtherealEval("4k3/RP6/8/8/8/8/8/4K3 b - - 0 1", p)
+
+    assert f.features() == STARTING_FEATURES
+    assert g.features()["their_isolated_pawns"] == 1
+    assert g.features()["their_rooks_on_seventh"] == 1
+    assert g.features()["our_isolated_pawns"] == 0
+
+
+def test_parse_features():
+    values = {
+        "{}_{}".format(color, name): 0 for color in "wb" for name in ETHEREAL_FEATURES
     }
+    values.update(w_isolated_pawns=1, b_isolated_pawns=2, b_rooks_on_seventh=1)
+    line = json.dumps(values) + "\n"
+
+    white = dict(zip(ETHEREAL_COLUMNS, parse_features(line, "w")))
+    assert white["our_isolated_pawns"] == 1
+    assert white["their_isolated_pawns"] == 2
+    assert white["their_rooks_on_seventh"] == 1
+    assert white["our_rooks_on_seventh"] == 0
+
+    black = dict(zip(ETHEREAL_COLUMNS, parse_features(line, "b")))
+    assert black["our_isolated_pawns"] == 2
+    assert black["our_rooks_on_seventh"] == 1
+
+    with pytest.raises(ValueError, match="unknown: \\['w_unknown'\\]"):
+        parse_features(json.dumps(dict(values, w_unknown=7)), "w")
+    del values["b_queen_relative_pin"]
+    with pytest.raises(ValueError, match="missing: \\['b_queen_relative_pin'\\]"):
+        parse_features(json.dumps(values), "w")
+    with pytest.raises(ValueError):
+        parse_features("info depth 1 score cp 0\n", "w")
+
+
+def test_ethereal_from_df_fake_engine(fake_engine, monkeypatch):
+    monkeypatch.setattr(
+        features.ethereal, "ETHEREAL_PATH", fake_engine(mode="ethereal")
+    )
+    monkeypatch.setattr(features.ethereal, "ETHEREAL_WORKERS", 2)
+    df = pd.DataFrame(
+        {
+            "game_id": ["a", "b", "a"],
+            "fen": [
+                chess.STARTING_FEN,
+                "4k3/RP6/8/8/8/8/8/4K3 b - - 0 1",
+                chess.STARTING_FEN,
+            ],
+        },
+        index=[10, 11, 12],
+    )
+
+    feature_df = features.ethereal.EtherealEval.from_df(df)
+
+    assert list(feature_df.columns) == ETHEREAL_COLUMNS
+    assert (feature_df.dtypes == np.float32).all()
+    assert feature_df.iloc[0].to_dict() == STARTING_FEATURES
+    assert feature_df.iloc[2].to_dict() == STARTING_FEATURES
+    assert feature_df.their_rooks_on_seventh.tolist() == [0, 1, 0]
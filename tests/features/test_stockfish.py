@@ -1,15 +1,108 @@
+import os
 import subprocess
 import chess
 import chess.engine
 import features
+import features.stockfish
+import numpy as np
+import pandas as pd
+from features.engine import EnginePipe, Stopwatch, _TimedReader, engine_cache
 from features.stockfish import STOCKFISH_PATH
+from types import SimpleNamespace
+
+# eval of the starting position by Stockfish 11
+STARTING_EVAL_FEATURES = {
+    "our_bishops_eg": -0.36,
+    "our_bishops_mg": -0.03,
+    "our_imbalance_eg": None,
+    "our_imbalance_mg": None,
+    "our_initiative_eg": None,
+    "our_initiative_mg": None,
+    "our_king safety_eg": -0.05,
+    "our_king safety_mg": 0.78,
+    "our_knights_eg": -0.18,
+    "our_knights_mg": -0.02,
+    "our_material_eg": None,
+    "our_material_mg": None,
+    "our_mobility_eg": -1.09,
+    "our_mobility_mg": -0.82,
+    "our_passed_eg": 0.0,
+    "our_passed_mg": 0.0,
+    "our_pawns_eg": -0.11,
+    "our_pawns_mg": 0.53,
+    "our_queens_eg": 0.0,
+    "our_queens_mg": 0.0,
+    "our_rooks_eg": -0.06,
+    "our_rooks_mg": -0.26,
+    "our_space_eg": 0.0,
+    "our_space_mg": 0.39,
+    "our_threats_eg": 0.0,
+    "our_threats_mg": 0.0,
+    "their_bishops_eg": -0.36,
+    "their_bishops_mg": -0.03,
+    "their_imbalance_eg": None,
+    "their_imbalance_mg": None,
+    "their_initiative_eg": None,
+    "their_initiative_mg": None,
+    "their_king safety_eg": -0.05,
+    "their_king safety_mg": 0.78,
+    "their_knights_eg": -0.18,
+    "their_knights_mg": -0.02,
+    "their_material_eg": None,
+    "their_material_mg": None,
+    "their_mobility_eg": -1.09,
+    "their_mobility_mg": -0.82,
+    "their_passed_eg": 0.0,
+    "their_passed_mg": 0.0,
+    "their_pawns_eg": -0.11,
+    "their_pawns_mg": 0.53,
+    "their_queens_eg": 0.0,
+    "their_queens_mg": 0.0,
+    "their_rooks_eg": -0.06,
+    "their_rooks_mg": -0.26,
+    "their_space_eg": 0.0,
+    "their_space_mg": 0.39,
+    "their_threats_eg": 0.0,
+    "their_threats_mg": 0.0,
+    "total_bishops_eg": 0.0,
+    "total_bishops_mg": 0.0,
+    "total_imbalance_eg": 0.0,
+    "total_imbalance_mg": 0.0,
+    "total_initiative_eg": 0.0,
+    "total_initiative_mg": 0.0,
+    "total_king safety_eg": 0.0,
+    "total_king safety_mg": 0.0,
+    "total_knights_eg": 0.0,
+    "total_knights_mg": 0.0,
+    "total_material_eg": 0.0,
+    "total_material_mg": 0.0,
+    "total_mobility_eg": 0.0,
+    "total_mobility_mg": 0.0,
+    "total_passed_eg": 0.0,
+    "total_passed_mg": 0.0,
+    "total_pawns_eg": 0.0,
+    "total_pawns_mg": 0.0,
+    "total_queens_eg": 0.0,
+    "total_queens_mg": 0.0,
+    "total_rooks_eg": 0.0,
+    "total_rooks_mg": 0.0,
+    "total_space_eg": 0.0,
+    "total_space_mg": 0.0,
+    "total_threats_eg": 0.0,
+    "total_threats_mg": 0.0,
+}
 
 
 def test_stockfish_features():
     engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
 
     f = features.Stockfish10(chess.STARTING_FEN, engine)
-    assert f.features() == {
+    features_ = f.features()
+    assert features_.pop("search_depth") == 10
+    # nodes and time vary between machines
+    assert features_.pop("search_nodes") > 0
+    features_.pop("search_seconds")
+    assert features_ == {
         "best_mate": None,
         "best_move": "b1c3",
         "best_pv": "['b1c3', 'd7d5', 'd2d4', 'c7c6', 'c1f4', 'e7e6', 'e2e3']",
@@ -30,38 +123,45 @@ def test_stockfish_depth_features():
     )
     p.stdout.readline()  # read info line on init.
 
-    f = features.StockfishDepth(chess.STARTING_FEN, p)
+    f = features.StockfishDepth.configure(fields=("score", "mate", "move", "pv"))(
+        chess.STARTING_FEN, p
+    )
 
     p.kill()
 
-    assert f.features() == {
-        "mates": [None, None, None, None, None, None, None, None, None, None],
-        "moves": [
-            "e2e3",
-            "e2e3",
-            "e2e3",
-            "d2d4",
-            "d2d4",
-            "e2e4",
-            "b1c3",
-            "b1c3",
-            "b1c3",
-            "b1c3",
-        ],
-        "pvs": [
-            "['e2e3']",
-            "['e2e3', 'b7b6']",
-            "['e2e3', 'b7b6', 'f1c4']",
-            "['d2d4', 'e7e6', 'e2e3', 'd7d5']",
-            "['d2d4', 'e7e6', 'e2e3', 'd7d5']",
-            "['e2e4', 'b7b6']",
-            "['b1c3', 'd7d5', 'd2d4', 'c7c6', 'd1d3', 'e7e6', 'e2e4', 'd5e4']",
-            "['b1c3', 'd7d5', 'g1f3', 'd5d4', 'c3b5', 'b8c6', 'e2e3', 'd4e3', 'd2e3', 'd8d1', 'e1d1']",
-            "['b1c3', 'd7d5', 'd2d4', 'e7e5', 'e2e4', 'd5e4', 'c1e3', 'b8c6', 'd4e5']",
-            "['b1c3', 'd7d5', 'd2d4', 'c7c6', 'c1f4', 'e7e6', 'e2e3']",
-        ],
-        "scores": [110, 122, 119, 59, 75, 172, 77, 82, 77, 115],
-    }
+    moves = [
+        "e2e3",
+        "e2e3",
+        "e2e3",
+        "d2d4",
+        "d2d4",
+        "e2e4",
+        "b1c3",
+        "b1c3",
+        "b1c3",
+        "b1c3",
+    ]
+    pvs = [
+        "e2e3",
+        "e2e3 b7b6",
+        "e2e3 b7b6 f1c4",
+        "d2d4 e7e6 e2e3 d7d5",
+        "d2d4 e7e6 e2e3 d7d5",
+        "e2e4 b7b6",
+        "b1c3 d7d5 d2d4 c7c6 d1d3 e7e6 e2e4 d5e4",
+        "b1c3 d7d5 g1f3 d5d4 c3b5 b8c6 e2e3 d4e3 d2e3 d8d1 e1d1",
+        "b1c3 d7d5 d2d4 e7e5 e2e4 d5e4 c1e3 b8c6 d4e5",
+        "b1c3 d7d5 d2d4 c7c6 c1f4 e7e6 e2e3",
+    ]
+    scores = [110, 122, 119, 59, 75, 172, 77, 82, 77, 115]
+
+    expected = {}
+    for depth, (move, pv, score) in enumerate(zip(moves, pvs, scores), 1):
+        expected["depth_{}_score".format(depth)] = score
+        expected["depth_{}_mate".format(depth)] = None
+        expected["depth_{}_move".format(depth)] = move
+        expected["depth_{}_pv".format(depth)] = pv
+    assert f.features() == expected
 
 
 def test_stockfish_eval_features():
@@ -79,83 +179,289 @@ def test_stockfish_eval_features():
 
     p.kill()
 
-    assert f.features() == {
-        "our_bishops_eg": -0.36,
-        "our_bishops_mg": -0.03,
-        "our_imbalance_eg": None,
-        "our_imbalance_mg": None,
-        "our_initiative_eg": None,
-        "our_initiative_mg": None,
-        "our_king safety_eg": -0.05,
-        "our_king safety_mg": 0.78,
-        "our_knights_eg": -0.18,
-        "our_knights_mg": -0.02,
-        "our_material_eg": None,
-        "our_material_mg": None,
-        "our_mobility_eg": -1.09,
-        "our_mobility_mg": -0.82,
-        "our_passed_eg": 0.0,
-        "our_passed_mg": 0.0,
-        "our_pawns_eg": -0.11,
-        "our_pawns_mg": 0.53,
-        "our_queens_eg": 0.0,
-        "our_queens_mg": 0.0,
-        "our_rooks_eg": -0.06,
-        "our_rooks_mg": -0.26,
-        "our_space_eg": 0.0,
-        "our_space_mg": 0.39,
-        "our_threats_eg": 0.0,
-        "our_threats_mg": 0.0,
-        "their_bishops_eg": -0.36,
-        "their_bishops_mg": -0.03,
-        "their_imbalance_eg": None,
-        "their_imbalance_mg": None,
-        "their_initiative_eg": None,
-        "their_initiative_mg": None,
-        "their_king safety_eg": -0.05,
-        "their_king safety_mg": 0.78,
-        "their_knights_eg": -0.18,
-        "their_knights_mg": -0.02,
-        "their_material_eg": None,
-        "their_material_mg": None,
-        "their_mobility_eg": -1.09,
-        "their_mobility_mg": -0.82,
-        "their_passed_eg": 0.0,
-        "their_passed_mg": 0.0,
-        "their_pawns_eg": -0.11,
-        "their_pawns_mg": 0.53,
-        "their_queens_eg": 0.0,
-        "their_queens_mg": 0.0,
-        "their_rooks_eg": -0.06,
-        "their_rooks_mg": -0.26,
-        "their_space_eg": 0.0,
-        "their_space_mg": 0.39,
-        "their_threats_eg": 0.0,
-        "their_threats_mg": 0.0,
-        "total_bishops_eg": 0.0,
-        "total_bishops_mg": 0.0,
-        "total_imbalance_eg": 0.0,
-        "total_imbalance_mg": 0.0,
-        "total_initiative_eg": 0.0,
-        "total_initiative_mg": 0.0,
-        "total_king safety_eg": 0.0,
-        "total_king safety_mg": 0.0,
-        "total_knights_eg": 0.0,
-        "total_knights_mg": 0.0,
-        "total_material_eg": 0.0,
-        "total_material_mg": 0.0,
-        "total_mobility_eg": 0.0,
-        "total_mobility_mg": 0.0,
-        "total_passed_eg": 0.0,
-        "total_passed_mg": 0.0,
-        "total_pawns_eg": 0.0,
-        "total_pawns_mg": 0.0,
-        "total_queens_eg": 0.0,
-        "total_queens_mg": 0.0,
-        "total_rooks_eg": 0.0,
-        "total_rooks_mg": 0.0,
-        "total_space_eg": 0.0,
-        "total_space_mg": 0.0,
-        "total_threats_eg": 0.0,
-        "total_threats_mg": 0.0,
+    assert f.features() == STARTING_EVAL_FEATURES
+
+
+BACKRANK_MATE_FEN = "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+
+
+def test_stockfish_features_fake_engine(fake_engine):
+    path = fake_engine(
+        table={
+            chess.STARTING_FEN: {
+                "score": 115,
+                "pv": ["b1c3", "d7d5", "d2d4", "c7c6", "c1f4", "e7e6", "e2e3"],
+            }
+        }
+    )
+    with chess.engine.SimpleEngine.popen_uci(path) as engine:
+        f = features.Stockfish10(chess.STARTING_FEN, engine)
+        features_ = f.features()
+        features_.pop("search_seconds")
+        assert features_ == {
+            "best_mate": None,
+            "best_move": "b1c3",
+            "best_pv": "['b1c3', 'd7d5', 'd2d4', 'c7c6', 'c1f4', 'e7e6', 'e2e3']",
+            "best_score": 115,
+            "search_depth": 10,
+            "search_nodes": 10000,
+        }
+
+        f = features.Stockfish10(BACKRANK_MATE_FEN, engine)
+        assert f.best_mate == 1
+        assert f.best_move == "a1a8"
+
+
+def test_stockfish_depth_features_fake_engine(fake_engine):
+    with EnginePipe(fake_engine()) as p:
+        p.stdout.readline()  # read info line on init.
+        f = features.StockfishDepth(BACKRANK_MATE_FEN, p)
+        p.stdin.write("setoption name MultiPV value 2\n")
+        g = features.StockfishDepth.configure(
+            depths=(1, 2), multipv=2, fields=("score", "pv")
+        )(BACKRANK_MATE_FEN, p)
+
+    assert len(f.features()) == 60
+    for depth in range(1, 11):
+        assert f.features()["depth_{}_mate".format(depth)] == 1
+        assert f.features()["depth_{}_score".format(depth)] is None
+        assert f.features()["depth_{}_move".format(depth)] == "a1a8"
+        assert f.features()["depth_{}_pv".format(depth)] == "a1a8"
+        assert f.features()["depth_{}_nodes".format(depth)] == 1000 * depth
+
+    assert g.features() == {
+        "depth_1_score": None,
+        "depth_1_pv": "a1a8",
+        "depth_1_multipv_2_score": 500,
+        "depth_1_multipv_2_pv": "a1a2",
+        "depth_2_score": None,
+        "depth_2_pv": "a1a8",
+        "depth_2_multipv_2_score": 500,
+        "depth_2_multipv_2_pv": "a1a2 f7f5",
     }
+
+
+def test_stockfish_depth_from_df_fake_engine(fake_engine, monkeypatch):
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", fake_engine())
+    df = pd.DataFrame({"fen": [chess.STARTING_FEN, BACKRANK_MATE_FEN]})
+
+    feature_df = features.StockfishDepth.from_df(df)
+
+    assert list(feature_df.columns) == features.StockfishDepth.feature_names()
+    assert feature_df["depth_10_score"].dtype == "Int64"
+    assert feature_df["depth_10_score"].tolist() == [0, pd.NA]
+    assert feature_df["depth_10_mate"].tolist() == [pd.NA, 1]
+
+    configured = features.StockfishDepth.configure(
+        depths=(1, 2), multipv=2, fields=("score", "pv")
+    )
+    feature_df = configured.from_df(df)
+
+    assert list(feature_df.columns) == configured.feature_names()
+    assert list(feature_df.columns) == [
+        "depth_1_score",
+        "depth_1_pv",
+        "depth_1_multipv_2_score",
+        "depth_1_multipv_2_pv",
+        "depth_2_score",
+        "depth_2_pv",
+        "depth_2_multipv_2_score",
+        "depth_2_multipv_2_pv",
+    ]
+    assert feature_df["depth_2_multipv_2_pv"].tolist() == ["a2a4 a7a5", "a1a2 f7f5"]
+
+
+def test_stockfish_eval_features_fake_engine(fake_engine):
+    terms = {}
+    for name, value in STARTING_EVAL_FEATURES.items():
+        side, term, phase = name.split("_")
+        term = term.capitalize()
+        column = ["our", "their", "total"].index(side)
+        terms.setdefault(term, [[None, None], [None, None], [None, None]])
+        terms[term][column][["mg", "eg"].index(phase)] = value
+    path = fake_engine(table={chess.STARTING_FEN: {"eval": terms}})
+
+    with EnginePipe(path) as p:
+        p.stdout.readline()  # read info line on init.
+        f = features.StockfishEval(chess.STARTING_FEN, p)
+        # the pipe is left at the next command
+        in_check = features.StockfishEval(
+            "rnbqkbnr/ppppp1pp/8/5p1Q/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 2", p
+        )
+
+    assert f.features() == STARTING_EVAL_FEATURES
+    assert in_check.features()["our_pawns_mg"] is None
+
+
+def test_stockfish_multipv_features_fake_engine(fake_engine):
+    with chess.engine.SimpleEngine.popen_uci(fake_engine()) as engine:
+        f = features.StockfishMultiPV(BACKRANK_MATE_FEN, engine)
+        assert f.best_move == "a1a8"
+        assert f.best_mate == 1
+        assert f.multipv["multipv_1_mate"] == 1
+        assert f.multipv["multipv_2_move"] == "a1a2"
+        assert f.multipv["multipv_2_score"] == 500
+        assert f.best_second_gap == 100000 - 1 - 500
+        assert f.number_of_good_moves == 1
+        assert f.is_only_move
+
+        # all moves of the starting position keep the material balance
+        f = features.StockfishMultiPV(chess.STARTING_FEN, engine)
+        assert f.best_second_gap == 0
+        assert f.number_of_good_moves == 5
+        assert not f.is_only_move
+        assert len(f.features()) == 4 + 3 + 4 * 5 + 3
+
+        # a single legal move
+        f = features.StockfishMultiPV("7k/8/8/8/8/8/6q1/7K w - - 0 1", engine)
+        assert f.best_move == "h1g2"
+        assert f.multipv["multipv_2_move"] is None
+        assert f.best_second_gap is None
+        assert f.is_only_move
+
+
+def test_stockfish_user_move_features_fake_engine(fake_engine):
+    with chess.engine.SimpleEngine.popen_uci(fake_engine()) as engine:
+        best = features.Stockfish10(BACKRANK_MATE_FEN, engine)
+        misses = engine_cache.misses
+        f = features.StockfishUserMove(BACKRANK_MATE_FEN, "a1a8", engine)
+        # the best move search is shared with Stockfish10 and the user move is the best move
+        assert engine_cache.misses == misses
+        assert f.info is best.info
+        assert f.user_move_is_best
+        assert f.user_move_mate == 1
+        assert f.user_move_score_loss == 0
+
+        f = features.StockfishUserMove(BACKRANK_MATE_FEN, "a1a2", engine)
+        assert engine_cache.misses == misses + 1
+        assert not f.user_move_is_best
+        assert f.user_move_score == 500
+        assert f.user_move_mate is None
+        assert f.user_move_score_loss == 100000 - 1 - 500
+
+
+def test_engine_cache_keys_engine_options(fake_engine):
+    path = fake_engine()
+    with chess.engine.SimpleEngine.popen_uci(path) as engine:
+        f = features.Stockfish10(BACKRANK_MATE_FEN, engine)
+        misses = engine_cache.misses
+        assert features.Stockfish10(BACKRANK_MATE_FEN, engine).info is f.info
+        assert engine_cache.misses == misses
+
+    with chess.engine.SimpleEngine.popen_uci(path) as engine:
+        engine.configure({"Hash": 32})
+        # an engine with other settings does not share the analysis
+        assert features.Stockfish10(BACKRANK_MATE_FEN, engine).info is not f.info
+        assert engine_cache.misses == misses + 1
+
+
+def test_stockfish_from_df_workers_fake_engine(fake_engine, monkeypatch):
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", fake_engine())
+    df = pd.DataFrame(
+        {
+            "game_id": ["a", "b", "a", "b"],
+            "fen": [
+                chess.STARTING_FEN,
+                BACKRANK_MATE_FEN,
+                chess.STARTING_FEN,
+                BACKRANK_MATE_FEN,
+            ],
+        }
+    )
+
+    serial = features.Stockfish10.from_df(df)
+    engine_cache.clear()
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_WORKERS", 2)
+    parallel = features.Stockfish10.from_df(df)
+
+    pd.testing.assert_frame_equal(
+        serial.drop(columns="search_seconds"), parallel.drop(columns="search_seconds")
+    )
+    assert parallel.best_move.tolist() == ["a2a3", "a1a8", "a2a3", "a1a8"]
+
+
+def test_stockfish_limits_fake_engine(fake_engine, monkeypatch):
+    monkeypatch.setenv("FAKE_ENGINE_DEPTH_LATENCY", "0.005")
+    with chess.engine.SimpleEngine.popen_uci(fake_engine()) as engine:
+        f = features.stockfish.Stockfish(
+            BACKRANK_MATE_FEN, engine, chess.engine.Limit(depth=20, nodes=3000)
+        )
+        assert f.search["search_depth"] == 3
+        assert f.search["search_nodes"] == 3000
+
+        # the best move and score are the same from depth 1 on
+        f = features.StockfishAdaptive(BACKRANK_MATE_FEN, engine)
+        assert f.best_move == "a1a8"
+        assert f.search["search_depth"] < 20
+        assert f.search["search_nodes"] < 20000
+
+
+def test_parse_eval():
+    lines = [
+        "      Term    |    White    |    Black    |    Total   \n",
+        "              |   MG    EG  |   MG    EG  |   MG    EG \n",
+        " ------------+-------------+-------------+------------\n",
+        "       Space |  0.39  0.00 |  0.12  0.00 |  0.27  0.00 \n",
+        "    Material |  ----  ---- |  ----  ---- |  0.50  0.75 \n",
+        "       Total |  ----  ---- |  ----  ---- |  0.77  0.75 \n",
+        "\n",
+        "Total evaluation: 0.80 (white side)\n",
+    ]
+    columns = features.stockfish.EVAL_COLUMNS
+
+    white = dict(zip(columns, features.stockfish.parse_eval(lines, chess.WHITE)))
+    assert white["our_space_mg"] == np.float32(0.39)
+    assert white["their_space_mg"] == np.float32(0.12)
+    assert white["total_material_eg"] == np.float32(0.75)
+    assert np.isnan(white["our_material_mg"])
+    assert np.isnan(white["our_pawns_mg"])
+
+    black = dict(zip(columns, features.stockfish.parse_eval(lines, chess.BLACK)))
+    assert black["our_space_mg"] == np.float32(0.12)
+    assert black["their_space_mg"] == np.float32(0.39)
+    assert black["total_material_eg"] == np.float32(-0.75)
+
+
+def test_read_eval():
+    read_fd, write_fd = os.pipe()
+    with open(read_fd) as stream:
+        p = SimpleNamespace(stdout=_TimedReader(stream, Stopwatch()))
+        # the total and the line after it arrive in separate writes
+        os.write(
+            write_fd,
+            b"       Total |  ----  ---- |  ----  ---- |  0.77  0.75 \n\nTotal eval",
+        )
+        os.write(write_fd, b"uation: 0.80 (white side)\n")
+        os.write(write_fd, b"\nTotal evaluation: none (in check)\nbestmove e2e4\n")
+        os.close(write_fd)
+
+        assert features.stockfish.read_eval(p) == [
+            "       Total |  ----  ---- |  ----  ---- |  0.77  0.75 \n",
+            "\n",
+            "Total evaluation: 0.80 (white side)\n",
+            "\n",
+        ]
+        assert features.stockfish.read_eval(p) == [
+            "Total evaluation: none (in check)\n"
+        ]
+        assert p.stdout.readline() == "bestmove e2e4\n"
+
+
+def test_stockfish_eval_from_df_fake_engine(fake_engine, monkeypatch):
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", fake_engine())
+    df = pd.DataFrame(
+        {
+            "fen": [
+                chess.STARTING_FEN,
+                "rnbqkbnr/ppppp1pp/8/5p1Q/4P3/8/PPPP1PPP/RNB1KBNR b KQkq - 1 2",
+            ]
+        }
+    )
+
+    feature_df = features.StockfishEval.from_df(df)
+
+    assert list(feature_df.columns) == features.StockfishEval.feature_names()
+    assert (feature_df.dtypes == np.float32).all()
+    assert feature_df.our_pawns_mg.tolist()[0] == 0
+    # in check
+    assert feature_df.iloc[1].isna().all()
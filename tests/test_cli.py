@@ -1,4 +1,8 @@
+import json
+import os
+
 import cli
+import features.stockfish
 from click.testing import CliRunner
 
 runner = CliRunner()
@@ -9,3 +13,42 @@ def test_csv():
         cli.csv, ["pgns/test.pgn", "Board", "Stockfish10", "BestMove"]
     )
     assert result.exit_code == 0
+
+
+def test_csv_timings(workdir):
+    timings_path = workdir / "timings.json"
+    result = runner.invoke(
+        cli.csv,
+        ["pgns/test.pgn", "Board", "--limit", "20", "--timings", str(timings_path)],
+    )
+    assert result.exit_code == 0
+
+    with open(timings_path) as fp:
+        timings = json.load(fp)
+    assert timings["rows"] == 20
+    assert set(timings["stages"]) == {"parse_pgn", "write_csv"}
+    assert [f["feature_class"] for f in timings["features"]] == ["Board"]
+    assert timings["features"][0]["engine_seconds"] == 0
+    assert timings["peak_rss_mb"] > 0
+    assert os.path.exists(workdir / "csvs" / "test_20.csv")
+
+
+def test_csv_timings_stdout(workdir):
+    result = runner.invoke(
+        cli.csv, ["pgns/test.pgn", "Board", "--limit", "20", "--timings", "-"]
+    )
+    assert result.exit_code == 0
+
+    # progress and cache statistics go to stderr, so stdout is the report only
+    assert json.loads(result.stdout)["rows"] == 20
+    assert "Position cache" in result.stderr
+
+
+def test_csv_fake_engine(fake_engine, monkeypatch, workdir):
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", fake_engine())
+    result = runner.invoke(
+        cli.csv,
+        ["pgns/test.pgn", "Stockfish10", "StockfishDepth", "--limit", "20"],
+    )
+    assert result.exit_code == 0
+    assert os.path.exists(workdir / "csvs" / "test_20.csv")
@@ -0,0 +1,114 @@
+import os
+
+import click
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+import cli
+import distributed
+import features
+import features.stockfish
+import utils
+from distributed import WorkQueue
+
+PGN_PATH = os.path.join(os.path.dirname(__file__), "..", "pgns", "test.pgn")
+
+
+def read_pgn(limit):
+    with open(PGN_PATH) as pgn:
+        return utils.pgn_to_df(pgn, limit)
+
+
+def test_work_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path))
+    df = pd.DataFrame({"game_id": list("aabccd"), "ply": range(6)})
+
+    assert queue.num_units is None
+    assert queue.put(df, ["Board"], 2) == 2
+    assert queue.num_units == 2
+    assert queue.units("todo") == ["00000.pkl", "00001.pkl"]
+
+    unit = queue.claim()
+    assert unit == "00000.pkl"
+    feature_names, unit_df = queue.load(unit)
+    assert feature_names == ["Board"]
+    assert unit_df.game_id.tolist() == list("aab")
+
+    # claims that are not touched go back to todo
+    assert queue.requeue_stale(lease=3600) == []
+    assert queue.requeue_stale(lease=0) == [unit]
+    assert queue.units("todo") == ["00000.pkl", "00001.pkl"]
+
+    while not queue.is_done():
+        unit = queue.claim()
+        _, unit_df = queue.load(unit)
+        queue.complete(unit, unit_df.reset_index(drop=True))
+
+    assert queue.units("claimed") == []
+    assert queue.merge().equals(df)
+
+
+def test_coordinate(fake_engine, monkeypatch, tmp_path):
+    monkeypatch.setattr(features.stockfish, "STOCKFISH_PATH", fake_engine())
+    df = read_pgn(40)
+    # split the plies into games of 8 plies
+    df["game_id"] = (df.index // 8).astype(str)
+    feature_names = ["Board", "Stockfish10"]
+
+    res = distributed.coordinate(
+        df, feature_names, str(tmp_path / "queue"), 2, workers=2, poll=0.05
+    )
+
+    expected = utils.add_features(
+        df, [getattr(features, name) for name in feature_names]
+    )
+    # columns that are all None in some shards are object columns after the merge
+    res = res.astype(expected.dtypes)
+    pd.testing.assert_frame_equal(
+        res.drop(columns="search_seconds"), expected.drop(columns="search_seconds")
+    )
+
+
+def test_coordinate_resumes_same_run_only(tmp_path):
+    queue_path = str(tmp_path / "queue")
+    df = pd.DataFrame({"game_id": list("aabccd"), "ply": range(6)})
+    queue = WorkQueue(queue_path)
+    queue.put(df, ["Board"], 2)
+    while not queue.is_done():
+        unit = queue.claim()
+        _, unit_df = queue.load(unit)
+        queue.complete(unit, unit_df.reset_index(drop=True))
+
+    assert distributed.coordinate(df, ["Board"], queue_path, 2).equals(df)
+
+    with pytest.raises(click.ClickException, match="features"):
+        distributed.coordinate(df, ["Board", "Move"], queue_path, 2)
+    with pytest.raises(click.ClickException, match="games_per_unit 2 instead of 3"):
+        distributed.coordinate(df, ["Board"], queue_path, 3)
+    with pytest.raises(click.ClickException, match="input"):
+        distributed.coordinate(df.assign(ply=df.ply + 1), ["Board"], queue_path, 2)
+
+
+def test_csv_queue(monkeypatch, workdir):
+    monkeypatch.setattr(distributed, "POLL_SECONDS", 0.05)
+
+    result = CliRunner().invoke(
+        cli.csv,
+        [
+            "pgns/test.pgn",
+            "Board",
+            "--limit",
+            "30",
+            "--queue",
+            "queue",
+            "--games-per-unit",
+            "1",
+            "--workers",
+            "2",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert len(pd.read_csv("csvs/test_30.csv")) == 30
+    assert len(os.listdir("queue/done")) == read_pgn(30).game_id.nunique()
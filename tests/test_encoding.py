@@ -0,0 +1,27 @@
+import chess
+
+import utils
+from board import encoding
+
+
+def test_encode_decode():
+    fens = [
+        chess.STARTING_FEN,
+        "rnbqkbnr/pppp1ppp/8/4pP2/8/8/PPPPP1PP/RNBQKBNR w KQkq e6 0 3",
+        "5bnq/4Prkn/5ppp/8/8/8/5PPP/5RK1 w - - 4 40",
+    ]
+    for fen in fens:
+        assert encoding.decode(encoding.encode_fen(fen)).fen() == fen
+
+    positions = encoding.from_bytes([encoding.encode_fen(fen) for fen in fens])
+    assert positions.dtype == encoding.POSITION_DTYPE
+    assert [encoding.to_board(position).fen() for position in positions] == fens
+
+
+def test_pgn_to_df_encode_positions():
+    with open("pgns/test.pgn") as pgn:
+        df = utils.pgn_to_df(pgn, 10, encode_positions=True)
+    positions = encoding.from_bytes(df.position)
+    assert [encoding.to_board(position).fen() for position in positions] == list(
+        df.fen
+    )
@@ -4,11 +4,15 @@ from ast import literal_eval
 import pytest
 import chess
 import chess.engine
+import chess.pgn
 import features
+import numpy as np
 import pandas as pd
-from board import Tactic, Threat, CheckmateType, PawnStructure
+from board import AugBoard, Tactic, Threat, CheckmateType, PawnStructure
+from board.pawns import LockedPawnsTracker, locked_pawns
+from board.structures import pawn_bitboards
 from features.helpers import square_from_name
-from features.board import GamePhase, PositionOpenness
+from features.board import GamePhase, GamePhaseTracker, PositionOpenness
 
 
 @pytest.mark.parametrize(
@@ -56,6 +60,23 @@ def test_pawn_structure(fen, expected):
     assert pawn_structures == expected
 
 
+def test_pawn_structure_classify_array():
+    fens = [
+        chess.STARTING_FEN,
+        "8/pp3ppp/2p1p3/8/3P4/8/PPP2PPP/8 w - - 0 1",
+        "8/pp3ppp/3p4/2p1p3/2P1P3/3P4/PP3PPP/8 w - - 0 1",
+    ]
+    white_pawns, black_pawns = zip(*[pawn_bitboards(fen) for fen in fens])
+    structures = PawnStructure.classify_array(
+        np.array(white_pawns, dtype=np.uint64), np.array(black_pawns, dtype=np.uint64)
+    )
+    assert structures.tolist() == [
+        PawnStructure.NONE,
+        PawnStructure.CARO,
+        PawnStructure.BOTVINNIK_SYSTEM,
+    ]
+
+
 @pytest.mark.parametrize(
     "fen, expected",
     [
@@ -82,6 +103,17 @@ def test_locked_pawns(fen, expected):
     assert locked_pawns == {square_from_name(square_name) for square_name in expected}
 
 
+def test_locked_pawns_tracker():
+    with open("pgns/test.pgn") as pgn:
+        game = chess.pgn.read_game(pgn)
+
+    tracker = LockedPawnsTracker()
+    board = game.board()
+    for move in game.mainline_moves():
+        assert tracker.locked_pawns(board) == locked_pawns(board)
+        board.push(move)
+
+
 @pytest.mark.parametrize(
     "fen, expected",
     [
@@ -159,6 +191,31 @@ def test_locked_pawns(fen, expected):
 def test_game_phase(fen, expected):
     phase = features.Board(fen).phase
     assert phase == expected
+    assert GamePhaseTracker(chess.Board(fen)).phase == expected
+
+
+def test_game_phase_tracker():
+    with open("pgns/test.pgn") as pgn:
+        game = chess.pgn.read_game(pgn)
+
+    board = game.board()
+    tracker = GamePhaseTracker(board)
+    for move in game.mainline_moves():
+        tracker.push(board, move)
+        assert tracker.phase == features.Board(board.fen()).phase
+
+
+def test_game_to_rows_track_phase():
+    import utils
+
+    with open("pgns/test.pgn") as pgn:
+        game = chess.pgn.read_game(pgn)
+
+    assert "phase" not in utils.game_to_rows(game)[0]
+    for row in utils.game_to_rows(game, track_phase=True):
+        board_features = features.Board(row["fen"])
+        assert row["phase"] == board_features.phase
+        assert row["position_openness"] == board_features.position_openness
 
 
 @pytest.mark.parametrize(
@@ -1016,6 +1073,103 @@ def test_from_df():
         feature_df = feature_class.from_df(df)
 
 
+def test_from_df_position_cache(tmp_path):
+    from features import abstract
+
+    abstract.position_cache.clear()
+    df = pd.DataFrame([{"fen": chess.STARTING_FEN}, {"fen": chess.STARTING_FEN}])
+    feature_df = features.Board.from_df(df)
+    assert (abstract.position_cache.hits, abstract.position_cache.misses) == (1, 1)
+    assert feature_df.iloc[0].equals(feature_df.iloc[1])
+
+    path = tmp_path / "positions.pkl"
+    abstract.position_cache.save(path)
+    cache = abstract.PositionCache.load(path, maxsize=1)
+    assert len(cache) == 1
+
+
+def test_position_cache_size():
+    from features.abstract import PositionCache
+
+    cache = PositionCache(maxsize=2)
+    for i in range(3):
+        cache.put(i, i)
+    assert len(cache) == 2
+    assert cache.get(0) is None
+
+    cache.resize(1)
+    assert len(cache) == 1
+    assert cache.get(2) == 2
+
+    cache.resize(0)
+    cache.put(3, 3)
+    assert len(cache) == 0
+    assert cache.get(3) is None
+
+
+def test_position_keys():
+    from features import abstract
+    from features.pawns import Pawns
+
+    abstract.position_cache.clear()
+    # the same position and move reached at different move numbers
+    fens = [chess.STARTING_FEN, chess.STARTING_FEN.replace(" 1", " 9")]
+    df = pd.DataFrame(
+        {
+            "fen": fens,
+            "move": ["e2e4", "e2e4"],
+            "prev_fen": [None, fens[0]],
+            "prev_move": [None, "g1f3"],
+        }
+    )
+
+    pawns_df = Pawns.from_df(df)
+    user_move_df = features.UserMove.from_df(df)
+    assert (abstract.position_cache.hits, abstract.position_cache.misses) == (2, 2)
+    assert pawns_df.iloc[0].equals(pawns_df.iloc[1])
+    assert user_move_df.iloc[0].equals(user_move_df.iloc[1])
+
+    row = next(df.assign(best_move="d2d4").itertuples())
+    # rows without a previous move are not cached
+    assert features.PrevMove.position_key(row) is None
+    assert features.UserMove.position_key(row) != features.BestMove.position_key(row)
+
+
+def test_checkmate_from_df_only_mates():
+    fen = "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 4 4"
+    df = pd.DataFrame(
+        [
+            {"fen": fen, "best_pv": "['f3f7']", "best_mate": 1},
+            {"fen": fen, "best_pv": "['b1c3']", "best_mate": None},
+        ],
+        index=[5, 7],
+    )
+    feature_df = features.Checkmate.from_df(df)
+    assert list(feature_df.index) == [5, 7]
+    assert feature_df.loc[5, "checkmate_piece_type"] == chess.QUEEN
+    assert feature_df.loc[5, "num_our_pieces_attacking_their_king_ring"] == 2
+    assert feature_df.loc[7].isnull().all()
+
+
+def test_detector_profiler():
+    from board.profiling import profiler
+
+    fen = "8/pp3ppp/2p1p3/8/3P4/8/PPP2PPP/8 w - - 0 1"
+    profiler.reset()
+    profiler.enable()
+    try:
+        assert AugBoard(fen).pawn_structure() == PawnStructure.CARO
+        AugBoard(chess.STARTING_FEN).pv_tactics([chess.Move.from_uci("e2e4")])
+    finally:
+        profiler.disable()
+
+    report = profiler.report()
+    assert report.loc["PawnStructure.classify", "calls"] == 1
+    assert report.loc["PawnStructure.classify", "hits"] == 1
+    assert report.loc["Tactic.FORK", "calls"] == 1
+    assert Tactic.detectors()[Tactic.FORK] is Tactic.detector(Tactic.FORK)
+
+
 def test_features_list():
     df = pd.DataFrame(
         [
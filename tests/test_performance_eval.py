@@ -0,0 +1,46 @@
+from features.performance_eval import evaluate, tag_to_tactic
+from features.performance_eval.add_analysis import (
+    AsyncPuzzleProcessor,
+    PuzzleProcessor,
+)
+
+PUZZLES = [
+    {
+        "fen": "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+        "analysis": {"pv": ["d1d8"]},
+        "tags": ["BackrankMate"],
+    },
+    {
+        "fen": "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+        "analysis": {"pv": ["f3f7"]},
+        "tags": ["BackrankMate"],
+    },
+] * 5
+
+for puzzle in PUZZLES:
+    puzzle["tactics"] = {tag_to_tactic(tag) for tag in puzzle["tags"]}
+
+
+def test_evaluate_shards():
+    serial = list(evaluate(PUZZLES, num_examples=1))[-1]
+    sharded = list(evaluate(PUZZLES, num_examples=1, workers=2, shard_size=3))[-1]
+
+    assert serial.num_puzzles == sharded.num_puzzles == 10
+    assert serial.counts == sharded.counts
+    assert serial.counts["BackrankMate"][0] == {"tp": 5, "fp": 0, "fn": 5, "tn": 0}
+    assert serial.precision("BackrankMate", 0) == 1.0
+    assert serial.recall("BackrankMate", 0) == 0.5
+    assert len(sharded.examples["BackrankMate"][0]["tp"]) == 1
+
+
+def test_async_puzzle_processor(fake_engine):
+    path = fake_engine(latency=0.01)
+    serial = list(PuzzleProcessor(2, path).process_puzzles(PUZZLES))
+    pooled = list(
+        AsyncPuzzleProcessor(2, [path], num_engines=3, max_pending=4).process_puzzles(
+            PUZZLES
+        )
+    )
+
+    assert pooled == serial
+    assert serial[0] == {"depth": 2, "score": None, "mate_score": 1, "pv": ["d1d8"]}
@@ -0,0 +1,30 @@
+import json
+
+from features.performance_eval.puzzles import read_puzzles, write_puzzles
+
+PUZZLES = [
+    {"fen": "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", "tags": ["BackrankMate"]},
+    {"fen": "8/8/8/8/8/5k2/8/5K2 w - - 0 1", "tags": []},
+]
+
+
+def test_write_read_puzzles(tmp_path):
+    path = tmp_path / "puzzles.jsonl"
+    assert write_puzzles(iter(PUZZLES), path) == 2
+    assert list(read_puzzles(path)) == PUZZLES
+    assert list(read_puzzles(path, limit=1)) == PUZZLES[:1]
+
+
+def test_read_puzzles_partial_file(tmp_path):
+    path = tmp_path / "puzzles.jsonl"
+    write_puzzles(PUZZLES, path)
+    with open(path, "a") as fp:
+        fp.write('{"fen": "8/8')
+    assert list(read_puzzles(path)) == PUZZLES
+
+
+def test_read_puzzles_json_list(tmp_path):
+    path = tmp_path / "puzzles.json"
+    with open(path, "w") as fp:
+        json.dump(PUZZLES, fp)
+    assert list(read_puzzles(path)) == PUZZLES
@@ -1,10 +1,18 @@
 import math
+import resource
+import sys
+import time
 import click
 import chess
 import chess.pgn
 import datetime
 import pandas as pd
 
+from board import encoding
+from board.pawns import LockedPawnsTracker
+from features.board import GamePhaseTracker, position_openness
+from features.engine import ENGINE_STOPWATCH
+
 
 def metrics(score, prev_score, turn):
     if prev_score is None:
@@ -89,13 +97,22 @@ def winning_chances(score, prev_score, turn):
     }
 
 
-def game_to_rows(game):
+def game_to_rows(game, encode_positions=False, track_phase=False):
+    """
+    With encode_positions the rows also carry the fixed size binary encodings (see board.encoding) of fen and
+    prev_fen in the position and prev_position columns. With track_phase they carry the phase and
+    position_openness of Board, tracked incrementally along the game.
+    """
     rows = []
     prev_fen = None
+    prev_position = None
     prev_move = None
     prev_score = chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE)
     prev_move_evaluation_type = None
     board = chess.Board()
+    if track_phase:
+        locked_pawns = LockedPawnsTracker()
+        phase = GamePhaseTracker(board)
     for node in game.mainline():
         username = game.headers["White"] if board.turn else game.headers["Black"]
         elo = game.headers["WhiteElo"] if board.turn else game.headers["BlackElo"]
@@ -141,23 +158,38 @@ def game_to_rows(game):
             "won": won,
         }
 
+        if track_phase:
+            row["position_openness"] = position_openness(
+                locked_pawns.locked_pawns(board), board.pawns
+            )
+            row["phase"] = phase.phase
+
+        if encode_positions:
+            row["position"] = encoding.encode(board)
+            row["prev_position"] = prev_position
+
         row.update(winning_chances(score, prev_score, board.turn))
         row.update(metrics(score, prev_score, board.turn))
         rows.append(row)
-        board.push(move)
+        if track_phase:
+            phase.push(board, move)
+        else:
+            board.push(move)
 
         prev_fen = board.fen()
+        if encode_positions:
+            prev_position = encoding.encode(board)
         prev_move = move.uci()
         prev_score = score
-        prev_move_evaluation_type = row['move_evaluation_type']
+        prev_move_evaluation_type = row["move_evaluation_type"]
 
     return rows
 
 
-def pgn_to_df(pgn, limit):
+def pgn_to_df(pgn, limit, encode_positions=False, track_phase=False):
     rows = []
 
-    with click.progressbar(length=limit, label="Parsing pgn") as bar:
+    with click.progressbar(length=limit, label="Parsing pgn", file=sys.stderr) as bar:
         while True:
             game = chess.pgn.read_game(pgn)
             if game is None:
@@ -176,7 +208,7 @@ def pgn_to_df(pgn, limit):
             if game.headers["BlackElo"] == "?":
                 continue
 
-            rows.extend(game_to_rows(game))
+            rows.extend(game_to_rows(game, encode_positions, track_phase))
 
             if limit and len(rows) >= limit:
                 return pd.DataFrame(rows)[:limit]
@@ -186,9 +218,36 @@ def pgn_to_df(pgn, limit):
     return pd.DataFrame(rows)
 
 
-def add_features(df, feature_classes):
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def add_features(df, feature_classes, timings=None):
+    """
+    Joins the features of each feature class to df. If timings is given, the total, engine and Python time of
+    each feature class is appended to it.
+    """
     for feature_class in feature_classes:
+        start = time.perf_counter()
+        engine_seconds = ENGINE_STOPWATCH.seconds
         feature_df = feature_class.from_df(df)
+        if timings is not None:
+            seconds = time.perf_counter() - start
+            engine_seconds = ENGINE_STOPWATCH.seconds - engine_seconds
+            timings.append(
+                {
+                    "feature_class": feature_class.__name__,
+                    "seconds": seconds,
+                    "engine_seconds": engine_seconds,
+                    "python_seconds": seconds - engine_seconds,
+                    "rows_per_second": len(df) / seconds if seconds else None,
+                }
+            )
 
         # drop overlapping cols
         left = set(df.columns)